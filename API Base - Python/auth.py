@@ -1,13 +1,21 @@
+import logging
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, HTTPBearer, HTTPAuthorizationCredentials
 from jose import JWTError, jwt
 from pydantic import BaseModel
 from passlib.context import CryptContext
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from database import User, SessionLocal
+from database import User, AsyncSessionLocal
+import cache_usuarios
+from executor_senhas import executor_senhas
+from log_config import AMOSTRAR
+
+logger = logging.getLogger(__name__)
 
 # Configurações do JWT
 SECRET_KEY = "milton_project_2023_secret_key"
@@ -61,6 +69,19 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
         except Exception:
             return False
 
+# Função para verificar a senha e atualizar hashes obsoletos
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verifica a senha e, se o hash armazenado usar um esquema ou parâmetros
+    obsoletos (ex.: bcrypt antigo), retorna também o hash novo a ser gravado.
+    """
+    if not plain_password or not hashed_password:
+        return False, None
+    try:
+        return pwd_context.verify_and_update(plain_password, hashed_password)
+    except Exception:
+        return verify_password(plain_password, hashed_password), None
+
 # Função para criar hash da senha
 def get_password_hash(password: str) -> str:
     """Cria um hash da senha fornecida."""
@@ -74,7 +95,7 @@ def get_password_hash(password: str) -> str:
             from passlib.hash import bcrypt_sha256
             return bcrypt_sha256.hash(password)
         except Exception as fallback_e:
-            print(f"Erro ao criar hash da senha: {e} | fallback error: {fallback_e}")
+            logger.error("Erro ao criar hash da senha: %s | fallback error: %s", e, fallback_e)
             raise
 
 # Função para autenticar usuário
@@ -87,11 +108,39 @@ def authenticate_user(db: Session, username: str, password: str):
         return False
     return user
 
+# Versões para rotas async: o hash roda no executor de senhas, fora do event loop
+async def get_password_hash_async(password: str) -> str:
+    """Cria o hash da senha no executor de senhas."""
+    return await executor_senhas.executar(get_password_hash, password)
+
+async def authenticate_user_async(db: AsyncSession, username: str, password: str):
+    """
+    Autentica o usuário verificando a senha no executor de senhas. Se o hash
+    armazenado estiver obsoleto, grava o hash no esquema atual.
+    Levanta FilaDeHashCheia se o executor estiver sobrecarregado.
+    """
+    user = await db.scalar(select(User).where(User.username == username))
+    if not user:
+        return False
+    # Devolve a conexão ao pool enquanto o hash é calculado; sem isso, logins
+    # aguardando na fila do executor esgotam as conexões do banco
+    db.expunge(user)
+    await db.rollback()
+    ok, novo_hash = await executor_senhas.executar(
+        verify_and_update_password, password, user.hashed_password
+    )
+    if not ok:
+        return False
+    if novo_hash:
+        await db.execute(
+            update(User).where(User.id == user.id).values(hashed_password=novo_hash)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+    return user
+
 # Função para criar token de acesso
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
-    print("\n===== CRIAÇÃO DE TOKEN =====")
-    print(f"DEBUG: Dados iniciais do token: {data}")
-    
     # Cria uma cópia dos dados para não modificar o dicionário original
     to_encode = data.copy()
     
@@ -108,18 +157,14 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     # Adiciona o tempo de expiração ao payload (deve ser timestamp, não datetime)
     to_encode.update({"exp": expire_timestamp, "iat": iat_timestamp})
     
-    print(f"DEBUG: Payload final do token: {to_encode}")
-    print(f"DEBUG: Chave secreta: {SECRET_KEY}")
-    print(f"DEBUG: Algoritmo: {ALGORITHM}")
+    logger.debug("Criando token para %s (exp=%s)", to_encode.get("sub"), expire_timestamp)
     
     try:
         # Gera o token JWT
         encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-        print(f"DEBUG: Token gerado: {encoded_jwt}")
-        print("===== FIM DA CRIAÇÃO DE TOKEN =====\n")
         return encoded_jwt
     except Exception as e:
-        print(f"ERRO ao gerar token: {e}")
+        logger.exception("Erro ao gerar token")
         raise
 
 # Função para obter o usuário atual a partir do token
@@ -130,8 +175,6 @@ async def get_current_user(
     Extrai e valida o token JWT da requisição.
     O token deve estar no header: Authorization: Bearer <token>
     """
-    print("\n===== INÍCIO DA VALIDAÇÃO DO TOKEN =====")
-    
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Não foi possível validar as credenciais. Por favor, faça login novamente.",
@@ -139,104 +182,72 @@ async def get_current_user(
     )
     
     if not credentials:
-        print("ERRO: Nenhum token fornecido")
+        logger.debug("Requisição sem token")
         raise credentials_exception
     
     # Extrai o token das credenciais e remove aspas extras se houver
     token = credentials.credentials
     # Remove aspas duplas e simples do início e fim
     token = token.strip('"').strip("'")
-    print(f"DEBUG: Token recebido: {token[:20]}... (comprimento: {len(token)} caracteres)")
+    
+    # Token já verificado recentemente: dispensa a decodificação e o banco
+    user = cache_usuarios.cache.obter(token)
+    if user is not None:
+        return user
+    
+    logger.debug("Validando token (%d caracteres)", len(token), extra=AMOSTRAR)
     
     try:
-        
-        # Verifica se o token tem o formato correto
-        parts = token.split('.')
-        if len(parts) != 3:
-            print(f"ERRO: Formato de token inválido. Partes encontradas: {len(parts)}")
-            raise credentials_exception
-        
-        # Tenta decodificar o payload para debug
-        try:
-            import base64
-            import json
-            
-            # Decodifica o payload (parte do meio)
-            payload_encoded = parts[1]
-            # Adiciona padding se necessário
-            padding = len(payload_encoded) % 4
-            if padding:
-                payload_encoded += '=' * (4 - padding)
-            
-            payload_decoded = base64.urlsafe_b64decode(payload_encoded)
-            payload_data = json.loads(payload_decoded)
-            print(f"DEBUG: Conteúdo do token: {payload_data}")
-            
-            # Verifica se o token tem um campo 'sub' (subject/usuário)
-            if 'sub' not in payload_data:
-                print("ERRO: Token não contém 'sub' (usuário)")
-                raise credentials_exception
-                
-        except Exception as e:
-            print(f"AVISO: Não foi possível decodificar o payload do token: {e}")
-        
         # Tenta decodificar o token com verificação
         try:
-            print("DEBUG: Tentando decodificar o token com a chave secreta...")
             payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-            print("DEBUG: Token decodificado com sucesso!")
             
             username: str = payload.get("sub")
             if not username:
-                print("ERRO: Nenhum username encontrado no token após decodificação")
+                logger.warning("Token sem usuário (sub) após decodificação")
                 raise credentials_exception
             
-            print(f"DEBUG: Usuário do token: {username}")
             
             # Obtém o usuário do banco de dados
-            db = SessionLocal()
+            db = AsyncSessionLocal()
             try:
-                print(f"DEBUG: Buscando usuário '{username}' no banco de dados...")
-                user = db.query(User).filter(User.username == username).first()
+                user = await db.scalar(select(User).where(User.username == username))
                 
                 if user is None:
-                    print(f"ERRO: Usuário '{username}' não encontrado no banco de dados")
+                    logger.warning("Usuário %r do token não encontrado", username)
                     raise credentials_exception
                 
                 # Verifica se o token está expirado
                 expire = payload.get("exp")
                 if not expire:
-                    print("ERRO: Token não contém data de expiração")
+                    logger.warning("Token sem data de expiração")
                     raise credentials_exception
                 
                 expire_dt = datetime.fromtimestamp(expire)
                 now = datetime.utcnow()
                 
-                print(f"DEBUG: Token expira em: {expire_dt} (UTC)")
-                print(f"DEBUG: Hora atual: {now} (UTC)")
-                
                 if now > expire_dt:
-                    print("ERRO: Token expirado")
+                    logger.info("Token expirado para o usuário %r", username)
                     raise HTTPException(
                         status_code=status.HTTP_401_UNAUTHORIZED,
                         detail="Sessão expirada. Por favor, faça login novamente.",
                         headers={"WWW-Authenticate": "Bearer"},
                     )
                 
-                print("DEBUG: Token válido e não expirado")
-                print(f"DEBUG: Autenticação bem-sucedida para o usuário: {user.username}")
-                print("===== FIM DA VALIDAÇÃO DO TOKEN =====\n")
+                logger.debug("Token válido para o usuário %r", user.username, extra=AMOSTRAR)
+                cache_usuarios.cache.guardar(token, user, expire)
                 return user
                 
             except Exception as e:
-                print(f"ERRO ao acessar o banco de dados: {e}")
+                if not isinstance(e, HTTPException):
+                    logger.exception("Erro ao acessar o banco de dados")
                 raise credentials_exception
                 
             finally:
-                db.close()
+                await db.close()
                 
         except jwt.ExpiredSignatureError:
-            print("ERRO: Token expirado (ExpiredSignatureError)")
+            logger.info("Token expirado (ExpiredSignatureError)")
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Sessão expirada. Por favor, faça login novamente.",
@@ -244,9 +255,7 @@ async def get_current_user(
             )
             
         except JWTError as e:
-            print(f"ERRO ao decodificar token (JWTError): {e}")
-            print(f"DEBUG: SECRET_KEY sendo usada: {SECRET_KEY}")
-            print(f"DEBUG: ALGORITMO sendo usado: {ALGORITHM}")
+            logger.warning("Token inválido (JWTError): %s", e)
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Token inválido. Por favor, faça login novamente.",
@@ -254,9 +263,8 @@ async def get_current_user(
             )
             
     except Exception as e:
-        print(f"ERRO inesperado durante a validação do token: {e}")
-        import traceback
-        print("Traceback:", traceback.format_exc())
+        if not isinstance(e, HTTPException):
+            logger.exception("Erro inesperado durante a validação do token")
         raise credentials_exception
 
 # Função para verificar se o usuário está ativo
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Benchmark de concorrência das rotas de contatos: Session síncrona dentro de
+rotas async (como as rotas eram) x AsyncSession (dependencies.get_async_db).
+
+Usa um banco SQLite temporário com CONTATOS contatos, ou o banco de
+BENCH_DATABASE_URL (as tabelas são APAGADAS e recriadas). Para cada número de
+clientes simultâneos, mede por DURACAO segundos a vazão e a latência de uma
+mistura de requisições, três leituras rápidas para cada consulta lenta:
+- lenta: GET /contacts/export/csv?search=... sem resultado (a verificação de
+  existência percorre a tabela inteira e responde 404);
+- rápida: GET /contacts/{id}.
+
+Modos:
+- síncrono: as mesmas duas rotas como eram, async def com a Session de get_db
+  (a consulta roda no event loop e segura todas as outras requisições);
+- assíncrono: as rotas atuais de routes/contacts.py.
+
+No modo síncrono, com mais clientes que o pool de conexões (DB_POOL_TAMANHO +
+DB_POOL_EXCEDENTE), a espera por uma conexão livre também bloqueia o event
+loop, e as conexões só voltariam ao pool pelo próprio loop: a requisição
+espera DB_POOL_ESPERA_SEGUNDOS (5 s aqui) e falha. Essas falhas aparecem na
+coluna "erros".
+
+A vazão só cresce com os clientes enquanto o processo da API espera pelo
+banco: com o banco em outro host (latência de rede) ou com mais de um núcleo
+(o aiosqlite executa cada conexão em uma thread que libera o GIL). Com
+BENCH_LATENCIA_MS, um banco acessado por TCP (PostgreSQL) passa por um proxy
+local que atrasa cada mensagem nesse tanto em cada sentido, como um banco em
+outro host.
+
+Uso:
+    python benchmark_async_db.py [duracao_segundos] [clientes,...]
+    BENCH_DATABASE_URL=postgresql://... python benchmark_async_db.py
+    BENCH_DATABASE_URL=postgresql://... BENCH_LATENCIA_MS=1 python benchmark_async_db.py
+"""
+import asyncio
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy.engine import make_url
+
+LATENCIA = float(os.getenv("BENCH_LATENCIA_MS", "0")) / 1000
+
+
+def proxy_com_latencia(host: str, porta: int, atraso: float, fila):
+    """Processo do proxy TCP: repassa cada mensagem ao outro lado após `atraso` segundos."""
+
+    async def repassar(leitor, escritor):
+        try:
+            while dados := await leitor.read(65536):
+                await asyncio.sleep(atraso)
+                escritor.write(dados)
+                await escritor.drain()
+        finally:
+            escritor.close()
+
+    async def conectar(leitor_cliente, escritor_cliente):
+        leitor_banco, escritor_banco = await asyncio.open_connection(host, porta)
+        await asyncio.gather(repassar(leitor_cliente, escritor_banco), repassar(leitor_banco, escritor_cliente))
+
+    async def servir():
+        servidor = await asyncio.start_server(conectar, "127.0.0.1", 0)
+        fila.put(servidor.sockets[0].getsockname()[1])
+        await servidor.serve_forever()
+
+    asyncio.run(servir())
+
+
+# O banco precisa estar definido antes de importar database
+if os.getenv("BENCH_DATABASE_URL"):
+    os.environ["DATABASE_URL"] = os.environ["BENCH_DATABASE_URL"]
+    if LATENCIA and __name__ == "__main__":
+        url = make_url(os.environ["DATABASE_URL"])
+        fila = multiprocessing.Queue()
+        multiprocessing.Process(
+            target=proxy_com_latencia, args=(url.host or "127.0.0.1", url.port or 5432, LATENCIA, fila), daemon=True
+        ).start()
+        os.environ["DATABASE_URL"] = url.set(host="127.0.0.1", port=fila.get()).render_as_string(hide_password=False)
+else:
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+os.environ.setdefault("DB_POOL_ESPERA_SEGUNDOS", "5")
+
+import httpx
+from fastapi import APIRouter, Depends, FastAPI, HTTPException
+from sqlalchemy.orm import Session
+
+from auth import get_current_active_user
+from database import Base, Contact, User, async_engine, engine
+from dependencies import get_db
+from models import Contact as PydanticContact
+from routes import contacts
+from service.exportacao_contatos import filtrar_contatos
+
+DURACAO = float(sys.argv[1]) if len(sys.argv) > 1 else 10.0
+CLIENTES = [int(n) for n in sys.argv[2].split(",")] if len(sys.argv) > 2 else [1, 4, 16, 64]
+CONTATOS = int(os.getenv("BENCH_CONTATOS", "100000"))
+BUSCA = "nao-existe"
+
+# Rotas como eram antes das sessões assíncronas
+rotas_antigas = APIRouter(prefix="/contacts")
+
+
+@rotas_antigas.get("/export/csv")
+async def export_contacts_antigo(search: str, db: Session = Depends(get_db)):
+    existe = filtrar_contatos(db.query(Contact.id), None, None, search).first()
+    if existe is None:
+        raise HTTPException(status_code=404, detail="Nenhum contato encontrado com os filtros fornecidos.")
+
+
+@rotas_antigas.get("/{contact_id}", response_model=PydanticContact)
+async def read_contact_antigo(contact_id: int, db: Session = Depends(get_db)):
+    contact = db.query(Contact).filter(Contact.id == contact_id).first()
+    if not contact:
+        raise HTTPException(status_code=404, detail="Contato não encontrado.")
+    return contact
+
+
+app = FastAPI()
+app.include_router(rotas_antigas, prefix="/sincrono")
+app.include_router(contacts.router, prefix="/assincrono")
+app.dependency_overrides[get_current_active_user] = lambda: User(id=1, username="benchmark", disabled=False)
+
+
+def popular():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(
+            Contact.__table__.insert(),
+            [
+                {"name": f"Contato {i}", "email": f"contato{i}@teste.com", "phone": f"1199{i:07d}", "canalPref": "email"}
+                for i in range(1, CONTATOS + 1)
+            ],
+        )
+
+
+async def cliente(http: httpx.AsyncClient, modo: str, indice: int, fim: float, latencias: dict, erros: list):
+    i = indice
+    while time.perf_counter() < fim:
+        i += 1
+        if i % 4 == 0:
+            tipo, url = "lenta", f"/{modo}/contacts/export/csv?search={BUSCA}"
+        else:
+            tipo, url = "rapida", f"/{modo}/contacts/{i % CONTATOS + 1}"
+        inicio = time.perf_counter()
+        resposta = await http.get(url)
+        if resposta.status_code not in (200, 404):
+            erros.append(resposta.status_code)
+            continue
+        latencias[tipo].append(time.perf_counter() - inicio)
+
+
+async def medir(http: httpx.AsyncClient, modo: str, clientes: int) -> dict:
+    latencias = {"lenta": [], "rapida": []}
+    erros = []
+    inicio = time.perf_counter()
+    await asyncio.gather(*(cliente(http, modo, n, inicio + DURACAO, latencias, erros) for n in range(clientes)))
+    # Uma requisição presa pode terminar bem depois do fim previsto
+    duracao = time.perf_counter() - inicio
+    rapidas = sorted(latencias["rapida"])
+    return {
+        "req_s": (len(rapidas) + len(latencias["lenta"])) / duracao,
+        "erros": len(erros),
+        "p50_ms": rapidas[len(rapidas) // 2] * 1000 if rapidas else float("nan"),
+        "p99_ms": rapidas[int(len(rapidas) * 0.99)] * 1000 if rapidas else float("nan"),
+    }
+
+
+async def aquecer(http: httpx.AsyncClient, modo: str):
+    await http.get(f"/{modo}/contacts/export/csv?search={BUSCA}")
+    await http.get(f"/{modo}/contacts/1")
+
+
+async def principal():
+    # Erros da aplicação viram respostas 500, contadas em "erros"
+    transporte = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://benchmark", timeout=None) as http:
+        # Abre as conexões e carrega a tabela no cache do banco
+        for modo in ("sincrono", "assincrono"):
+            await aquecer(http, modo)
+        print(f"{'clientes':<10}{'modo':<12}{'req/s':>8}{'p50 rápida (ms)':>17}{'p99 rápida (ms)':>17}{'erros':>7}")
+        for clientes in CLIENTES:
+            for modo in ("sincrono", "assincrono"):
+                r = await medir(http, modo, clientes)
+                print(f"{clientes:<10}{modo:<12}{r['req_s']:>8.0f}{r['p50_ms']:>17.1f}{r['p99_ms']:>17.1f}{r['erros']:>7}",
+                      flush=True)
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    popular()
+    print(f"{CONTATOS} contatos, {DURACAO:.0f}s por medição, banco {engine.dialect.name}, "
+          f"latência adicionada {LATENCIA * 1000:.1f} ms por sentido\n")
+    asyncio.run(principal())
+    engine.dispose()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark da cadeia de dependências de autenticação
+(get_current_user -> get_current_active_user).
+
+Compara o caminho sem cache (decodificação do JWT + sessão + SELECT do
+usuário a cada requisição) com o caminho com o cache de usuários
+(cache_usuarios). Usa um banco SQLite temporário com um único usuário.
+
+Uso:
+    python benchmark_auth.py [requisicoes]
+"""
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+from fastapi.security import HTTPAuthorizationCredentials
+from sqlalchemy import create_engine
+
+import cache_usuarios
+from auth import create_access_token, get_current_active_user, get_current_user
+from database import AsyncSessionLocal, Base, SessionLocal, User, criar_engine_assincrono
+
+REQUISICOES = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+
+async def cadeia(credenciais) -> User:
+    return await get_current_active_user(await get_current_user(credenciais))
+
+
+async def medir(credenciais, requisicoes: int, com_cache: bool) -> float:
+    """Retorna o tempo médio por requisição, em microssegundos."""
+    cache_usuarios.cache.limpar()
+    await cadeia(credenciais)  # aquece o cache
+    # O caminho sem cache imprime o log de depuração; descarta a saída
+    with contextlib.redirect_stdout(io.StringIO()):
+        inicio = time.perf_counter()
+        for _ in range(requisicoes):
+            if not com_cache:
+                cache_usuarios.cache.limpar()
+            await cadeia(credenciais)
+        duracao = time.perf_counter() - inicio
+    return duracao / requisicoes * 1e6
+
+
+async def comparar(url: str, credenciais, requisicoes: int):
+    # O get_current_user consulta o usuário pela sessão assíncrona
+    engine_assincrono = criar_engine_assincrono(url)
+    AsyncSessionLocal.configure(bind=engine_assincrono)
+    try:
+        sem_cache = await medir(credenciais, requisicoes, com_cache=False)
+        com_cache = await medir(credenciais, requisicoes, com_cache=True)
+    finally:
+        await engine_assincrono.dispose()
+    return sem_cache, com_cache
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as diretorio:
+        url = f"sqlite:///{os.path.join(diretorio, 'auth.db')}"
+        engine = create_engine(url)
+        Base.metadata.create_all(bind=engine)
+        SessionLocal.configure(bind=engine)
+
+        db = SessionLocal()
+        db.add(User(username="benchmark", email="benchmark@teste.com", hashed_password="x"))
+        db.commit()
+        db.close()
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            token = create_access_token({"sub": "benchmark"}, expires_delta=timedelta(hours=1))
+        credenciais = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+        sem_cache, com_cache = asyncio.run(comparar(url, credenciais, REQUISICOES))
+        engine.dispose()
+
+    print(f"{REQUISICOES} requisições autenticadas\n")
+    print(f"{'caminho':<12}{'µs/requisição':>16}")
+    print(f"{'sem cache':<12}{sem_cache:>16.1f}")
+    print(f"{'com cache':<12}{com_cache:>16.1f}")
+    print(f"\nganho: {sem_cache / com_cache:.0f}x")
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Benchmark do despachante concorrente contra um canal falso e lento.
+
+Simula um lote de mensagens agendadas cujo envio leva LATENCIA_MS (o tempo de
+um round-trip SMTP/Twilio) e mede mensagens/segundo para diferentes números de
+workers por canal. Não acessa rede nem banco de dados.
+
+Uso:
+    python benchmark_despacho.py [quantidade] [latencia_ms]
+"""
+import sys
+import time
+from types import SimpleNamespace
+
+from service.despachante import DespachanteConcorrente
+
+QUANTIDADE = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+LATENCIA_MS = float(sys.argv[2]) if len(sys.argv) > 2 else 50.0
+WORKERS = [1, 2, 4, 8, 16]
+
+
+class MensagemServiceLento:
+    """Substitui o MensagemService: cada envio apenas espera LATENCIA_MS."""
+
+    def enviar_mensagem(self, canal, destinatario, conteudo, assunto=None):
+        time.sleep(LATENCIA_MS / 1000)
+        return (True, None)
+
+
+def enviar(mensagem, mensagem_service):
+    return mensagem_service.enviar_mensagem(
+        mensagem.canal, mensagem.destinatario, mensagem.conteudo, mensagem.assunto
+    )
+
+
+def medir(workers: int, lote: list) -> float:
+    despachante = DespachanteConcorrente(
+        limites={"email": workers, "whatsapp": workers},
+        fabrica_servico=MensagemServiceLento,
+    )
+    try:
+        inicio = time.perf_counter()
+        resultados = despachante.despachar(lote, enviar)
+        duracao = time.perf_counter() - inicio
+    finally:
+        despachante.encerrar()
+    assert all(ok for ok, _ in resultados)
+    return len(lote) / duracao
+
+
+if __name__ == "__main__":
+    lote = [
+        SimpleNamespace(
+            id=i,
+            canal="email" if i % 2 else "whatsapp",
+            destinatario=f"contato{i}@teste.com",
+            conteudo="Mensagem de teste",
+            assunto="Benchmark",
+        )
+        for i in range(QUANTIDADE)
+    ]
+
+    print("=" * 60)
+    print(f"DESPACHO CONCORRENTE: {QUANTIDADE} mensagens, {LATENCIA_MS:.0f} ms por envio")
+    print("=" * 60)
+    base = None
+    for workers in WORKERS:
+        taxa = medir(workers, lote)
+        base = base or taxa
+        print(f"  {workers:>2} worker(s)/canal: {taxa:8.1f} msg/s  ({taxa / base:4.1f}x)")
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Benchmark offline de envio de emails: uma sessão SMTP por mensagem versus
+sessões reaproveitadas (pool) e envio em lote pela mesma sessão.
+
+Sobe o servidor_smtp_local em uma porta livre, que simula o custo da conexão
+(TCP + STARTTLS) e do login, e envia o mesmo conjunto de mensagens das três
+formas, uma thread só.
+
+Uso:
+    python benchmark_smtp.py [quantidade]
+"""
+import smtplib
+import sys
+import time
+from email.mime.text import MIMEText
+
+from servidor_smtp_local import ServidorSMTPLocal
+from service.email_channel import EmailChannel
+from service.smtp_pool import ConfiguracaoSMTP, PoolSMTP
+
+QUANTIDADE = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+
+
+def sessao_por_mensagem(config: ConfiguracaoSMTP, mensagens: list):
+    """Comportamento anterior do EmailChannel: conecta e autentica a cada envio."""
+    for destinatario, assunto, conteudo in mensagens:
+        msg_obj = MIMEText(conteudo, "plain", "utf-8")
+        msg_obj["Subject"] = assunto
+        msg_obj["From"] = config.usuario
+        msg_obj["To"] = destinatario
+        with smtplib.SMTP(config.host, config.port, timeout=config.timeout) as server:
+            server.login(config.usuario, config.senha)
+            server.send_message(msg_obj)
+
+
+def sessao_do_pool(canal: EmailChannel, mensagens: list):
+    for destinatario, assunto, conteudo in mensagens:
+        canal.enviar(destinatario, assunto, conteudo)
+
+
+def medir(nome: str, funcao, *args):
+    inicio = time.perf_counter()
+    funcao(*args)
+    duracao = time.perf_counter() - inicio
+    print(f"  {nome:<28} {duracao:7.2f} s  {QUANTIDADE / duracao:8.1f} msg/s")
+    return duracao
+
+
+if __name__ == "__main__":
+    servidor = ServidorSMTPLocal().iniciar()
+    config = ConfiguracaoSMTP("127.0.0.1", servidor.porta, "benchmark", "senha", use_tls=False)
+    canal = EmailChannel(PoolSMTP(config, max_conexoes=1))
+    mensagens = [
+        (f"contato{i}@teste.com", "Benchmark", "Mensagem de teste")
+        for i in range(QUANTIDADE)
+    ]
+
+    print("=" * 60)
+    print(f"ENVIO SMTP: {QUANTIDADE} mensagens (servidor local em :{servidor.porta})")
+    print("=" * 60)
+    base = medir("sessão por mensagem", sessao_por_mensagem, config, mensagens)
+    pool = medir("pool (enviar)", sessao_do_pool, canal, mensagens)
+    lote = medir("lote (enviar_lote)", canal.enviar_lote, mensagens)
+    print(f"\n  Ganho do pool: {base / pool:.1f}x | ganho do lote: {base / lote:.1f}x")
+
+    # Um destinatário recusado não derruba o restante do lote
+    resultados = canal.enviar_lote([
+        ("ok1@teste.com", "Teste", "a"),
+        ("rejeitado@teste.com", "Teste", "b"),
+        ("ok2@teste.com", "Teste", "c"),
+    ])
+    print(f"  Lote com destinatário recusado: {[sucesso for sucesso, _ in resultados]}")
+
+    canal.pool.fechar()
+    servidor.parar()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Benchmark de concorrência do SQLite: leituras da API durante as gravações do
+despachante.
+
+Para cada perfil de conexão, cria um banco temporário com MENSAGENS
+agendamentos vencidos e, por DURACAO segundos, roda ao mesmo tempo em
+processos separados (como API, worker e beat em produção):
+- LEITORES processos que listam agendamentos (primeira página por status) e
+  buscam contatos, como as rotas da API;
+- um despachante que reivindica lotes de 100 (UPDATE) e grava o resultado de
+  cada mensagem (executemany), com um commit por etapa;
+- um processo que cria novos agendamentos, como as rotas de agendamento.
+
+Perfis comparados:
+- padrão: create_engine("sqlite:///...") como era o database.engine
+  (journal em rollback, synchronous=FULL, timeout de 5 s do sqlite3);
+- ajustado: database.criar_engine (WAL, synchronous=NORMAL, busy_timeout,
+  cache, mmap e pool).
+
+Uso:
+    python benchmark_sqlite.py [duracao_segundos] [leitores]
+"""
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from database import Base, criar_engine
+
+DURACAO = float(sys.argv[1]) if len(sys.argv) > 1 else 10.0
+LEITORES = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+MENSAGENS = 200000
+CONTATOS = 1000
+TAMANHO_LOTE = 100
+
+PERFIS = {
+    "padrão": lambda url: create_engine(url, connect_args={"check_same_thread": False}),
+    "ajustado": criar_engine,
+}
+
+LISTAGEM = text(
+    "SELECT * FROM mensagens_agendadas WHERE status = :status "
+    "ORDER BY data_agendamento DESC, id DESC LIMIT 100"
+)
+CONTATO = text("SELECT * FROM contacts WHERE id = :id")
+CANDIDATAS = text(
+    "SELECT id FROM mensagens_agendadas WHERE status = 'AGENDADO' AND data_agendamento <= :agora "
+    "ORDER BY data_agendamento LIMIT :limite"
+)
+REIVINDICAR = text(
+    "UPDATE mensagens_agendadas SET status = 'PROCESSANDO', worker_id = :worker, lease_expira_em = :lease "
+    "WHERE id = :id AND status = 'AGENDADO'"
+)
+CONCLUIR = text(
+    "UPDATE mensagens_agendadas SET status = 'ENVIADO', enviado_em = :agora, worker_id = NULL "
+    "WHERE id = :id AND worker_id = :worker"
+)
+INSERIR = text(
+    "INSERT INTO mensagens_agendadas (contato_id, canal, destinatario, conteudo, data_agendamento, status, criado_em) "
+    "VALUES (:contato, 'email', 'novo@teste.com', 'Mensagem', :data, 'AGENDADO', :agora)"
+)
+
+
+def popular(url: str):
+    engine = criar_engine(url)
+    Base.metadata.create_all(bind=engine)
+    inicio = datetime(2024, 1, 1)
+    bruta = engine.raw_connection()
+    try:
+        bruta.executemany(
+            "INSERT INTO contacts (id, name, email, canalPref) VALUES (?, ?, ?, 'email')",
+            ((i, f"Contato {i}", f"contato{i}@teste.com") for i in range(1, CONTATOS + 1)),
+        )
+        bruta.executemany(
+            "INSERT INTO mensagens_agendadas (contato_id, canal, destinatario, conteudo, data_agendamento, status, criado_em) "
+            "VALUES (?, 'email', ?, 'Mensagem', ?, 'AGENDADO', ?)",
+            (
+                (i % CONTATOS + 1, f"contato{i}@teste.com", (inicio + timedelta(seconds=i)).isoformat(" "), inicio.isoformat(" "))
+                for i in range(MENSAGENS)
+            ),
+        )
+        bruta.commit()
+    finally:
+        bruta.close()
+    # Volta o banco ao modo de journal padrão para o perfil "padrão"
+    with engine.connect() as conn:
+        conn.exec_driver_sql("PRAGMA journal_mode=DELETE")
+    engine.dispose()
+
+
+def ler(perfil: str, url: str, fim: float, fila):
+    engine = PERFIS[perfil](url)
+    latencias, erros = [], 0
+    i = 0
+    while time.time() < fim:
+        i += 1
+        inicio = time.perf_counter()
+        try:
+            with engine.connect() as conn:
+                conn.execute(LISTAGEM, {"status": "ENVIADO" if i % 2 else "AGENDADO"}).all()
+                conn.execute(CONTATO, {"id": i % CONTATOS + 1}).all()
+            latencias.append(time.perf_counter() - inicio)
+        except OperationalError:
+            erros += 1
+    fila.put(("leitura", latencias, erros))
+
+
+def despachar(perfil: str, url: str, fim: float, fila):
+    engine = PERFIS[perfil](url)
+    lotes, mensagens, erros = 0, 0, 0
+    while time.time() < fim:
+        agora = datetime.utcnow()
+        try:
+            with engine.begin() as conn:
+                ids = conn.execute(CANDIDATAS, {"agora": agora, "limite": TAMANHO_LOTE}).scalars().all()
+                conn.execute(REIVINDICAR, [{"id": i, "worker": "bench", "lease": agora + timedelta(minutes=5)} for i in ids])
+            # (o envio aconteceria aqui, fora da transação)
+            with engine.begin() as conn:
+                conn.execute(CONCLUIR, [{"id": i, "agora": agora, "worker": "bench"} for i in ids])
+            lotes += 1
+            mensagens += len(ids)
+        except OperationalError:
+            erros += 1
+    fila.put(("despacho", lotes, mensagens, erros))
+
+
+def agendar(perfil: str, url: str, fim: float, fila):
+    engine = PERFIS[perfil](url)
+    inseridos, erros, i = 0, 0, 0
+    while time.time() < fim:
+        i += 1
+        agora = datetime.utcnow()
+        try:
+            with engine.begin() as conn:
+                conn.execute(INSERIR, {"contato": i % CONTATOS + 1, "data": agora + timedelta(days=1), "agora": agora})
+            inseridos += 1
+        except OperationalError:
+            erros += 1
+    fila.put(("agendamento", inseridos, erros))
+
+
+def medir(perfil: str, diretorio: str) -> dict:
+    url = f"sqlite:///{os.path.join(diretorio, perfil.replace('ã', 'a') + '.db')}"
+    popular(url)
+    fila = multiprocessing.Queue()
+    fim = time.time() + DURACAO
+    processos = [multiprocessing.Process(target=ler, args=(perfil, url, fim, fila)) for _ in range(LEITORES)]
+    processos.append(multiprocessing.Process(target=despachar, args=(perfil, url, fim, fila)))
+    processos.append(multiprocessing.Process(target=agendar, args=(perfil, url, fim, fila)))
+    for processo in processos:
+        processo.start()
+    resultados = [fila.get() for _ in processos]
+    for processo in processos:
+        processo.join()
+
+    latencias = sorted(l for r in resultados if r[0] == "leitura" for l in r[1])
+    despacho = next(r for r in resultados if r[0] == "despacho")
+    agendamento = next(r for r in resultados if r[0] == "agendamento")
+    return {
+        "leituras_s": len(latencias) / DURACAO,
+        "p50_ms": latencias[len(latencias) // 2] * 1000 if latencias else float("nan"),
+        "p99_ms": latencias[int(len(latencias) * 0.99)] * 1000 if latencias else float("nan"),
+        "mensagens_s": despacho[2] / DURACAO,
+        "agendamentos_s": agendamento[1] / DURACAO,
+        "travas": sum(r[2] for r in resultados if r[0] == "leitura") + despacho[3] + agendamento[2],
+    }
+
+
+if __name__ == "__main__":
+    print(f"{DURACAO:.0f}s por perfil, {LEITORES} leitores, 1 despachante, 1 agendador, {MENSAGENS} mensagens\n")
+    print(f"{'perfil':<10}{'leituras/s':>12}{'p50 (ms)':>10}{'p99 (ms)':>10}{'despachadas/s':>15}{'inserts/s':>11}{'locked':>8}")
+    with tempfile.TemporaryDirectory() as diretorio:
+        for perfil in PERFIS:
+            r = medir(perfil, diretorio)
+            print(f"{perfil:<10}{r['leituras_s']:>12.0f}{r['p50_ms']:>10.1f}{r['p99_ms']:>10.1f}"
+                  f"{r['mensagens_s']:>15.0f}{r['agendamentos_s']:>11.0f}{r['travas']:>8}")
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Benchmark offline do canal WhatsApp contra o servidor_twilio_local.
+
+Compara o comportamento anterior (um twilio.rest.Client novo por mensagem)
+com o client compartilhado com keep-alive, em sequência e com vários envios
+simultâneos pelo mesmo client (como fazem os workers do despachante). O
+limite de taxa, que fica no despachante, não entra: a medida é só do client e
+das conexões.
+
+Uso:
+    python benchmark_whatsapp.py [quantidade] [envios_simultaneos]
+"""
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from servidor_twilio_local import ServidorTwilioLocal
+from service.whatsapp_channel import (
+    MAX_CONEXOES,
+    ConfiguracaoTwilio,
+    WhatsappChannel,
+    _ClienteCompartilhado,
+    criar_cliente,
+)
+from twilio.rest import Client
+
+QUANTIDADE = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+SIMULTANEOS = int(sys.argv[2]) if len(sys.argv) > 2 else MAX_CONEXOES
+
+
+def client_por_mensagem(config: ConfiguracaoTwilio, mensagens: list):
+    """Comportamento anterior: um Client (e uma sessão HTTP) por mensagem."""
+    for numero, conteudo in mensagens:
+        cliente = Client(config.account_sid, config.auth_token)
+        cliente.api.base_url = config.base_url
+        cliente.messages.create(body=conteudo, from_=config.from_whatsapp, to=f"whatsapp:{numero}")
+
+
+def client_compartilhado(compartilhado: _ClienteCompartilhado, mensagens: list):
+    canal = WhatsappChannel(compartilhado)
+    for numero, conteudo in mensagens:
+        canal.enviar(numero, conteudo)
+
+
+def client_compartilhado_simultaneo(compartilhado: _ClienteCompartilhado, mensagens: list):
+    """Um WhatsappChannel por envio, todos sobre o mesmo client, como nos workers do despachante."""
+    with ThreadPoolExecutor(max_workers=SIMULTANEOS) as executor:
+        list(executor.map(lambda m: WhatsappChannel(compartilhado).enviar(*m), mensagens))
+
+
+def medir(nome: str, servidor: ServidorTwilioLocal, funcao, *args):
+    conexoes_antes = servidor.conexoes_abertas
+    inicio = time.perf_counter()
+    funcao(*args)
+    duracao = time.perf_counter() - inicio
+    conexoes = servidor.conexoes_abertas - conexoes_antes
+    print(f"  {nome:<38} {duracao:6.2f} s  {len(args[-1]) / duracao:7.1f} msg/s  {conexoes:4d} conexões")
+    return duracao
+
+
+if __name__ == "__main__":
+    servidor = ServidorTwilioLocal().iniciar()
+    config = ConfiguracaoTwilio("ACbenchmark", "token", "whatsapp:+14155238886", servidor.base_url)
+    compartilhado = _ClienteCompartilhado(config, criar_cliente(config))
+    mensagens = [(f"55119{i:08d}", "Mensagem de teste") for i in range(1, QUANTIDADE + 1)]
+
+    print("=" * 78)
+    print(f"ENVIO WHATSAPP: {QUANTIDADE} mensagens (Twilio local em {servidor.base_url})")
+    print("=" * 78)
+    base = medir("client por mensagem", servidor, client_por_mensagem, config, mensagens)
+    sequencial = medir("client compartilhado", servidor, client_compartilhado, compartilhado, mensagens)
+    simultaneo = medir(f"client compartilhado ({SIMULTANEOS} simultâneos)", servidor,
+                       client_compartilhado_simultaneo, compartilhado, mensagens)
+    print(f"\n  Ganho do client compartilhado: {base / sequencial:.1f}x | com envios simultâneos: {base / simultaneo:.1f}x")
+
+    canal = WhatsappChannel(compartilhado)
+    print(f"  Número válido: {canal.enviar('5511900000001', 'a')} (SID {canal.last_provider_id})")
+    print(f"  Número inválido: {canal.enviar('0000000000', 'b')} (classe {canal.last_error_class})")
+    servidor.parar()
@@ -0,0 +1,115 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+
+from database import User
+
+# Por quanto tempo um token verificado dispensa a consulta ao banco. Também é o
+# atraso máximo para outro processo perceber um usuário desativado (0 desliga o cache)
+TTL_SEGUNDOS = float(os.getenv("AUTH_CACHE_TTL_SEGUNDOS", "60"))
+# Quantidade máxima de tokens mantidos; os menos usados são descartados primeiro
+TAMANHO_MAXIMO = int(os.getenv("AUTH_CACHE_TAMANHO", "10000"))
+
+# Colunas copiadas para o snapshot (o hash da senha nunca fica no cache)
+CAMPOS_SNAPSHOT = ("id", "username", "email", "full_name", "disabled", "created_at", "last_login")
+# Alterações que invalidam os tokens do usuário em cache
+CAMPOS_SENSIVEIS = ("disabled", "hashed_password", "username")
+
+
+class CacheUsuarios:
+    """
+    Cache LRU com TTL de token JWT verificado → snapshot do usuário.
+
+    Evita que cada requisição autenticada decodifique o token e abra uma sessão
+    para buscar o usuário. Cada entrada vale até o fim do TTL ou até a
+    expiração do próprio token, o que vier primeiro.
+    """
+
+    def __init__(self, ttl: float = None, tamanho_maximo: int = None):
+        self.ttl = TTL_SEGUNDOS if ttl is None else ttl
+        self.tamanho_maximo = tamanho_maximo or TAMANHO_MAXIMO
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obter(self, token: str) -> Optional[User]:
+        """Retorna um User desanexado de qualquer sessão, ou None se não houver entrada válida."""
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            entrada = self._entradas.get(token)
+            if entrada is None:
+                return None
+            valido_ate, expira_token, dados = entrada
+            if time.monotonic() >= valido_ate or time.time() >= expira_token:
+                del self._entradas[token]
+                return None
+            self._entradas.move_to_end(token)
+        # Cada requisição recebe sua própria instância, que nunca pertence a uma sessão
+        return User(**dados)
+
+    def guardar(self, token: str, user: User, expira_token: float):
+        """Guarda o snapshot de `user` para o token, válido até `expira_token` (epoch)."""
+        if self.ttl <= 0:
+            return
+        dados = {campo: getattr(user, campo) for campo in CAMPOS_SNAPSHOT}
+        with self._lock:
+            self._entradas[token] = (time.monotonic() + self.ttl, expira_token, dados)
+            self._entradas.move_to_end(token)
+            while len(self._entradas) > self.tamanho_maximo:
+                self._entradas.popitem(last=False)
+
+    def invalidar_usuario(self, user_id: int):
+        """Remove todos os tokens em cache do usuário."""
+        with self._lock:
+            tokens = [token for token, (_, _, dados) in self._entradas.items() if dados["id"] == user_id]
+            for token in tokens:
+                del self._entradas[token]
+
+    def limpar(self):
+        with self._lock:
+            self._entradas.clear()
+
+
+cache = CacheUsuarios()
+
+
+@event.listens_for(User, "after_update")
+def _invalidar_apos_alteracao(mapper, connection, alvo):
+    estado = inspect(alvo)
+    if not any(estado.attrs[campo].history.has_changes() for campo in CAMPOS_SENSIVEIS):
+        return
+    cache.invalidar_usuario(alvo.id)
+    # Invalida de novo após o commit: uma requisição concorrente pode ter
+    # lido e guardado os valores antigos antes dele
+    sessao = object_session(alvo)
+    if sessao is not None:
+        sessao.info.setdefault("usuarios_alterados", set()).add(alvo.id)
+
+
+@event.listens_for(User, "after_delete")
+def _invalidar_apos_exclusao(mapper, connection, alvo):
+    cache.invalidar_usuario(alvo.id)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _invalidar_apos_update_ou_delete(estado):
+    # update(User)/delete(User) executados pela sessão (como a troca de hash no
+    # login) não passam pelos eventos do mapper. O WHERE pode alcançar qualquer
+    # usuário, então o cache inteiro é descartado, agora e após o commit
+    if not (estado.is_update or estado.is_delete) or estado.statement.table.name != User.__tablename__:
+        return
+    cache.limpar()
+    estado.session.info["limpar_usuarios"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidar_apos_commit(sessao):
+    if sessao.info.pop("limpar_usuarios", False):
+        cache.limpar()
+    for user_id in sessao.info.pop("usuarios_alterados", ()):
+        cache.invalidar_usuario(user_id)
@@ -12,13 +12,25 @@ for var in required_env_vars:
 
 from celery import Celery
 from celery.schedules import crontab
+from celery.signals import setup_logging
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# Modo de agendamento: "intervalo" (Beat a cada 60s) ou "adaptativo" (acorda no
+# horário do próximo agendamento; o Beat vira apenas uma verificação de segurança)
+MODO_AGENDAMENTO = os.getenv("AGENDAMENTO_MODO", "intervalo").lower()
+INTERVALO_SEGURANCA = float(os.getenv("AGENDAMENTO_INTERVALO_SEGURANCA", "900"))
+# Horário diário (no fuso do Celery) do arquivamento das mensagens finalizadas
+HORA_ARQUIVAMENTO = int(os.getenv("ARQUIVAMENTO_HORA", "3"))
 
 # Configuração do Celery
 celery_app = Celery(
     "mensagens",
-    broker="redis://localhost:6379/0",
-    backend="redis://localhost:6379/0",
-    include=['tasks']  # Inclui as tarefas do módulo tasks.py
+    broker=REDIS_URL,
+    backend=REDIS_URL,
+    # tasks.py e a tarefa antiga agendar_envio (countdown), para que as já
+    # enfileiradas antes de /mensagens/agendar/ gravar no banco ainda rodem
+    include=['tasks', 'service.scheduler']
 )
 
 # Configurações gerais
@@ -30,21 +42,39 @@ celery_app.conf.update(
     enable_utc=False,
     task_track_started=True,
     task_time_limit=30 * 60,  # 30 minutos
-    task_soft_time_limit=25 * 60  # 25 minutos
+    task_soft_time_limit=25 * 60,  # 25 minutos
+    # Tarefas com ETA ainda não confirmadas são reentregues após este tempo;
+    # o despertador (service/despertador.py) nunca arma um ETA mais distante
+    # que INTERVALO_SEGURANCA, então ele precisa ficar acima disso
+    broker_transport_options={"visibility_timeout": max(3600, 2 * INTERVALO_SEGURANCA)},
 )
 
 # Configuração do Celery Beat para executar tarefas periódicas
 celery_app.conf.beat_schedule = {
     'processar-mensagens-agendadas': {
         'task': 'tasks.processar_agendamentos',  # Caminho atualizado
-        'schedule': 60.0,  # Executa a cada 60 segundos (1 minuto)
+        # Executa a cada 60 segundos (1 minuto); no modo adaptativo só como rede de segurança
+        'schedule': INTERVALO_SEGURANCA if MODO_AGENDAMENTO == "adaptativo" else 60.0,
         'options': {
             'expires': 30.0,  # Expira após 30 segundos se não for executada
         }
     },
+    'arquivar-mensagens-finalizadas': {
+        'task': 'tasks.arquivar_mensagens',
+        # Uma vez por dia, fora do horário de pico; cada execução move tudo o que venceu
+        'schedule': crontab(hour=HORA_ARQUIVAMENTO, minute=30),
+        'options': {
+            'expires': 3600.0,
+        }
+    },
 }
 
-# Configuração de logs
+# Configuração de logs: os workers usam o mesmo logging da API (fila + thread de escrita)
+@setup_logging.connect
+def configurar_log_worker(**kwargs):
+    from log_config import configurar_log
+    configurar_log()
+
 if os.environ.get('CELERY_DEBUG'):
     celery_app.conf.worker_log_format = (
         '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
@@ -0,0 +1,120 @@
+"""
+Fixtures compartilhadas pelos testes em pytest:
+
+- engine / sessoes: banco SQLite temporário com todas as tabelas, em um
+  arquivo com o nome do módulo de teste;
+- cliente: TestClient com os roteadores da lista ROTEADORES do módulo de
+  teste, sessões assíncronas no mesmo banco e um usuário autenticado fixo;
+- servico_falso / agendar: MensagemService falso, que segue um roteiro por
+  destinatário, e mensagens agendadas já vencidas para o despachante.
+"""
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+from auth import get_current_active_user
+from database import Base, Contact, MensagemAgendada, User, criar_engine, criar_engine_assincrono
+from dependencies import get_async_db
+from service import agendamento_service
+
+USUARIO_TESTE = User(id=1, username="teste", disabled=False)
+
+
+@pytest.fixture
+def engine(tmp_path, request):
+    engine = criar_engine(f"sqlite:///{tmp_path / (request.module.__name__ + '.db')}")
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def sessoes(engine):
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@pytest.fixture
+def cliente(engine, request):
+    async_engine = criar_engine_assincrono(str(engine.url))
+    sessoes_async = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+    async def get_db_teste():
+        async with sessoes_async() as db:
+            yield db
+
+    app = FastAPI()
+    for roteador in request.module.ROTEADORES:
+        app.include_router(roteador, prefix="/api")
+    app.dependency_overrides[get_async_db] = get_db_teste
+    app.dependency_overrides[get_current_active_user] = lambda: USUARIO_TESTE
+    with TestClient(app) as cliente:
+        yield cliente
+        cliente.portal.call(async_engine.dispose)
+
+
+class ServicoFalso:
+    """
+    Responde a cada destinatário com o próximo item (sucesso, classe do erro)
+    do seu roteiro; sem roteiro, aceita o envio. Guarda o destinatário e o
+    instante de cada envio.
+    """
+
+    roteiros = {}
+    envios = []
+
+    def __init__(self):
+        self.last_provider_id = None
+        self.last_error_class = None
+        self.detalhes_lote = []
+
+    def _responder(self, destinatario: str) -> tuple:
+        self.envios.append((destinatario, time.monotonic()))
+        roteiro = self.roteiros.get(destinatario)
+        return roteiro.pop(0) if roteiro else (True, None)
+
+    def enviar_mensagem(self, canal, destinatario, conteudo, assunto=None):
+        sucesso, classe = self._responder(destinatario)
+        self.last_provider_id = f"SM{destinatario}" if sucesso else None
+        self.last_error_class = classe
+        return sucesso, None if sucesso else f"falha ({classe})"
+
+    def enviar_emails(self, mensagens):
+        respostas = [self._responder(destinatario) for destinatario, _, _ in mensagens]
+        self.detalhes_lote = [(None, 1, classe) for _, classe in respostas]
+        return [(sucesso, None if sucesso else f"falha ({classe})") for sucesso, classe in respostas]
+
+
+@pytest.fixture
+def servico_falso(monkeypatch):
+    """ServicoFalso sem roteiros nem envios; o histórico não faz parte destes testes."""
+    monkeypatch.setattr(agendamento_service, "registrar_envio", lambda *args, **kwargs: None)
+    monkeypatch.setattr(ServicoFalso, "roteiros", {})
+    monkeypatch.setattr(ServicoFalso, "envios", [])
+    return ServicoFalso
+
+
+@pytest.fixture
+def agendar(sessoes):
+    """Agenda uma mensagem AGENDADO já vencida por destinatário, vencendo nessa ordem."""
+    def agendar(canal: str, destinatarios: list):
+        inicio = datetime.utcnow() - timedelta(hours=1)
+        db = sessoes()
+        contato = Contact(name="Contato", email="contato@teste.com", phone="+5511999990000", canalPref=canal)
+        db.add(contato)
+        db.flush()
+        db.add_all(
+            MensagemAgendada(
+                contato_id=contato.id, canal=canal, destinatario=destinatario, conteudo="Mensagem",
+                data_agendamento=inicio + timedelta(seconds=i), status="AGENDADO",
+            )
+            for i, destinatario in enumerate(destinatarios)
+        )
+        db.commit()
+        db.close()
+
+    return agendar
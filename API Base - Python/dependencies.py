@@ -1,6 +1,6 @@
-from typing import Generator
+from typing import AsyncGenerator, Generator
 from sqlalchemy.orm import Session
-from database import SessionLocal
+from database import AsyncSessionLocal, SessionLocal
 
 def get_db() -> Generator:
     """
@@ -12,3 +12,11 @@ def get_db() -> Generator:
         yield db
     finally:
         db.close()
+
+async def get_async_db() -> AsyncGenerator:
+    """
+    Dependency that provides an async database session (AsyncSession).
+    Queries are awaited, so a slow query does not block the event loop.
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,81 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Hashes simultâneos. O pbkdf2 (hashlib) e o bcrypt liberam o GIL, então threads
+# bastam; o padrão deixa metade dos núcleos livre para as demais rotas
+WORKERS_HASH = int(os.getenv("AUTH_HASH_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+# Hashes aguardando na fila além dos que estão em execução; acima disso o login
+# é recusado com 503 em vez de acumular latência
+FILA_MAXIMA_HASH = int(os.getenv("AUTH_HASH_FILA_MAXIMA", "64"))
+
+
+class FilaDeHashCheia(Exception):
+    """A fila do executor de senhas atingiu FILA_MAXIMA_HASH."""
+
+
+class ExecutorSenhas:
+    """
+    Executa hash e verificação de senhas fora do event loop, com um número
+    limitado de threads e uma fila limitada, e mantém métricas da fila.
+    """
+
+    def __init__(self, workers: int = None, fila_maxima: int = None):
+        self.workers = workers or WORKERS_HASH
+        self.fila_maxima = FILA_MAXIMA_HASH if fila_maxima is None else fila_maxima
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="hash-senha")
+        self._lock = threading.Lock()
+        self._pendentes = 0
+        self._em_execucao = 0
+        self._concluidos = 0
+        self._recusados = 0
+        self._espera_total = 0.0
+        self._espera_maxima = 0.0
+        self._execucao_total = 0.0
+
+    async def executar(self, funcao, *args):
+        """Executa `funcao(*args)` no pool; levanta FilaDeHashCheia se a fila estiver cheia."""
+        with self._lock:
+            if self._pendentes >= self.workers + self.fila_maxima:
+                self._recusados += 1
+                raise FilaDeHashCheia()
+            self._pendentes += 1
+        enfileirado_em = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._medir, funcao, args, enfileirado_em)
+
+    def _medir(self, funcao, args, enfileirado_em: float):
+        inicio = time.perf_counter()
+        espera = inicio - enfileirado_em
+        with self._lock:
+            self._em_execucao += 1
+            self._espera_total += espera
+            self._espera_maxima = max(self._espera_maxima, espera)
+        try:
+            return funcao(*args)
+        finally:
+            with self._lock:
+                self._em_execucao -= 1
+                self._pendentes -= 1
+                self._concluidos += 1
+                self._execucao_total += time.perf_counter() - inicio
+
+    def metricas(self) -> dict:
+        with self._lock:
+            concluidos = self._concluidos
+            return {
+                "workers": self.workers,
+                "em_execucao": self._em_execucao,
+                "na_fila": self._pendentes - self._em_execucao,
+                "fila_maxima": self.fila_maxima,
+                "concluidos": concluidos,
+                "recusados": self._recusados,
+                "espera_media_ms": round(self._espera_total / concluidos * 1000, 2) if concluidos else 0.0,
+                "espera_maxima_ms": round(self._espera_maxima * 1000, 2),
+                "execucao_media_ms": round(self._execucao_total / concluidos * 1000, 2) if concluidos else 0.0,
+            }
+
+
+executor_senhas = ExecutorSenhas()
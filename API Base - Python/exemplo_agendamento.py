@@ -62,7 +62,7 @@ def listar_agendamentos_ativos():
         response = requests.get(f"{BASE_URL}/agendamentos/?status=AGENDADO")
         response.raise_for_status()
         
-        agendamentos = response.json()
+        agendamentos = response.json()["itens"]
         
         if not agendamentos:
             print("\n📭 Nenhum agendamento ativo encontrado.")
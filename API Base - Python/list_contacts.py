@@ -1,11 +1,5 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from database import Contact, Base
-
-# Configuração do banco de dados
-SQLALCHEMY_DATABASE_URL = "sqlite:///./sql_app.db"
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Usa o banco configurado em database (DATABASE_URL)
+from database import Contact, SessionLocal
 
 def list_all_contacts():
     db = SessionLocal()
@@ -0,0 +1,135 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# Nível padrão dos logs da aplicação
+NIVEL_LOG = os.getenv("LOG_LEVEL", "INFO").upper()
+# "texto" (uma linha legível por registro) ou "json" (um objeto JSON por linha)
+FORMATO_LOG = os.getenv("LOG_FORMATO", "texto").lower()
+# Níveis por módulo, ex.: "auth=DEBUG,service.email_channel=WARNING"
+NIVEIS_POR_MODULO = os.getenv("LOG_NIVEIS", "")
+# Fração dos registros marcados com AMOSTRAR que é mantida (linhas de depuração de caminhos quentes)
+TAXA_AMOSTRAGEM = float(os.getenv("LOG_AMOSTRA_DEBUG", "1.0"))
+
+# Use como `extra=AMOSTRAR` em logs de depuração emitidos a cada requisição ou mensagem
+AMOSTRAR = {"amostrar": True}
+
+# Atributos próprios de todo LogRecord; o resto veio de `extra=` e vai para o JSON
+_ATRIBUTOS_PADRAO = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "amostrar"}
+
+_listener = None
+
+
+class FormatoJSON(logging.Formatter):
+    """Formata cada registro como um objeto JSON, incluindo os campos passados em `extra=`."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        dados = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "nivel": record.levelname,
+            "logger": record.name,
+            "mensagem": record.getMessage(),
+        }
+        for chave, valor in vars(record).items():
+            if chave not in _ATRIBUTOS_PADRAO:
+                dados[chave] = valor
+        if record.exc_info:
+            dados["excecao"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            dados["excecao"] = record.exc_text
+        return json.dumps(dados, ensure_ascii=False, default=str)
+
+
+class FiltroAmostragem(logging.Filter):
+    """Mantém só uma fração dos registros marcados com AMOSTRAR; os demais passam sempre."""
+
+    def __init__(self, taxa: float):
+        super().__init__()
+        self.taxa = taxa
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.taxa >= 1 or not getattr(record, "amostrar", False):
+            return True
+        return random.random() < self.taxa
+
+
+class _EntradaFila(QueueHandler):
+    """
+    QueueHandler que entrega o registro à thread de escrita sem formatá-lo:
+    a formatação (inclusive o JSON) também sai da thread que gerou o log.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve os argumentos agora (podem mudar depois), mas mantém os campos extras
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+
+def aplicar_niveis_por_modulo(configuracao: str):
+    """Aplica níveis no formato "modulo=NIVEL,outro.modulo=NIVEL"."""
+    for item in configuracao.split(","):
+        if "=" not in item:
+            continue
+        modulo, nivel = item.split("=", 1)
+        logging.getLogger(modulo.strip()).setLevel(nivel.strip().upper())
+
+
+def configurar_log(destino=None):
+    """
+    Configura o logging da aplicação com escrita assíncrona: os loggers só
+    colocam os registros em uma fila em memória, e uma thread de fundo
+    (QueueListener) os formata e os escreve em `destino` (stderr por padrão).
+    Pode ser chamada mais de uma vez; só a primeira tem efeito.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    saida = logging.StreamHandler(destino or sys.stderr)
+    if FORMATO_LOG == "json":
+        saida.setFormatter(FormatoJSON())
+    else:
+        saida.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    fila = queue.SimpleQueue()
+    entrada = _EntradaFila(fila)
+    entrada.addFilter(FiltroAmostragem(TAXA_AMOSTRAGEM))
+
+    raiz = logging.getLogger()
+    raiz.handlers = [entrada]
+    raiz.setLevel(NIVEL_LOG)
+    aplicar_niveis_por_modulo(NIVEIS_POR_MODULO)
+
+    _listener = QueueListener(fila, saida, respect_handler_level=True)
+    _listener.start()
+    atexit.register(encerrar_log)
+
+
+def _reiniciar_apos_fork():
+    # A thread de escrita não sobrevive ao fork (ex.: processos filhos do
+    # Celery); o filho sobe a sua, lendo a mesma fila herdada
+    global _listener
+    if _listener is not None:
+        _listener = QueueListener(_listener.queue, *_listener.handlers, respect_handler_level=True)
+        _listener.start()
+
+
+os.register_at_fork(after_in_child=_reiniciar_apos_fork)
+
+
+def encerrar_log():
+    """Escreve os registros pendentes e para a thread de escrita."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,9 +1,8 @@
 import os
 from dotenv import load_dotenv
-from fastapi import FastAPI, Request, Depends
+from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.utils import get_openapi
-from starlette.middleware.base import BaseHTTPMiddleware
 
 # Carrega as variáveis de ambiente do arquivo .env
 load_dotenv()
@@ -14,11 +13,22 @@ for var in required_env_vars:
     if not os.getenv(var):
         print(f"AVISO: A variável de ambiente {var} não está definida no arquivo .env")
 
+# Logging com escrita em thread de fundo
+from log_config import configurar_log
+configurar_log()
+
 # Importar rotas
-from routes import contacts, mensagens, agendamentos
+from routes import contacts, mensagens, agendamentos, jobs, historico
 from routers import auth
-from database import create_db_and_tables
+from database import async_engine, create_db_and_tables
+from service.smtp_pool import fechar_pools
+from service.despertador import configurar_despertadores
+from service.despachante_embutido import iniciar_despachante_embutido, encerrar_despachante_embutido
+from service.jobs import encerrar_executor_local
+from service.historico import encerrar_historico
 from auth import get_current_active_user
+from executor_senhas import executor_senhas
+from middleware import LogRequisicoesMiddleware
 
 app = FastAPI(
     title="Microserviço de Agendamento e Comunicação",
@@ -84,51 +94,9 @@ def custom_openapi():
 
 app.openapi = custom_openapi
 
-# Middleware para debug (verificar se o token está sendo enviado)
-class DebugMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        # Log de todas as requisições
-        print("\n===== REQUISIÇÃO RECEBIDA =====")
-        print(f"Método: {request.method}")
-        print(f"URL: {request.url}")
-        print(f"Cabeçalhos: {dict(request.headers)}")
-        
-        # Verifica se há token no header
-        auth_header = request.headers.get("Authorization")
-        if auth_header:
-            print(f"DEBUG: Token encontrado no header: {auth_header}")
-            
-            # Se o token começar com 'Bearer ', tenta decodificá-lo para debug
-            if auth_header.startswith("Bearer "):
-                token = auth_header[7:].strip()
-                parts = token.split('.')
-                if len(parts) == 3:  # Um JWT válido tem 3 partes
-                    try:
-                        import base64
-                        import json
-                        # Decodifica o payload (parte do meio)
-                        payload_encoded = parts[1]
-                        # Adiciona padding se necessário
-                        padding = len(payload_encoded) % 4
-                        if padding:
-                            payload_encoded += '=' * (4 - padding)
-                        payload_decoded = base64.urlsafe_b64decode(payload_encoded)
-                        payload_data = json.loads(payload_decoded)
-                        print(f"DEBUG: Conteúdo do token (debug): {payload_data}")
-                    except Exception as e:
-                        print(f"DEBUG: Não foi possível decodificar o token para debug: {e}")
-        else:
-            print(f"DEBUG: Nenhum token encontrado para {request.method} {request.url.path}")
-        
-        # Processa a requisição
-        response = await call_next(request)
-        
-        print(f"Status da resposta: {response.status_code}")
-        print("===== FIM DA REQUISIÇÃO =====\n")
-        return response
-
-# Adiciona middleware de debug (ativar temporariamente para debug)
-app.add_middleware(DebugMiddleware)
+# Log de requisições (método, caminho, status e duração); com
+# API_DEBUG_REQUISICOES=1 registra também cabeçalhos e o payload do token
+app.add_middleware(LogRequisicoesMiddleware)
 
 # Configuração do CORS
 # Configurado para permitir todas as origens (desenvolvimento)
@@ -146,6 +114,8 @@ app.include_router(auth.router, tags=["authentication"])
 app.include_router(contacts.router, prefix="/api", tags=["Contatos"])
 app.include_router(mensagens.router, prefix="/api", tags=["Mensagens"])
 app.include_router(agendamentos.router, prefix="/api", tags=["Agendamentos"])
+app.include_router(jobs.router, prefix="/api", tags=["Jobs"])
+app.include_router(historico.router, prefix="/api", tags=["Histórico"])
 
 # Rota de health check
 @app.get("/health")
@@ -154,7 +124,8 @@ async def health_check():
     return {
         "status": "ok",
         "service": "Communication and Scheduling API",
-        "version": "1.0.0"
+        "version": "1.0.0",
+        "hash_senhas": executor_senhas.metricas()
     }
 
 # Rota de teste de autenticação
@@ -181,4 +152,22 @@ async def root():
 @app.on_event("startup")
 async def startup():
     # Garante que as tabelas estejam criadas
-    create_db_and_tables()
\ No newline at end of file
+    create_db_and_tables()
+    # No modo adaptativo, as rotas de agendamento armam o despertar do Celery
+    configurar_despertadores()
+    # Com DESPACHANTE_EMBUTIDO=1 os agendamentos são enviados pela própria API
+    await iniciar_despachante_embutido()
+
+# Evento de encerramento
+@app.on_event("shutdown")
+async def shutdown():
+    # Termina os envios em andamento antes de fechar as conexões
+    await encerrar_despachante_embutido()
+    # Descarta os jobs locais que ainda não começaram
+    encerrar_executor_local()
+    # Grava o histórico dos envios que ainda estava no buffer
+    encerrar_historico()
+    # Encerra as conexões SMTP mantidas abertas pelo pool
+    fechar_pools()
+    # Fecha as conexões do pool assíncrono das rotas
+    await async_engine.dispose()
@@ -0,0 +1,87 @@
+import base64
+import json
+import logging
+import os
+import random
+import time
+
+logger = logging.getLogger("api.requisicoes")
+
+# Fração das requisições bem-sucedidas que é registrada (erros e lentas sempre são)
+AMOSTRA_LOG = float(os.getenv("API_LOG_AMOSTRA", "1.0"))
+# Requisições mais lentas que isso são sempre registradas
+LENTA_MS = float(os.getenv("API_LOG_LENTA_MS", "1000"))
+# Registra cabeçalhos e o payload do JWT (apenas para depuração local)
+DEBUG_REQUISICOES = os.getenv("API_DEBUG_REQUISICOES", "False").lower() in ("1", "true", "yes")
+
+
+class LogRequisicoesMiddleware:
+    """
+    Middleware ASGI que registra método, caminho, status e duração de cada
+    requisição.
+
+    Diferente de um BaseHTTPMiddleware, não cria objetos Request/Response nem
+    reempacota o corpo da resposta: apenas observa a mensagem
+    `http.response.start`, então respostas em streaming passam intactas. O
+    registro vai para o logging (ver log_config), que escreve em uma thread
+    de fundo.
+    """
+
+    def __init__(self, app, amostra: float = None, lenta_ms: float = None, debug: bool = None):
+        self.app = app
+        self.amostra = AMOSTRA_LOG if amostra is None else amostra
+        self.lenta_ms = LENTA_MS if lenta_ms is None else lenta_ms
+        self.debug = DEBUG_REQUISICOES if debug is None else debug
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if self.debug:
+            self._registrar_debug(scope)
+
+        inicio = time.perf_counter()
+        status_code = 500
+
+        async def enviar(mensagem):
+            nonlocal status_code
+            if mensagem["type"] == "http.response.start":
+                status_code = mensagem["status"]
+            await send(mensagem)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            duracao_ms = (time.perf_counter() - inicio) * 1000
+            if (status_code >= 400 or duracao_ms >= self.lenta_ms
+                    or self.amostra >= 1 or random.random() < self.amostra):
+                nivel = logging.WARNING if status_code >= 500 else logging.INFO
+                logger.log(
+                    nivel,
+                    "%s %s %d %.1fms",
+                    scope["method"], scope["path"], status_code, duracao_ms,
+                    extra={
+                        "metodo": scope["method"],
+                        "caminho": scope["path"],
+                        "status": status_code,
+                        "duracao_ms": round(duracao_ms, 2),
+                    },
+                )
+
+    @staticmethod
+    def _registrar_debug(scope):
+        cabecalhos = {nome.decode("latin-1"): valor.decode("latin-1") for nome, valor in scope["headers"]}
+        logger.info("Cabeçalhos de %s %s: %s", scope["method"], scope["path"], cabecalhos)
+
+        autorizacao = cabecalhos.get("authorization", "")
+        if not autorizacao.startswith("Bearer "):
+            return
+        partes = autorizacao[7:].strip().split(".")
+        if len(partes) != 3:
+            return
+        try:
+            payload = partes[1] + "=" * (-len(partes[1]) % 4)
+            logger.info("Payload do token: %s", json.loads(base64.urlsafe_b64decode(payload)))
+        except Exception as e:
+            logger.info("Não foi possível decodificar o token para debug: %s", e)
@@ -0,0 +1,105 @@
+from sqlalchemy import MetaData, inspect
+from sqlalchemy.schema import CreateTable
+import sys
+import os
+
+# Adiciona o diretório raiz ao path para importar o módulo database
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import criar_engine, Contact, MensagemAgendada
+
+# No SQLite, mensagens_agendadas.id era um rowid simples: depois que as
+# mensagens mais novas eram arquivadas (e excluídas), o SQLite devolvia os
+# mesmos ids às próximas, que colidiam com mensagens_agendadas_arquivo e
+# travavam o arquivamento. A tabela é recriada com AUTOINCREMENT e a sequência
+# começa acima do maior id das duas tabelas. No PostgreSQL o id vem de uma
+# sequência, que nunca reaproveita valores.
+TABELA = "mensagens_agendadas"
+NOVA = "mensagens_agendadas_nova"
+ARQUIVO = "mensagens_agendadas_arquivo"
+
+
+def recriar(conn):
+    """Recria a tabela com AUTOINCREMENT (procedimento de ALTER TABLE do SQLite)."""
+    inspetor = inspect(conn)
+    existentes = {coluna["name"] for coluna in inspetor.get_columns(TABELA)}
+    tem_arquivo = inspetor.has_table(ARQUIVO)
+
+    metadata = MetaData()
+    # A cópia de contacts só serve para resolver a chave estrangeira da nova tabela
+    Contact.__table__.to_metadata(metadata)
+    nova = MensagemAgendada.__table__.to_metadata(metadata, name=NOVA)
+    conn.execute(CreateTable(nova))
+    colunas = ", ".join(coluna.name for coluna in nova.columns if coluna.name in existentes)
+    conn.exec_driver_sql(f"INSERT INTO {NOVA} ({colunas}) SELECT {colunas} FROM {TABELA}")
+
+    maior = conn.exec_driver_sql(f"SELECT COALESCE(MAX(id), 0) FROM {NOVA}").scalar()
+    if tem_arquivo:
+        maior = max(maior, conn.exec_driver_sql(f"SELECT COALESCE(MAX(id), 0) FROM {ARQUIVO}").scalar())
+        # Ids já reaproveitados: a mensagem pendente ganha um id novo, e o
+        # histórico gravado depois que ela foi criada passa a apontar para ele
+        colisoes = conn.exec_driver_sql(
+            f"SELECT n.id, n.criado_em FROM {NOVA} n JOIN {ARQUIVO} a ON a.id = n.id ORDER BY n.id"
+        ).all()
+        for id_antigo, criado_em in colisoes:
+            maior += 1
+            print(f"O id {id_antigo} já está no arquivo; a mensagem passa a ter o id {maior}.")
+            conn.exec_driver_sql(f"UPDATE {NOVA} SET id = ? WHERE id = ?", (maior, id_antigo))
+            if criado_em is not None:
+                conn.exec_driver_sql(
+                    "UPDATE historico_mensagens SET mensagem_agendada_id = ? "
+                    "WHERE mensagem_agendada_id = ? AND data_envio >= ?",
+                    (maior, id_antigo, criado_em),
+                )
+
+    conn.exec_driver_sql(f"DROP TABLE {TABELA}")
+    conn.exec_driver_sql(f"ALTER TABLE {NOVA} RENAME TO {TABELA}")
+    conn.exec_driver_sql(f"DELETE FROM sqlite_sequence WHERE name IN ('{TABELA}', '{NOVA}')")
+    conn.exec_driver_sql(f"INSERT INTO sqlite_sequence (name, seq) VALUES ('{TABELA}', ?)", (maior,))
+    for indice in sorted(MensagemAgendada.__table__.indexes, key=lambda i: i.name):
+        print(f"Recriando o índice '{indice.name}'...")
+        indice.create(bind=conn, checkfirst=True)
+
+
+def upgrade():
+    # Cria uma conexão com o banco de dados
+    engine = criar_engine()
+
+    try:
+        if engine.dialect.name != "sqlite":
+            print("O banco não é SQLite: o id já vem de uma sequência; nada a alterar.")
+            return
+        with engine.connect() as conn:
+            ddl = conn.exec_driver_sql(
+                "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (TABELA,)
+            ).scalar()
+            if ddl is None:
+                print(f"A tabela '{TABELA}' não existe; nada a alterar.")
+                return
+            if "AUTOINCREMENT" in ddl.upper():
+                print(f"A tabela '{TABELA}' já usa AUTOINCREMENT.")
+                return
+
+            # Fora de uma transação (o SQLite ignora o PRAGMA dentro dela): linhas
+            # antigas de contatos já excluídos também precisam ser copiadas
+            conn.exec_driver_sql("PRAGMA foreign_keys=OFF")
+            # A recriação inteira é uma transação: se falhar, a tabela original fica
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+            try:
+                print(f"Recriando a tabela '{TABELA}' com AUTOINCREMENT...")
+                recriar(conn)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        print("Migração concluída com sucesso!")
+
+    except Exception as e:
+        print(f"Erro durante a migração: {str(e)}")
+        raise
+    finally:
+        engine.dispose()
+
+if __name__ == "__main__":
+    print("Iniciando migração...")
+    upgrade()
+    print("Migração finalizada.")
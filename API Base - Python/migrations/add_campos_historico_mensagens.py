@@ -0,0 +1,56 @@
+from sqlalchemy import Integer, String, Text, inspect, text
+from sqlalchemy.orm import sessionmaker
+import sys
+import os
+
+# Adiciona o diretório raiz ao path para importar o módulo database
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import criar_engine, HistoricoMensagem
+
+# Colunas gravadas pelo histórico de envios (service/historico.py)
+NOVAS_COLUNAS = {
+    "contato_id": Integer(),
+    "mensagem_agendada_id": Integer(),
+    "latencia_ms": Integer(),
+    "provider_id": String(),
+    "erro": Text(),
+}
+
+def upgrade():
+    # Cria uma conexão com o banco de dados
+    engine = criar_engine()
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = SessionLocal()
+
+    try:
+        # Bancos sem a tabela: ela é criada já com todas as colunas
+        HistoricoMensagem.__table__.create(bind=engine, checkfirst=True)
+        columns = [coluna["name"] for coluna in inspect(engine).get_columns("historico_mensagens")]
+
+        for coluna, tipo in NOVAS_COLUNAS.items():
+            if coluna not in columns:
+                print(f"Adicionando a coluna '{coluna}' à tabela 'historico_mensagens'...")
+                tipo_sql = tipo.compile(dialect=engine.dialect)
+                db.execute(text(f"ALTER TABLE historico_mensagens ADD COLUMN {coluna} {tipo_sql}"))
+            else:
+                print(f"A coluna '{coluna}' já existe na tabela 'historico_mensagens'.")
+        db.commit()
+
+        # Índices das consultas de /historico (por contato e por período)
+        for indice in sorted(HistoricoMensagem.__table__.indexes, key=lambda i: i.name):
+            print(f"Criando o índice '{indice.name}' (se não existir)...")
+            indice.create(bind=engine, checkfirst=True)
+        print("Migração concluída com sucesso!")
+
+    except Exception as e:
+        db.rollback()
+        print(f"Erro durante a migração: {str(e)}")
+        raise
+    finally:
+        db.close()
+        engine.dispose()
+
+if __name__ == "__main__":
+    print("Iniciando migração...")
+    upgrade()
+    print("Migração finalizada.")
@@ -1,25 +1,21 @@
-from sqlalchemy import create_engine, text
+from sqlalchemy import inspect, text
 from sqlalchemy.orm import sessionmaker
 import sys
 import os
 
 # Adiciona o diretório raiz ao path para importar o módulo database
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from database import SQLALCHEMY_DATABASE_URL
+from database import criar_engine
 
 def upgrade():
     # Cria uma conexão com o banco de dados
-    engine = create_engine(SQLALCHEMY_DATABASE_URL)
+    engine = criar_engine()
     SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
     db = SessionLocal()
 
     try:
-        # Verifica se a coluna já existe
-        result = db.execute(text("""
-            PRAGMA table_info(mensagens_agendadas)
-        """))
-        
-        columns = [row[1] for row in result.fetchall()]
+        # Verifica se a coluna já existe (inspector: funciona no SQLite e no PostgreSQL)
+        columns = [coluna["name"] for coluna in inspect(engine).get_columns("mensagens_agendadas")]
         
         if 'contato_id' not in columns:
             print("Adicionando a coluna 'contato_id' à tabela 'mensagens_agendadas'...")
@@ -42,6 +38,7 @@ def upgrade():
         raise
     finally:
         db.close()
+        engine.dispose()
 
 if __name__ == "__main__":
     print("Iniciando migração...")
@@ -0,0 +1,29 @@
+import sys
+import os
+
+# Adiciona o diretório raiz ao path para importar o módulo database
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import criar_engine, MensagemAgendada
+
+def upgrade():
+    # Cria uma conexão com o banco de dados
+    engine = criar_engine()
+
+    try:
+        # Cria os índices declarados no modelo que ainda não existem no banco
+        # (os parciais, marcados com ddl_if, só são criados no PostgreSQL)
+        for indice in sorted(MensagemAgendada.__table__.indexes, key=lambda i: i.name):
+            print(f"Criando o índice '{indice.name}' (se não existir)...")
+            indice.create(bind=engine, checkfirst=True)
+        print("Migração concluída com sucesso!")
+
+    except Exception as e:
+        print(f"Erro durante a migração: {str(e)}")
+        raise
+    finally:
+        engine.dispose()
+
+if __name__ == "__main__":
+    print("Iniciando migração...")
+    upgrade()
+    print("Migração finalizada.")
@@ -0,0 +1,49 @@
+from sqlalchemy import DateTime, String, inspect, text
+from sqlalchemy.orm import sessionmaker
+import sys
+import os
+
+# Adiciona o diretório raiz ao path para importar o módulo database
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import criar_engine
+
+# Colunas usadas pelo despachante para reivindicar lotes de mensagens
+NOVAS_COLUNAS = {
+    "worker_id": String(),
+    "lease_expira_em": DateTime(),
+}
+
+def upgrade():
+    # Cria uma conexão com o banco de dados
+    engine = criar_engine()
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = SessionLocal()
+
+    try:
+        # Verifica quais colunas já existem (inspector: funciona no SQLite e no PostgreSQL)
+        columns = [coluna["name"] for coluna in inspect(engine).get_columns("mensagens_agendadas")]
+
+        for coluna, tipo in NOVAS_COLUNAS.items():
+            if coluna not in columns:
+                print(f"Adicionando a coluna '{coluna}' à tabela 'mensagens_agendadas'...")
+                # O tipo é compilado para o banco em uso (DATETIME no SQLite, TIMESTAMP no PostgreSQL)
+                tipo_sql = tipo.compile(dialect=engine.dialect)
+                db.execute(text(f"ALTER TABLE mensagens_agendadas ADD COLUMN {coluna} {tipo_sql}"))
+            else:
+                print(f"A coluna '{coluna}' já existe na tabela 'mensagens_agendadas'.")
+
+        db.commit()
+        print("Migração concluída com sucesso!")
+
+    except Exception as e:
+        db.rollback()
+        print(f"Erro durante a migração: {str(e)}")
+        raise
+    finally:
+        db.close()
+        engine.dispose()
+
+if __name__ == "__main__":
+    print("Iniciando migração...")
+    upgrade()
+    print("Migração finalizada.")
@@ -0,0 +1,65 @@
+from sqlalchemy import DateTime, String, inspect, text
+from sqlalchemy.orm import sessionmaker
+import sys
+import os
+
+# Adiciona o diretório raiz ao path para importar o módulo database
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import criar_engine, MensagemAgendada
+
+# Colunas das retentativas (service/retentativa.py), por tabela. As linhas
+# existentes ficam com 0 tentativas
+NOVAS_COLUNAS = {
+    "mensagens_agendadas": {
+        "tentativas": "INTEGER NOT NULL DEFAULT 0",
+        "proximo_envio_em": DateTime(),
+        "classe_erro": String(),
+    },
+    "mensagens_agendadas_arquivo": {
+        "tentativas": "INTEGER NOT NULL DEFAULT 0",
+        "classe_erro": String(),
+    },
+}
+
+def upgrade():
+    # Cria uma conexão com o banco de dados
+    engine = criar_engine()
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = SessionLocal()
+
+    try:
+        inspetor = inspect(engine)
+        for tabela, novas in NOVAS_COLUNAS.items():
+            # O arquivo só existe depois de add_arquivamento (ou do create_all)
+            if not inspetor.has_table(tabela):
+                print(f"A tabela '{tabela}' não existe; nada a alterar.")
+                continue
+            columns = [coluna["name"] for coluna in inspetor.get_columns(tabela)]
+
+            for coluna, tipo in novas.items():
+                if coluna not in columns:
+                    print(f"Adicionando a coluna '{coluna}' à tabela '{tabela}'...")
+                    tipo_sql = tipo if isinstance(tipo, str) else tipo.compile(dialect=engine.dialect)
+                    db.execute(text(f"ALTER TABLE {tabela} ADD COLUMN {coluna} {tipo_sql}"))
+                else:
+                    print(f"A coluna '{coluna}' já existe na tabela '{tabela}'.")
+        db.commit()
+
+        # Índices da fila de retentativas (os parciais só no PostgreSQL)
+        for indice in sorted(MensagemAgendada.__table__.indexes, key=lambda i: i.name):
+            print(f"Criando o índice '{indice.name}' (se não existir)...")
+            indice.create(bind=engine, checkfirst=True)
+        print("Migração concluída com sucesso!")
+
+    except Exception as e:
+        db.rollback()
+        print(f"Erro durante a migração: {str(e)}")
+        raise
+    finally:
+        db.close()
+        engine.dispose()
+
+if __name__ == "__main__":
+    print("Iniciando migração...")
+    upgrade()
+    print("Migração finalizada.")
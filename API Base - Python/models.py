@@ -1,7 +1,7 @@
 # models.py
 from pydantic import BaseModel, Field, EmailStr, field_validator
 from typing import Optional, List
-from datetime import datetime
+from datetime import date, datetime
 from validators import (
     validar_nome, 
     validar_telefone, 
@@ -117,6 +117,11 @@ class HistoricoBase(BaseModel):
 class HistoricoOut(HistoricoBase):
     id: int
     data_envio: datetime
+    contato_id: Optional[int] = None
+    mensagem_agendada_id: Optional[int] = Field(None, description="Agendamento de origem; nulo em envios imediatos")
+    latencia_ms: Optional[int] = Field(None, example=180, description="Duração da chamada ao provedor")
+    provider_id: Optional[str] = Field(None, description="Message-ID do email ou SID do Twilio")
+    erro: Optional[str] = None
     
     class Config:
         from_attributes = True
@@ -175,6 +180,57 @@ class MensagemAgendadaOut(BaseModel):
     criado_em: datetime
     enviado_em: Optional[datetime]
     erro_mensagem: Optional[str]
+    tentativas: int = 0
+    proximo_envio_em: Optional[datetime] = None
+    classe_erro: Optional[str] = None
     
     class Config:
         from_attributes = True
+
+
+# ---- Páginas das listagens (paginação por cursor, ver paginacao.py) ----
+class PaginaContatos(BaseModel):
+    itens: List[Contact]
+    next_cursor: Optional[str] = Field(None, description="Cursor da próxima página; nulo na última")
+
+class PaginaAgendamentos(BaseModel):
+    itens: List[MensagemAgendadaOut]
+    next_cursor: Optional[str] = Field(None, description="Cursor da próxima página; nulo na última")
+
+class MensagemArquivadaOut(MensagemAgendadaOut):
+    contato_id: int
+    arquivado_em: datetime
+
+class PaginaAgendamentosArquivados(BaseModel):
+    itens: List[MensagemArquivadaOut]
+    next_cursor: Optional[str] = Field(None, description="Cursor da próxima página; nulo na última")
+
+class ResumoEnvioDiarioOut(BaseModel):
+    dia: date
+    canal: str = Field(..., example="email")
+    status: str = Field(..., example="ENVIADO")
+    quantidade: int
+
+    class Config:
+        from_attributes = True
+
+class PaginaHistorico(BaseModel):
+    itens: List[HistoricoOut]
+    next_cursor: Optional[str] = Field(None, description="Cursor da próxima página; nulo na última")
+
+
+# ---- Jobs de importação/exportação (ver service/jobs.py) ----
+class JobOut(BaseModel):
+    id: str
+    tipo: str = Field(..., example="importacao_contatos")
+    status: str = Field(..., example="EXECUTANDO", description="PENDENTE, EXECUTANDO, CONCLUIDO ou ERRO")
+    criado_em: datetime
+    iniciado_em: Optional[datetime] = None
+    concluido_em: Optional[datetime] = None
+    processadas: int = Field(0, description="Linhas processadas até agora")
+    erros: int = Field(0, description="Linhas recusadas até agora")
+    amostra_erros: List[str] = []
+    linhas_por_segundo: Optional[float] = None
+    resultado: Optional[dict] = None
+    mensagem: Optional[str] = Field(None, description="Motivo da falha, quando status é ERRO")
+    download: Optional[str] = Field(None, description="URL do arquivo gerado, quando houver")
@@ -0,0 +1,100 @@
+import base64
+import binascii
+import json
+import os
+from datetime import datetime
+from typing import Optional, Sequence, Tuple
+
+from sqlalchemy import tuple_
+
+# Tamanho de página usado quando o cliente não informa `limit`
+TAMANHO_PAGINA_PADRAO = int(os.getenv("PAGINACAO_TAMANHO_PADRAO", "100"))
+# Maior página aceita; valores maiores são reduzidos a este
+TAMANHO_PAGINA_MAXIMO = int(os.getenv("PAGINACAO_TAMANHO_MAXIMO", "500"))
+
+
+class CursorInvalido(ValueError):
+    """O cursor recebido não foi gerado para esta listagem ou está corrompido."""
+
+
+def tamanho_pagina(limite: Optional[int]) -> int:
+    """Aplica o padrão e o teto de tamanho de página."""
+    if not limite or limite < 1:
+        return TAMANHO_PAGINA_PADRAO
+    return min(limite, TAMANHO_PAGINA_MAXIMO)
+
+
+def codificar_cursor(colunas: Sequence, valores: Sequence) -> str:
+    """Gera o token opaco com a posição do último item da página."""
+    dados = {
+        coluna.key: valor.isoformat() if isinstance(valor, datetime) else valor
+        for coluna, valor in zip(colunas, valores)
+    }
+    return base64.urlsafe_b64encode(json.dumps(dados, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decodificar_cursor(colunas: Sequence, cursor: str) -> list:
+    """Lê o token gerado por `codificar_cursor` para as mesmas colunas de ordenação."""
+    try:
+        dados = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(dados, dict) or set(dados) != {coluna.key for coluna in colunas}:
+            raise CursorInvalido("Cursor inválido para esta listagem.")
+        valores = []
+        for coluna in colunas:
+            valor = dados[coluna.key]
+            if valor is not None and coluna.type.python_type is datetime:
+                valor = datetime.fromisoformat(valor)
+            valores.append(valor)
+        return valores
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError, TypeError, ValueError) as e:
+        if isinstance(e, CursorInvalido):
+            raise
+        raise CursorInvalido("Cursor inválido.") from e
+
+
+def filtrar_apos_cursor(query, colunas: Sequence, cursor: Optional[str], decrescente: bool = False):
+    """
+    Restringe a consulta aos itens depois do cursor e aplica a ordenação.
+
+    `colunas` define a ordem da listagem e deve terminar em uma coluna única
+    (normalmente o id), para que o cursor identifique uma posição exata. A
+    comparação por tupla, ex.: (data_agendamento, id) < (:data, :id), é
+    resolvida pelo mesmo índice da ordenação: qualquer página custa o mesmo
+    que a primeira, ao contrário de OFFSET.
+    """
+    if cursor:
+        chave = tuple_(*colunas)
+        posicao = tuple_(*decodificar_cursor(colunas, cursor))
+        query = query.filter(chave < posicao if decrescente else chave > posicao)
+    return query.order_by(*[coluna.desc() if decrescente else coluna.asc() for coluna in colunas])
+
+
+def paginar(query, colunas: Sequence, cursor: Optional[str] = None,
+            limite: Optional[int] = None, decrescente: bool = False) -> Tuple[list, Optional[str]]:
+    """
+    Executa uma página da consulta. Retorna (itens, next_cursor); next_cursor
+    é None na última página.
+    """
+    limite = tamanho_pagina(limite)
+    # Um item a mais indica se existe próxima página sem precisar de COUNT
+    itens = filtrar_apos_cursor(query, colunas, cursor, decrescente).limit(limite + 1).all()
+    return _fechar_pagina(itens, colunas, limite)
+
+
+async def paginar_async(db, consulta, colunas: Sequence, cursor: Optional[str] = None,
+                        limite: Optional[int] = None, decrescente: bool = False) -> Tuple[list, Optional[str]]:
+    """
+    Como paginar, para um select() de entidade executado em uma AsyncSession.
+    """
+    limite = tamanho_pagina(limite)
+    consulta = filtrar_apos_cursor(consulta, colunas, cursor, decrescente).limit(limite + 1)
+    itens = (await db.scalars(consulta)).all()
+    return _fechar_pagina(itens, colunas, limite)
+
+
+def _fechar_pagina(itens: list, colunas: Sequence, limite: int) -> Tuple[list, Optional[str]]:
+    if len(itens) <= limite:
+        return itens, None
+    itens = itens[:limite]
+    ultimo = itens[-1]
+    return itens, codificar_cursor(colunas, [getattr(ultimo, coluna.key) for coluna in colunas])
@@ -6,6 +6,14 @@ from auth import get_password_hash
 def reset_database():
     # Fechar todas as conexões existentes
     if os.path.exists("sql_app.db"):
+        # Com WAL, leva o conteúdo do sql_app.db-wal para o arquivo principal
+        # antes de renomeá-lo; um -wal antigo não pode ficar ao lado do banco novo
+        with engine.connect() as conexao:
+            conexao.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+        engine.dispose()
+        for sufixo in ("-wal", "-shm"):
+            if os.path.exists("sql_app.db" + sufixo):
+                os.remove("sql_app.db" + sufixo)
         try:
             os.rename("sql_app.db", "sql_app.db.bak")
             print("Banco de dados antigo renomeado para sql_app.db.bak")
@@ -3,25 +3,27 @@ from typing import Any
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from database import SessionLocal, User
+from database import User
 import schemas
 from auth import (
-    authenticate_user,
+    authenticate_user_async,
     create_access_token,
-    get_password_hash,
+    get_password_hash_async,
     get_current_active_user,
     ACCESS_TOKEN_EXPIRE_MINUTES,
 )
-from dependencies import get_db
+from dependencies import get_async_db
+from executor_senhas import FilaDeHashCheia
 
 router = APIRouter(prefix="/auth", tags=["authentication"])
 
 @router.post("/token", response_model=schemas.Token)
 async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Autentica o usuário e retorna um token de acesso.
@@ -32,7 +34,14 @@ async def login_for_access_token(
     
     Os campos client_id e client_secret podem ser deixados em branco.
     """
-    user = authenticate_user(db, form_data.username, form_data.password)
+    try:
+        user = await authenticate_user_async(db, form_data.username, form_data.password)
+    except FilaDeHashCheia:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Muitas tentativas de login simultâneas. Tente novamente em instantes.",
+            headers={"Retry-After": "1"},
+        )
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -50,13 +59,13 @@ async def login_for_access_token(
 @router.post("/register", response_model=schemas.UserOut, status_code=status.HTTP_201_CREATED)
 async def register_user(
     user: schemas.UserCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Registra um novo usuário no sistema.
     """
     # Verifica se o usuário já existe
-    db_user = db.query(User).filter(User.username == user.username).first()
+    db_user = await db.scalar(select(User).where(User.username == user.username))
     if db_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -64,7 +73,7 @@ async def register_user(
         )
     
     # Verifica se o email já está em uso
-    db_email = db.query(User).filter(User.email == user.email).first()
+    db_email = await db.scalar(select(User).where(User.email == user.email))
     if db_email:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -72,7 +81,14 @@ async def register_user(
         )
     
     # Cria o novo usuário
-    hashed_password = get_password_hash(user.password)
+    try:
+        hashed_password = await get_password_hash_async(user.password)
+    except FilaDeHashCheia:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Muitos cadastros simultâneos. Tente novamente em instantes.",
+            headers={"Retry-After": "1"},
+        )
     db_user = User(
         username=user.username,
         email=user.email,
@@ -82,8 +98,8 @@ async def register_user(
     )
     
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     
     return db_user
 
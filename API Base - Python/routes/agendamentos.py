@@ -1,14 +1,24 @@
+import logging
 from fastapi import APIRouter, Query, HTTPException, Depends, status
 from typing import List, Optional
-from sqlalchemy.orm import Session
-from datetime import datetime, timezone
+from sqlalchemy import bindparam, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from datetime import date, datetime, timezone
 import pytz
 
-from database import SessionLocal, MensagemAgendada, User
-from models import MensagemAgendadaCreate, MensagemAgendadaUpdate, MensagemAgendadaOut
+from database import MensagemAgendada, MensagemAgendadaArquivada, ResumoEnvioDiario, User
+from models import (
+    MensagemAgendadaCreate, MensagemAgendadaUpdate, MensagemAgendadaOut, PaginaAgendamentos,
+    PaginaAgendamentosArquivados, ResumoEnvioDiarioOut,
+)
 from auth import get_current_active_user
-from dependencies import get_db
-from service.agendamento_service import AgendamentoService
+from dependencies import get_async_db
+from paginacao import CursorInvalido, TAMANHO_PAGINA_MAXIMO, TAMANHO_PAGINA_PADRAO, paginar_async
+from service.agendamento_service import AgendamentoService, STATUS_AGENDADO, STATUS_RETENTATIVA
+from service import despertador
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/agendamentos", tags=["Agendamentos"])
 
@@ -17,23 +27,21 @@ router = APIRouter(prefix="/agendamentos", tags=["Agendamentos"])
 async def criar_agendamento(
     mensagem: MensagemAgendadaCreate,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
-        print(f"Recebida solicitação para criar agendamento: {mensagem}")
+        logger.debug("Recebida solicitação para criar agendamento: %s", mensagem)
         
         # Busca o contato no banco de dados
         from database import Contact
         
-        print(f"Buscando contato com ID: {mensagem.contact_id}")
-        contato = db.query(Contact).filter(Contact.id == mensagem.contact_id).first()
+        contato = await db.get(Contact, mensagem.contact_id)
         
         if not contato:
             error_msg = f"Contato com ID {mensagem.contact_id} não encontrado"
-            print(error_msg)
+            logger.info(error_msg)
             raise HTTPException(status_code=404, detail=error_msg)
         
-        print(f"Contato encontrado: {contato.name} ({contato.email})")
         
         # Define o destinatário com base no canal escolhido
         canal = mensagem.canal.lower()
@@ -41,17 +49,17 @@ async def criar_agendamento(
             destinatario = contato.email
             if not destinatario:
                 error_msg = f"O contato {contato.name} não possui um e-mail cadastrado"
-                print(error_msg)
+                logger.info(error_msg)
                 raise HTTPException(status_code=400, detail=error_msg)
         elif canal == "whatsapp":
             destinatario = contato.phone
             if not destinatario:
                 error_msg = f"O contato {contato.name} não possui um telefone cadastrado"
-                print(error_msg)
+                logger.info(error_msg)
                 raise HTTPException(status_code=400, detail=error_msg)
         else:
             error_msg = "Canal inválido. Use 'email' ou 'whatsapp'."
-            print(error_msg)
+            logger.info(error_msg)
             raise HTTPException(status_code=400, detail=error_msg)
 
         # Valida se a data de agendamento é futura
@@ -65,25 +73,27 @@ async def criar_agendamento(
         
         if data_agendamento <= agora:
             error_msg = f"A data de agendamento deve ser no futuro. Data atual: {agora}, Data fornecida: {data_agendamento}"
-            print(error_msg)
+            logger.info(error_msg)
             raise HTTPException(status_code=400, detail=error_msg)
         
         # Cria o agendamento no banco
-        print(f"Criando agendamento para {destinatario} no canal {canal}")
         db_mensagem = MensagemAgendada(
             canal=canal,
             destinatario=destinatario,
             assunto=mensagem.assunto,
             conteudo=mensagem.conteudo,
-            data_agendamento=data_agendamento,
+            # A coluna não guarda fuso: grava o horário local, como o SQLite e
+            # o psycopg2 já faziam ao descartar o offset (o asyncpg recusa o valor com fuso)
+            data_agendamento=data_agendamento.replace(tzinfo=None),
             contato_id=contato.id
         )
         
         db.add(db_mensagem)
-        db.commit()
-        db.refresh(db_mensagem)
+        await db.commit()
+        await db.refresh(db_mensagem)
+        await run_in_threadpool(despertador.notificar, db_mensagem.data_agendamento)
         
-        print(f"Agendamento criado com sucesso: ID {db_mensagem.id}")
+        logger.info("Agendamento criado: ID %s (%s, %s)", db_mensagem.id, canal, db_mensagem.data_agendamento)
         return db_mensagem
         
     except HTTPException:
@@ -92,76 +102,158 @@ async def criar_agendamento(
     except Exception as e:
         # Captura outros erros inesperados
         error_msg = f"Erro ao criar agendamento: {str(e)}"
-        print(error_msg)
-        db.rollback()  # Desfaz qualquer alteração no banco de dados
+        logger.exception(error_msg)
+        await db.rollback()  # Desfaz qualquer alteração no banco de dados
         raise HTTPException(
             status_code=500,
             detail=error_msg
         )
 
 
-@router.get("/", response_model=List[MensagemAgendadaOut])
+# Ordem das listagens: mais recentes primeiro, id desempata agendamentos no mesmo horário
+ORDEM_LISTAGEM = [MensagemAgendada.data_agendamento, MensagemAgendada.id]
+
+
+async def _pagina_agendamentos(db: AsyncSession, consulta, cursor: Optional[str], limit: int,
+                              decrescente: bool = True) -> dict:
+    try:
+        itens, proximo = await paginar_async(db, consulta, ORDEM_LISTAGEM, cursor, limit, decrescente=decrescente)
+    except CursorInvalido as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"itens": itens, "next_cursor": proximo}
+
+
+@router.get("/", response_model=PaginaAgendamentos)
 async def listar_agendamentos(
     status: str = None,
-    skip: int = 0,
-    limit: int = 100,
+    cursor: Optional[str] = None,
+    limit: int = Query(TAMANHO_PAGINA_PADRAO, ge=1, le=TAMANHO_PAGINA_MAXIMO),
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Lista todos os agendamentos.
+    Lista todos os agendamentos, do mais recente para o mais antigo.
     
     Parâmetros:
-    - **status**: Filtra por status (AGENDADO, ENVIADO, CANCELADO, ERRO)
-    - **skip**: Número de registros para pular (paginação)
+    - **status**: Filtra por status (AGENDADO, RETENTATIVA, ENVIADO, CANCELADO, ERRO, ESGOTADO)
+    - **cursor**: `next_cursor` da página anterior (omita para a primeira página)
     - **limit**: Número máximo de registros a retornar
     """
-    query = db.query(MensagemAgendada)
+    consulta = select(MensagemAgendada)
     
     if status:
-        query = query.filter(MensagemAgendada.status == status.upper())
+        consulta = consulta.where(MensagemAgendada.status == status.upper())
     
-    mensagens = query.order_by(MensagemAgendada.data_agendamento.desc()).offset(skip).limit(limit).all()
-    return mensagens
+    return await _pagina_agendamentos(db, consulta, cursor, limit)
 
-@router.get("/consulta", response_model=List[MensagemAgendadaOut])
+@router.get("/consulta", response_model=PaginaAgendamentos)
 async def consulta_agendamentos(
     contact_id: Optional[int] = None,
     status: Optional[str] = None,
-    skip: int = 0,
-    limit: int = 100,
+    cursor: Optional[str] = None,
+    limit: int = Query(TAMANHO_PAGINA_PADRAO, ge=1, le=TAMANHO_PAGINA_MAXIMO),
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Consulta agendamentos filtrando por ID do contato e/ou status.
     
     Parâmetros:
     - **contact_id**: ID do contato para filtrar os agendamentos
-    - **status**: Status para filtrar (AGENDADO, ENVIADO, CANCELADO, ERRO)
-    - **skip**: Número de registros para pular (paginação)
+    - **status**: Status para filtrar (AGENDADO, RETENTATIVA, ENVIADO, CANCELADO, ERRO, ESGOTADO)
+    - **cursor**: `next_cursor` da página anterior (omita para a primeira página)
     - **limit**: Número máximo de registros a retornar (padrão: 100)
     """
-    query = db.query(MensagemAgendada)
+    consulta = select(MensagemAgendada)
 
     if contact_id is not None:
-        query = query.filter(MensagemAgendada.contato_id == contact_id)
+        consulta = consulta.where(MensagemAgendada.contato_id == contact_id)
     if status:
-        query = query.filter(MensagemAgendada.status == status.upper())
+        consulta = consulta.where(MensagemAgendada.status == status.upper())
+
+    return await _pagina_agendamentos(db, consulta, cursor, limit)
 
-    resultados = query.order_by(MensagemAgendada.data_agendamento.desc()).offset(skip).limit(limit).all()
-    return resultados
+
+# Declaradas antes de /{agendamento_id}, que capturaria "arquivo" como id
+@router.get("/arquivo", response_model=PaginaAgendamentosArquivados)
+async def listar_agendamentos_arquivados(
+    contact_id: Optional[int] = None,
+    status: Optional[str] = None,
+    inicio: Optional[datetime] = None,
+    fim: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(TAMANHO_PAGINA_PADRAO, ge=1, le=TAMANHO_PAGINA_MAXIMO),
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Consulta (somente leitura) as mensagens arquivadas: finalizadas há mais de
+    ARQUIVAMENTO_DIAS dias e removidas da listagem principal.
+    
+    Parâmetros:
+    - **contact_id**: ID do contato para filtrar
+    - **status**: Status para filtrar (ENVIADO, CANCELADO, ERRO, ESGOTADO)
+    - **inicio** / **fim**: Intervalo de data_agendamento (início inclusive, fim exclusive)
+    - **cursor**: `next_cursor` da página anterior (omita para a primeira página)
+    - **limit**: Número máximo de registros a retornar
+    """
+    consulta = select(MensagemAgendadaArquivada)
+
+    if contact_id is not None:
+        consulta = consulta.where(MensagemAgendadaArquivada.contato_id == contact_id)
+    if status:
+        consulta = consulta.where(MensagemAgendadaArquivada.status == status.upper())
+    # data_agendamento não guarda fuso: compara com o horário informado, sem o offset
+    if inicio:
+        consulta = consulta.where(MensagemAgendadaArquivada.data_agendamento >= inicio.replace(tzinfo=None))
+    if fim:
+        consulta = consulta.where(MensagemAgendadaArquivada.data_agendamento < fim.replace(tzinfo=None))
+
+    try:
+        itens, proximo = await paginar_async(
+            db, consulta, [MensagemAgendadaArquivada.data_agendamento, MensagemAgendadaArquivada.id],
+            cursor, limit, decrescente=True,
+        )
+    except CursorInvalido as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"itens": itens, "next_cursor": proximo}
+
+@router.get("/arquivo/resumo", response_model=List[ResumoEnvioDiarioOut])
+async def resumo_agendamentos_arquivados(
+    inicio: Optional[date] = None,
+    fim: Optional[date] = None,
+    canal: Optional[str] = None,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Totais diários das mensagens arquivadas, por canal e status.
+    
+    Parâmetros:
+    - **inicio** / **fim**: Intervalo de dias (ambos inclusive)
+    - **canal**: Filtra por canal (email, whatsapp)
+    """
+    consulta = select(ResumoEnvioDiario).order_by(
+        ResumoEnvioDiario.dia, ResumoEnvioDiario.canal, ResumoEnvioDiario.status
+    )
+    if inicio:
+        consulta = consulta.where(ResumoEnvioDiario.dia >= inicio)
+    if fim:
+        consulta = consulta.where(ResumoEnvioDiario.dia <= fim)
+    if canal:
+        consulta = consulta.where(ResumoEnvioDiario.canal == canal.lower())
+    return (await db.scalars(consulta)).all()
 
 @router.get("/{agendamento_id}", response_model=MensagemAgendadaOut)
 async def obter_agendamento(
     agendamento_id: int,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Obtém detalhes de um agendamento específico.
     """
-    mensagem = db.query(MensagemAgendada).filter(MensagemAgendada.id == agendamento_id).first()
+    mensagem = await db.get(MensagemAgendada, agendamento_id)
     
     if not mensagem:
         raise HTTPException(status_code=404, detail="Agendamento não encontrado.")
@@ -174,13 +266,13 @@ async def atualizar_agendamento(
     agendamento_id: int,
     mensagem_update: MensagemAgendadaUpdate,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Atualiza um agendamento existente.
     Só é possível atualizar agendamentos com status AGENDADO.
     """
-    mensagem = db.query(MensagemAgendada).filter(MensagemAgendada.id == agendamento_id).first()
+    mensagem = await db.get(MensagemAgendada, agendamento_id)
     
     if not mensagem:
         raise HTTPException(status_code=404, detail="Agendamento não encontrado.")
@@ -205,8 +297,10 @@ async def atualizar_agendamento(
     for key, value in update_data.items():
         setattr(mensagem, key, value)
     
-    db.commit()
-    db.refresh(mensagem)
+    await db.commit()
+    await db.refresh(mensagem)
+    if "data_agendamento" in update_data:
+        await run_in_threadpool(despertador.notificar, mensagem.data_agendamento)
     
     return mensagem
 
@@ -215,17 +309,19 @@ async def atualizar_agendamento(
 async def cancelar_agendamento(
     agendamento_id: int,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Cancela um agendamento.
-    Só é possível cancelar agendamentos com status AGENDADO.
+    Só é possível cancelar agendamentos com status AGENDADO ou RETENTATIVA.
     """
     service = AgendamentoService()
-    sucesso = service.cancelar_agendamento(agendamento_id, db)
+    # run_sync entrega ao serviço a Session síncrona por trás da AsyncSession;
+    # as consultas dele continuam sem bloquear o event loop
+    sucesso = await db.run_sync(lambda sessao: service.cancelar_agendamento(agendamento_id, sessao))
     
     if not sucesso:
-        mensagem = db.query(MensagemAgendada).filter(MensagemAgendada.id == agendamento_id).first()
+        mensagem = await db.get(MensagemAgendada, agendamento_id)
         if not mensagem:
             raise HTTPException(status_code=404, detail="Agendamento não encontrado.")
         else:
@@ -234,33 +330,45 @@ async def cancelar_agendamento(
                 detail=f"Não é possível cancelar agendamento com status '{mensagem.status}'."
             )
     
+    await run_in_threadpool(despertador.notificar)
+    
     return {"status": "cancelado", "id": agendamento_id}
 
 
-@router.get("/ativos/listar", response_model=List[MensagemAgendadaOut])
+@router.get("/ativos/listar", response_model=PaginaAgendamentos)
 async def listar_agendamentos_ativos(
+    cursor: Optional[str] = None,
+    limit: int = Query(TAMANHO_PAGINA_PADRAO, ge=1, le=TAMANHO_PAGINA_MAXIMO),
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Lista apenas os agendamentos ativos (status AGENDADO).
-    Ordenados por data de agendamento.
+    Lista apenas os agendamentos ativos (status AGENDADO ou RETENTATIVA),
+    por data de agendamento, da mais antiga para a mais recente.
+    
+    Parâmetros:
+    - **cursor**: `next_cursor` da página anterior (omita para a primeira página)
+    - **limit**: Número máximo de registros a retornar
     """
-    service = AgendamentoService()
-    return service.obter_agendamentos_ativos(db)
+    # Status como literais: com parâmetros ($1, $2) um plano genérico do
+    # asyncpg não usaria o índice parcial ix_mensagens_agendadas_ativas
+    ativos = bindparam("ativos", (STATUS_AGENDADO, STATUS_RETENTATIVA), expanding=True, literal_execute=True)
+    consulta = select(MensagemAgendada).where(MensagemAgendada.status.in_(ativos))
+    return await _pagina_agendamentos(db, consulta, cursor, limit, decrescente=False)
 
 
 @router.post("/processar/manual", status_code=status.HTTP_200_OK)
 async def processar_agendamentos_manual(
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Processa manualmente as mensagens agendadas que já passaram do horário.
     Útil para testes ou processamento forçado.
     """
     service = AgendamentoService()
-    processadas = service.processar_mensagens_pendentes()
+    # O processamento usa as próprias sessões síncronas e espera os envios: roda fora do event loop
+    processadas = await run_in_threadpool(service.processar_mensagens_pendentes)
     
     return {
         "status": "processado",
@@ -1,14 +1,22 @@
-from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, status
+import logging
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Query, status
 from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from typing import List, Optional
-from sqlalchemy.orm import Session
-import io, csv
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 
-from database import SessionLocal, Contact, User
-from models import Contact as PydanticContact, ContactBase
+from database import Contact, User
+from models import Contact as PydanticContact, ContactBase, PaginaContatos
 from auth import get_current_active_user
-from dependencies import get_db
+from dependencies import get_async_db
+from paginacao import CursorInvalido, TAMANHO_PAGINA_MAXIMO, TAMANHO_PAGINA_PADRAO, paginar_async
+from service.exportacao_contatos import filtrar_contatos, gerar_csv_contatos
+from service.importacao_contatos import ArquivoInvalido, MODO_ATUALIZAR, MODO_INSERIR, importar_contatos
+from service import jobs
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/contacts", tags=["Contatos"])
 
@@ -16,31 +24,44 @@ router = APIRouter(prefix="/contacts", tags=["Contatos"])
 async def create_contact(
     contact: ContactBase,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    db_contact = db.query(Contact).filter(Contact.email == contact.email).first()
+    db_contact = await db.scalar(select(Contact).where(Contact.email == contact.email))
     if db_contact:
         raise HTTPException(status_code=400, detail="Email já cadastrado.")
     db_contact = Contact(**contact.model_dump())
     db.add(db_contact)
-    db.commit()
-    db.refresh(db_contact)
+    await db.commit()
+    await db.refresh(db_contact)
     return db_contact
 
-@router.get("/", response_model=List[PydanticContact])
+@router.get("/", response_model=PaginaContatos)
 async def list_contacts(
+    cursor: Optional[str] = None,
+    limit: int = Query(TAMANHO_PAGINA_PADRAO, ge=1, le=TAMANHO_PAGINA_MAXIMO),
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    return db.query(Contact).all()
+    """
+    Lista os contatos em ordem de id, uma página por vez.
+
+    Parâmetros:
+    - **cursor**: `next_cursor` da página anterior (omita para a primeira página)
+    - **limit**: Número máximo de contatos na página
+    """
+    try:
+        itens, proximo = await paginar_async(db, select(Contact), [Contact.id], cursor, limit)
+    except CursorInvalido as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"itens": itens, "next_cursor": proximo}
 
 @router.get("/{contact_id}", response_model=PydanticContact)
 async def read_contact(
     contact_id: int,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    contact = db.query(Contact).filter(Contact.id == contact_id).first()
+    contact = await db.get(Contact, contact_id)
     if not contact:
         raise HTTPException(status_code=404, detail="Contato não encontrado.")
     return contact
@@ -50,9 +71,9 @@ async def update_contact(
     contact_id: int,
     contact: ContactBase,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    db_contact = db.query(Contact).filter(Contact.id == contact_id).first()
+    db_contact = await db.get(Contact, contact_id)
     if not db_contact:
         raise HTTPException(status_code=404, detail="Contato não encontrado.")
     db_contact.name = contact.name
@@ -60,21 +81,22 @@ async def update_contact(
     db_contact.phone = contact.phone
     db_contact.codExterno = contact.codExterno
     db_contact.canalPref = contact.canalPref
-    db.commit()
-    db.refresh(db_contact)
+    await db.commit()
+    await db.refresh(db_contact)
     return db_contact
 
 @router.delete("/{contact_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_contact(
     contact_id: int,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    contact = db.query(Contact).filter(Contact.id == contact_id).first()
+    contact = await db.get(Contact, contact_id)
     if not contact:
         raise HTTPException(status_code=404, detail="Contato não encontrado.")
-    db.delete(contact)
-    db.commit()
+    # O cascade para mensagens_agendadas carrega as mensagens do contato dentro do delete
+    await db.delete(contact)
+    await db.commit()
 
 # Exportar CSV
 @router.get("/export/csv")
@@ -82,90 +104,39 @@ async def export_contacts(
     contact_id: Optional[int] = None,
     cliente_id: Optional[int] = None,
     search: Optional[str] = None,
+    gzip: bool = Query(False, description="Compacta o CSV em gzip durante a transmissão"),
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
+    """
+    Exporta os contatos filtrados em CSV, transmitido em blocos conforme é
+    lido do banco (ver service.exportacao_contatos).
+    """
     try:
-        print(f"Iniciando exportação de contatos. Filtros - cliente_id: {cliente_id}, search: {search}")
-        
-        # Inicia a query
-        query = db.query(Contact)
-        print(f"Query inicial criada")
+        logger.debug("Exportando contatos. Filtros - cliente_id: %s, search: %s", cliente_id, search)
         
-        # Aplica filtros
-        if contact_id is not None:
-            print(f"Filtrando por contact_id: {contact_id}")
-            query = query.filter(Contact.id == contact_id)
-        else:
-            if cliente_id is not None:
-                print(f"Aplicando filtro de cliente_id: {cliente_id}")
-                query = query.filter(Contact.cliente_id == cliente_id)
-            
-            if search:
-                search_term = f"%{search}%"
-                print(f"Aplicando filtro de busca: {search}")
-                query = query.filter(
-                    (Contact.name.ilike(search_term)) | 
-                    (Contact.email.ilike(search_term)) |
-                    (Contact.phone.ilike(search_term))
-                )
-        
-        # Executa a query
-        print("Executando query...")
-        contacts = query.all()
-        print(f"Encontrados {len(contacts)} contatos")
-        
-        if not contacts:
-            print("Nenhum contato encontrado com os filtros fornecidos")
+        # Verifica antes de começar a transmitir: depois do primeiro byte não dá mais para responder 404
+        existe = await db.scalar(filtrar_contatos(select(Contact.id), contact_id, cliente_id, search).limit(1))
+        if existe is None:
+            logger.info("Nenhum contato encontrado com os filtros fornecidos")
             raise HTTPException(status_code=404, detail="Nenhum contato encontrado com os filtros fornecidos.")
         
-        # Prepara o CSV
-        print("Preparando CSV...")
-        output = io.StringIO()
-        fieldnames = ["id", "name", "email", "phone", "canalPref", "codExterno", "cliente_id"]
+        # Gera o nome do arquivo com timestamp
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"contatos_{timestamp}.csv.gz" if gzip else f"contatos_{timestamp}.csv"
         
-        try:
-            writer = csv.DictWriter(output, fieldnames=fieldnames)
-            writer.writeheader()
-            
-            # Escreve os dados
-            for contact in contacts:
-                writer.writerow({
-                    "id": contact.id,
-                    "name": contact.name,
-                    "email": contact.email,
-                    "phone": contact.phone or "",
-                    "canalPref": contact.canalPref or "",
-                    "codExterno": contact.codExterno or "",
-                    "cliente_id": contact.cliente_id or ""
-                })
-            
-            output.seek(0)
-            csv_content = output.getvalue()
-            print(f"CSV gerado com sucesso. Tamanho: {len(csv_content)} bytes")
-            
-            # Gera o nome do arquivo com timestamp
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"contatos_{timestamp}.csv"
-            
-            return StreamingResponse(
-                iter([csv_content]),
-                media_type="text/csv",
-                headers={"Content-Disposition": f"attachment; filename={filename}"}
-            )
-            
-        except Exception as e:
-            print(f"Erro ao gerar CSV: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Erro ao gerar o arquivo CSV: {str(e)}")
+        return StreamingResponse(
+            gerar_csv_contatos(contact_id, cliente_id, search, compactar=gzip),
+            media_type="application/gzip" if gzip else "text/csv",
+            headers={"Content-Disposition": f"attachment; filename={filename}"}
+        )
             
     except HTTPException:
         # Re-lança exceções HTTP que já foram tratadas
         raise
         
     except Exception as e:
-        print(f"Erro inesperado ao exportar contatos: {str(e)}")
-        import traceback
-        traceback.print_exc()  # Isso vai imprimir o traceback completo no console
+        logger.exception("Erro inesperado ao exportar contatos")
         raise HTTPException(
             status_code=500,
             detail=f"Ocorreu um erro inesperado: {str(e)}"
@@ -175,112 +146,71 @@ async def export_contacts(
 @router.post("/import/csv")
 async def import_contacts(
     file: UploadFile = File(...),
+    modo: str = Query(
+        MODO_INSERIR,
+        pattern=f"^({MODO_INSERIR}|{MODO_ATUALIZAR})$",
+        description="inserir: recusa emails já cadastrados; atualizar: atualiza o contato com o mesmo email",
+    ),
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
 ):
+    """
+    Importa contatos de um CSV (colunas name e email obrigatórias). O arquivo
+    é processado em lotes (ver service.importacao_contatos) e cada linha
+    recusada aparece em "erros" com o seu número.
+    """
     try:
-        print(f"Iniciando importação de contatos do arquivo: {file.filename}")
+        logger.info("Importando contatos do arquivo %s (modo %s)", file.filename, modo)
         
         # Verifica o tipo do arquivo
         if file.content_type != "text/csv" and not file.filename.lower().endswith('.csv'):
             raise HTTPException(status_code=400, detail="O arquivo deve ser um CSV válido.")
         
-        # Lê o conteúdo do arquivo
-        content = await file.read()
-        try:
-            # Tenta decodificar como UTF-8
-            content_str = content.decode('utf-8')
-        except UnicodeDecodeError:
-            # Se falhar, tenta com outro encoding comum
-            try:
-                content_str = content.decode('latin-1')
-            except Exception as e:
-                raise HTTPException(status_code=400, detail=f"Erro ao ler o arquivo: {str(e)}")
-        
-        # Cria o leitor CSV
-        reader = csv.DictReader(io.StringIO(content_str))
-        
-        # Verifica se os campos obrigatórios estão presentes
-        required_fields = {'name', 'email'}
-        if not required_fields.issubset(reader.fieldnames):
-            missing = required_fields - set(reader.fieldnames)
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Campos obrigatórios ausentes no CSV: {', '.join(missing)}"
-            )
-        
-        imported = 0
-        errors = []
-        
-        # Processa cada linha do CSV
-        for i, row in enumerate(reader, 2):  # Começa da linha 2 (cabeçalho é a linha 1)
-            try:
-                # Remove espaços em branco extras dos valores
-                row = {k: v.strip() if isinstance(v, str) else v for k, v in row.items()}
-                
-                # Cria o dicionário de dados para o contato
-                contact_data = {
-                    'name': row.get('name', '').strip(),
-                    'email': row.get('email', '').strip().lower(),
-                    'phone': row.get('phone', '').strip() or None,
-                    'canalPref': row.get('canalPref', '').strip().lower() or None,
-                    'codExterno': row.get('codExterno', '').strip() or None,
-                }
-                
-                # Converte cliente_id para inteiro se existir
-                if 'cliente_id' in row and row['cliente_id'].strip():
-                    try:
-                        contact_data['cliente_id'] = int(row['cliente_id'])
-                    except (ValueError, TypeError):
-                        contact_data['cliente_id'] = None
-                
-                # Verifica se o email já existe
-                if db.query(Contact).filter(Contact.email == contact_data['email']).first():
-                    print(f"Aviso: Email {contact_data['email']} já existe, pulando...")
-                    errors.append(f"Linha {i}: Email {contact_data['email']} já existe")
-                    continue
-                
-                # Cria e adiciona o contato
-                db_contact = Contact(**contact_data)
-                db.add(db_contact)
-                imported += 1
-                
-                # Faz commit a cada 10 registros para evitar perda de dados em caso de erro
-                if imported % 10 == 0:
-                    db.commit()
-            
-            except Exception as e:
-                error_msg = f"Erro na linha {i}: {str(e)}"
-                print(error_msg)
-                errors.append(error_msg)
-                # Continua processando as próximas linhas mesmo em caso de erro
-                continue
-        
-        # Faz o commit final
-        db.commit()
-        
-        # Prepara a resposta
-        response = {
-            "status": "sucesso",
-            "importados": imported,
-            "total_linhas": imported + len(errors)
-        }
-        
-        if errors:
-            response["erros"] = errors
-            response["status"] = "parcial" if imported > 0 else "erro"
-        
-        print(f"Importação concluída. {imported} contatos importados com sucesso.")
-        return response
+        # Lê o upload em partes, fora do event loop
+        return await run_in_threadpool(importar_contatos, file.file, modo)
     
+    except ArquivoInvalido as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Erro inesperado durante a importação: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Erro inesperado durante a importação")
         raise HTTPException(
             status_code=500,
             detail=f"Ocorreu um erro durante a importação: {str(e)}"
         )
 
+# Importação e exportação em segundo plano: respondem com o id do job, acompanhado em /api/jobs/{job_id}
+@router.post("/import/job", status_code=status.HTTP_202_ACCEPTED)
+async def import_contacts_job(
+    file: UploadFile = File(...),
+    modo: str = Query(MODO_INSERIR, pattern=f"^({MODO_INSERIR}|{MODO_ATUALIZAR})$"),
+    current_user: User = Depends(get_current_active_user),
+):
+    """Agenda a importação de um CSV de contatos (mesmas regras de /import/csv)."""
+    if file.content_type != "text/csv" and not file.filename.lower().endswith('.csv'):
+        raise HTTPException(status_code=400, detail="O arquivo deve ser um CSV válido.")
+    
+    # Disco, Redis (JOBS_ARMAZENAMENTO=redis) e broker ficam fora do event loop
+    arquivo_entrada = await run_in_threadpool(jobs.guardar_arquivo_entrada, file.file)
+    job = await run_in_threadpool(
+        jobs.criar_job, jobs.TIPO_IMPORTACAO, current_user.username,
+        {"modo": modo, "arquivo_entrada": arquivo_entrada},
+    )
+    await run_in_threadpool(jobs.submeter_job, job)
+    logger.info("Importação de %s agendada no job %s", file.filename, job["id"])
+    return {"job_id": job["id"], "status": job["status"], "acompanhar": f"/api/jobs/{job['id']}"}
+
+@router.post("/export/job", status_code=status.HTTP_202_ACCEPTED)
+async def export_contacts_job(
+    contact_id: Optional[int] = None,
+    cliente_id: Optional[int] = None,
+    search: Optional[str] = None,
+    gzip: bool = Query(False, description="Gera o CSV compactado em gzip"),
+    current_user: User = Depends(get_current_active_user),
+):
+    """Agenda a exportação dos contatos filtrados (mesmos filtros de /export/csv)."""
+    parametros = {"contact_id": contact_id, "cliente_id": cliente_id, "search": search, "gzip": gzip}
+    job = await run_in_threadpool(jobs.criar_job, jobs.TIPO_EXPORTACAO, current_user.username, parametros)
+    await run_in_threadpool(jobs.submeter_job, job)
+    logger.info("Exportação de contatos agendada no job %s", job["id"])
+    return {"job_id": job["id"], "status": job["status"], "acompanhar": f"/api/jobs/{job['id']}"}
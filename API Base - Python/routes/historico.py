@@ -0,0 +1,78 @@
+import logging
+from datetime import datetime, timezone
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from auth import get_current_active_user
+from database import HistoricoMensagem, User
+from dependencies import get_async_db
+from models import PaginaHistorico
+from paginacao import CursorInvalido, TAMANHO_PAGINA_MAXIMO, TAMANHO_PAGINA_PADRAO, paginar_async
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/historico", tags=["Histórico"])
+
+# Mais recentes primeiro; o id desempata envios no mesmo instante. Com ou sem
+# contact_id, a ordem é a de um índice (contato_id, data_envio) ou (data_envio)
+ORDEM_HISTORICO = [HistoricoMensagem.data_envio, HistoricoMensagem.id]
+
+
+def _utc(data: Optional[datetime]) -> Optional[datetime]:
+    # data_envio é gravada em UTC sem fuso; datas com fuso são convertidas
+    if data is None or data.tzinfo is None:
+        return data
+    return data.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+@router.get("/", response_model=PaginaHistorico)
+async def listar_historico(
+    contact_id: Optional[int] = None,
+    inicio: Optional[datetime] = None,
+    fim: Optional[datetime] = None,
+    canal: Optional[str] = None,
+    status: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(TAMANHO_PAGINA_PADRAO, ge=1, le=TAMANHO_PAGINA_MAXIMO),
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Lista o histórico de envios (imediatos e agendados), do mais recente para o mais antigo.
+
+    Os envios aparecem aqui alguns segundos depois de acontecerem: o histórico
+    é gravado em lotes (HISTORICO_INTERVALO_SEGUNDOS).
+
+    Parâmetros:
+    - **contact_id**: Filtra pelos envios de um contato
+    - **inicio**: Envios a partir desta data/hora (inclusive; UTC se não tiver fuso)
+    - **fim**: Envios antes desta data/hora (exclusive)
+    - **canal**: Filtra por canal (email, whatsapp)
+    - **status**: Filtra por resultado (ENVIADO, ERRO)
+    - **cursor**: `next_cursor` da página anterior (omita para a primeira página)
+    - **limit**: Número máximo de registros a retornar
+    """
+    inicio, fim = _utc(inicio), _utc(fim)
+    if inicio and fim and inicio >= fim:
+        raise HTTPException(status_code=400, detail="'inicio' deve ser anterior a 'fim'.")
+
+    consulta = select(HistoricoMensagem)
+    if contact_id is not None:
+        consulta = consulta.where(HistoricoMensagem.contato_id == contact_id)
+    if inicio:
+        consulta = consulta.where(HistoricoMensagem.data_envio >= inicio)
+    if fim:
+        consulta = consulta.where(HistoricoMensagem.data_envio < fim)
+    if canal:
+        consulta = consulta.where(HistoricoMensagem.canal == canal.lower())
+    if status:
+        consulta = consulta.where(HistoricoMensagem.status == status.upper())
+
+    try:
+        itens, proximo = await paginar_async(db, consulta, ORDEM_HISTORICO, cursor, limit, decrescente=True)
+    except CursorInvalido as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"itens": itens, "next_cursor": proximo}
@@ -0,0 +1,60 @@
+import os
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse
+from starlette.concurrency import run_in_threadpool
+
+from database import User
+from models import JobOut
+from auth import get_current_active_user
+from service.jobs import STATUS_CONCLUIDO, TIPO_EXPORTACAO, caminho_arquivo, obter_job
+
+router = APIRouter(prefix="/jobs", tags=["Jobs"])
+
+
+async def _job_do_usuario(job_id: str, current_user: User) -> dict:
+    # Com JOBS_ARMAZENAMENTO=redis a leitura é uma chamada síncrona ao Redis
+    job = await run_in_threadpool(obter_job, job_id)
+    # Jobs de outros usuários também respondem 404, sem revelar que existem
+    if job is None or job["usuario"] != current_user.username:
+        raise HTTPException(status_code=404, detail="Job não encontrado ou expirado.")
+    return job
+
+
+@router.get("/{job_id}", response_model=JobOut)
+async def obter_status_job(
+    job_id: str,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Retorna o andamento de um job de importação ou exportação: linhas
+    processadas, erros, vazão e, ao terminar, o resultado e o link de download.
+    """
+    job = await _job_do_usuario(job_id, current_user)
+    if job["status"] == STATUS_CONCLUIDO and job["arquivo"]:
+        job["download"] = f"/api/jobs/{job_id}/download"
+    return job
+
+
+@router.get("/{job_id}/download")
+async def baixar_arquivo_job(
+    job_id: str,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Baixa o arquivo gerado pelo job: o CSV exportado ou, na importação, o
+    relatório com todas as linhas recusadas.
+    """
+    job = await _job_do_usuario(job_id, current_user)
+    if job["status"] != STATUS_CONCLUIDO or not job["arquivo"]:
+        raise HTTPException(status_code=409, detail="O job não gerou arquivo ou ainda não terminou.")
+    caminho = caminho_arquivo(job["arquivo"])
+    if not os.path.exists(caminho):
+        raise HTTPException(status_code=404, detail="Arquivo do job expirado.")
+
+    if job["tipo"] == TIPO_EXPORTACAO:
+        nome = f"contatos_{job_id}.csv.gz" if job["arquivo"].endswith(".gz") else f"contatos_{job_id}.csv"
+    else:
+        nome = f"erros_importacao_{job_id}.csv"
+    media_type = "application/gzip" if nome.endswith(".gz") else "text/csv"
+    return FileResponse(caminho, media_type=media_type, filename=nome)
@@ -1,12 +1,19 @@
+import logging
+import time
 from fastapi import APIRouter, HTTPException, Depends, status
 from typing import Optional
-from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 
-from database import SessionLocal, User
+from database import User, MensagemAgendada
 from auth import get_current_active_user
-from dependencies import get_db
+from dependencies import get_async_db
 from service.mensagem_service import MensagemService
-from service.scheduler import agendar_envio
+from service import despertador
+from service.historico import registrar_envio
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/mensagens", tags=["Mensagens"])
 
@@ -17,20 +24,18 @@ async def enviar_mensagem(
     conteudo: str,
     assunto: Optional[str] = None,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     # Busca o contato no banco de dados
     from database import Contact
     
-    print(f"Buscando contato com ID: {contact_id}")
-    contato = db.query(Contact).filter(Contact.id == contact_id).first()
+    contato = await db.get(Contact, contact_id)
     
     if not contato:
         error_msg = f"Contato com ID {contact_id} não encontrado"
-        print(error_msg)
+        logger.info(error_msg)
         raise HTTPException(status_code=404, detail=error_msg)
     
-    print(f"Contato encontrado: {contato.name} ({contato.email})")
     
     # Define o destinatário com base no canal escolhido
     canal = canal.lower()
@@ -38,22 +43,29 @@ async def enviar_mensagem(
         destinatario = contato.email
         if not destinatario:
             error_msg = f"O contato {contato.name} não possui um e-mail cadastrado"
-            print(error_msg)
+            logger.info(error_msg)
             raise HTTPException(status_code=400, detail=error_msg)
     elif canal == "whatsapp":
         destinatario = contato.phone
         if not destinatario:
             error_msg = f"O contato {contato.name} não possui um telefone cadastrado"
-            print(error_msg)
+            logger.info(error_msg)
             raise HTTPException(status_code=400, detail=error_msg)
     else:
         error_msg = "Canal inválido. Use 'email' ou 'whatsapp'."
-        print(error_msg)
+        logger.info(error_msg)
         raise HTTPException(status_code=400, detail=error_msg)
     
     # Envia a mensagem
     service = MensagemService()
-    ok, error_msg = service.enviar_mensagem(canal, destinatario, conteudo, assunto)
+    inicio = time.perf_counter()
+    ok, error_msg = await service.enviar_mensagem_async(canal, destinatario, conteudo, assunto)
+    # Só enfileira o registro: o histórico é gravado em lote, fora da requisição
+    registrar_envio(
+        canal, destinatario, conteudo, ok, error_msg,
+        latencia_ms=(time.perf_counter() - inicio) * 1000,
+        provider_id=service.last_provider_id, contato_id=contato.id,
+    )
     if not ok:
         # Retornar erro detalhado para debug
         detail = error_msg or "Falha ao enviar mensagem."
@@ -75,20 +87,18 @@ async def agendar_mensagem(
     minutos: int = 1,
     assunto: Optional[str] = None,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     # Busca o contato no banco de dados
     from database import Contact
     
-    print(f"Buscando contato com ID: {contact_id}")
-    contato = db.query(Contact).filter(Contact.id == contact_id).first()
+    contato = await db.get(Contact, contact_id)
     
     if not contato:
         error_msg = f"Contato com ID {contact_id} não encontrado"
-        print(error_msg)
+        logger.info(error_msg)
         raise HTTPException(status_code=404, detail=error_msg)
     
-    print(f"Contato encontrado: {contato.name} ({contato.email})")
     
     # Define o destinatário com base no canal escolhido
     canal = canal.lower()
@@ -96,27 +106,37 @@ async def agendar_mensagem(
         destinatario = contato.email
         if not destinatario:
             error_msg = f"O contato {contato.name} não possui um e-mail cadastrado"
-            print(error_msg)
+            logger.info(error_msg)
             raise HTTPException(status_code=400, detail=error_msg)
     elif canal == "whatsapp":
         destinatario = contato.phone
         if not destinatario:
             error_msg = f"O contato {contato.name} não possui um telefone cadastrado"
-            print(error_msg)
+            logger.info(error_msg)
             raise HTTPException(status_code=400, detail=error_msg)
     else:
         error_msg = "Canal inválido. Use 'email' ou 'whatsapp'."
-        print(error_msg)
+        logger.info(error_msg)
         raise HTTPException(status_code=400, detail=error_msg)
     
-    # Agenda o envio da mensagem
-    agendar_envio.apply_async(
-        args=[canal, destinatario, conteudo, assunto], 
-        countdown=minutos * 60
+    # Persiste o agendamento: o envio segue pela mesma fila de
+    # mensagens_agendadas que o despachante processa (sem tarefa com countdown no Redis)
+    db_mensagem = MensagemAgendada(
+        canal=canal,
+        destinatario=destinatario,
+        assunto=assunto,
+        conteudo=conteudo,
+        data_agendamento=datetime.utcnow() + timedelta(minutes=minutos),
+        contato_id=contato.id
     )
+    db.add(db_mensagem)
+    await db.commit()
+    await db.refresh(db_mensagem)
+    await run_in_threadpool(despertador.notificar, db_mensagem.data_agendamento)
     
     return {
         "status": "agendado", 
+        "agendamento_id": db_mensagem.id,
         "execucao_em": f"{minutos} minuto(s)",
         "canal": canal,
         "contato_id": contato.id,
@@ -1,7 +1,41 @@
-from datetime import datetime
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from functools import partial
+from typing import Callable
+from sqlalchemy import and_, bindparam, select, update
 from sqlalchemy.orm import Session
 from database import SessionLocal, MensagemAgendada
+from log_config import AMOSTRAR
 from service.mensagem_service import MensagemService
+from service.despachante import DespachanteConcorrente, obter_despachante
+from service.historico import registrar_envio
+from service.limite_envio import LimitadorEnvios, obter_limitador_envios
+from service.retentativa import MAX_TENTATIVAS, calcular_espera, classificar_erro, eh_retentavel
+
+logger = logging.getLogger(__name__)
+
+# Status usados pelo despachante
+STATUS_AGENDADO = "AGENDADO"
+STATUS_PROCESSANDO = "PROCESSANDO"
+STATUS_ENVIADO = "ENVIADO"
+STATUS_ERRO = "ERRO"
+STATUS_CANCELADO = "CANCELADO"
+# Falhou com um erro temporário ou foi adiada pelo limite de taxa; volta
+# para a fila em proximo_envio_em
+STATUS_RETENTATIVA = "RETENTATIVA"
+# Dead-letter: erro temporário que persistiu por todas as tentativas
+STATUS_ESGOTADO = "ESGOTADO"
+
+# Quantidade máxima de mensagens reivindicadas por lote
+TAMANHO_LOTE = int(os.getenv("AGENDAMENTO_TAMANHO_LOTE", "100"))
+# Duração da reivindicação; após esse tempo um lote travado volta a ficar disponível
+DURACAO_LEASE_SEGUNDOS = int(os.getenv("AGENDAMENTO_LEASE_SEGUNDOS", "300"))
+# A partir de quantos emails em um lote eles são enviados em sessões SMTP compartilhadas
+EMAIL_LOTE_MINIMO = int(os.getenv("AGENDAMENTO_EMAIL_LOTE_MINIMO", "10"))
 
 
 class AgendamentoService:
@@ -9,58 +43,405 @@ class AgendamentoService:
     Serviço responsável por processar mensagens agendadas.
     """
     
-    def __init__(self):
-        self.mensagem_service = MensagemService()
+    def __init__(self, tamanho_lote: int = None, duracao_lease: int = None,
+                 despachante: DespachanteConcorrente = None, max_tentativas: int = None,
+                 limitador: LimitadorEnvios = None):
+        self.despachante = despachante or obter_despachante()
+        self.tamanho_lote = tamanho_lote or TAMANHO_LOTE
+        self.duracao_lease = timedelta(seconds=duracao_lease or DURACAO_LEASE_SEGUNDOS)
+        self.max_tentativas = max_tentativas or MAX_TENTATIVAS
+        self.limitador = limitador or obter_limitador_envios()
+        # Identifica este processo nas reivindicações (host:pid:instância)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._sequencia_lote = 0
     
-    def processar_mensagens_pendentes(self):
+    def processar_mensagens_pendentes(self, continuar: Callable[[], bool] = None):
+        """
+        Busca e processa as mensagens agendadas que já passaram do horário.
+
+        As mensagens são reivindicadas em lotes limitados: cada lote é marcado
+        atomicamente como PROCESSANDO com o id do worker e a validade do lease,
+        enviado em paralelo pelo despachante (com limite de envios simultâneos
+        por canal), e o resultado é gravado com um único UPDATE em lote. Lotes de
+        workers que travaram voltam a ser elegíveis quando o lease expira.
+        Se o limite de taxa adiar o lote inteiro, espera até o primeiro
+        adiamento antes do próximo lote, em vez de reivindicar e adiar as
+        mensagens seguintes uma a uma.
+        `continuar`, se informado, é consultado antes de cada lote (permite
+        encerrar após o lote em andamento). Retorna o número de mensagens processadas.
         """
-        Busca e processa todas as mensagens agendadas que já passaram do horário.
-        Retorna o número de mensagens processadas.
+        processadas = 0
+        while continuar is None or continuar():
+            db: Session = SessionLocal()
+            try:
+                lote = self._reivindicar_lote(db)
+                if not lote:
+                    break
+                liberadas, liberacoes, adiadas = self._reservar_envios(lote)
+                resultados = self._enviar_liberadas(liberadas, liberacoes) + adiadas
+                self._gravar_resultados(db, resultados)
+                processadas += len(resultados)
+                if not liberadas:
+                    self._aguardar_cota(adiadas, continuar)
+            except Exception:
+                db.rollback()
+                logger.exception("Erro ao processar mensagens")
+                break
+            finally:
+                db.close()
+        
+        return processadas
+
+    @staticmethod
+    def condicoes_elegiveis(agora: datetime) -> list:
         """
-        db: Session = SessionLocal()
+        Pares (condição, coluna de ordem) das linhas que podem ser
+        reivindicadas, um por fila. Cada fila é atendida por um índice próprio
+        (ver database.MensagemAgendada):
+        - mensagens PROCESSANDO cujo lease expirou (o worker travou ou morreu);
+        - mensagens RETENTATIVA cujo proximo_envio_em já chegou (nunca antes:
+          o backoff e os adiamentos do limite de taxa são respeitados);
+        - mensagens AGENDADO cujo horário já chegou.
+        """
+        return [
+            (
+                and_(
+                    MensagemAgendada.status == STATUS_PROCESSANDO,
+                    MensagemAgendada.lease_expira_em < agora,
+                ),
+                MensagemAgendada.data_agendamento,
+            ),
+            (
+                and_(
+                    MensagemAgendada.status == STATUS_RETENTATIVA,
+                    MensagemAgendada.proximo_envio_em <= agora,
+                ),
+                MensagemAgendada.proximo_envio_em,
+            ),
+            (
+                and_(
+                    MensagemAgendada.status == STATUS_AGENDADO,
+                    MensagemAgendada.data_agendamento <= agora,
+                ),
+                MensagemAgendada.data_agendamento,
+            ),
+        ]
+
+    @staticmethod
+    def consulta_candidatas(condicao, limite: int, ordem=MensagemAgendada.data_agendamento):
+        """SELECT dos ids elegíveis de uma fila, dos mais antigos para os mais novos."""
+        return (
+            select(MensagemAgendada.id)
+            .where(condicao)
+            .order_by(ordem)
+            .limit(limite)
+        )
+
+    def _reivindicar_lote(self, db: Session):
+        """
+        Marca até `tamanho_lote` mensagens vencidas como PROCESSANDO para este worker.
+
+        Cada fila (leases expirados, retentativas e agendadas vencidas) é reivindicada
+        com um único UPDATE na mesma transação, e a condição de elegibilidade
+        é reavaliada no próprio UPDATE: duas execuções sobrepostas nunca
+        reivindicam a mesma linha. No PostgreSQL, as candidatas são travadas
+        com FOR UPDATE SKIP LOCKED: workers concorrentes pulam as linhas que
+        outro já está reivindicando em vez de esperar por elas e ficar com um
+        lote vazio (o SQLite ignora a cláusula; lá a escrita já é serial).
+        """
+        agora = datetime.utcnow()
+        self._sequencia_lote += 1
+        reivindicacao = f"{self.worker_id}#{self._sequencia_lote}"
+
+        restantes = self.tamanho_lote
+        for condicao, ordem in self.condicoes_elegiveis(agora):
+            if restantes <= 0:
+                break
+            candidatos = self.consulta_candidatas(condicao, restantes, ordem).with_for_update(skip_locked=True)
+            resultado = db.execute(
+                update(MensagemAgendada)
+                .where(MensagemAgendada.id.in_(candidatos.scalar_subquery()), condicao)
+                .values(
+                    status=STATUS_PROCESSANDO,
+                    worker_id=reivindicacao,
+                    lease_expira_em=agora + self.duracao_lease,
+                )
+                .execution_options(synchronize_session=False)
+            )
+            restantes -= resultado.rowcount
+        db.commit()
+
+        lote = db.query(MensagemAgendada).filter(
+            MensagemAgendada.worker_id == reivindicacao,
+            MensagemAgendada.status == STATUS_PROCESSANDO,
+        ).all()
+        # O lote é enviado por outras threads; desanexa da sessão para que
+        # nenhuma delas toque na Session (que não é thread-safe).
+        db.expunge_all()
+        return lote
+
+    def _despachar(self, lote: list) -> list:
+        """
+        Envia um lote reivindicado. Antes, o limitador de taxa decide quando
+        cada mensagem pode sair; as que passam da cota são adiadas.
+        """
+        liberadas, liberacoes, adiadas = self._reservar_envios(lote)
+        return self._enviar_liberadas(liberadas, liberacoes) + adiadas
+
+    def _enviar_liberadas(self, lote: list, liberacoes: dict) -> list:
+        """
+        Envia as mensagens liberadas pelo limitador, cada uma na sua vez.
+        Quando há muitos emails, eles são agrupados em poucas sessões SMTP
+        (uma por worker de email) em vez de uma sessão por mensagem; os
+        demais seguem mensagem a mensagem.
+        """
+        enviar = partial(self._enviar, liberacoes=liberacoes)
+        emails = [m for m in lote if (m.canal or "").lower() == "email"]
+        if len(emails) < EMAIL_LOTE_MINIMO:
+            return self.despachante.despachar(lote, enviar)
+
+        demais = [m for m in lote if (m.canal or "").lower() != "email"]
+        return (
+            self.despachante.despachar_em_lotes("email", emails, partial(self._enviar_emails, liberacoes=liberacoes))
+            + self.despachante.despachar(demais, enviar)
+        )
+
+    def _reservar_envios(self, lote: list) -> tuple:
+        """
+        Consulta o limitador de taxa de cada canal do lote. Retorna as mensagens
+        a enviar, o instante (time.monotonic) em que cada uma pode sair e os
+        parâmetros do UPDATE das que foram adiadas.
+        """
+        por_canal = {}
+        for mensagem in lote:
+            por_canal.setdefault((mensagem.canal or "").lower(), []).append(mensagem)
+        agora = time.monotonic()
+        liberadas, liberacoes, adiadas = [], {}, []
+        for canal, mensagens in por_canal.items():
+            reserva = self.limitador.reservar(canal, len(mensagens))
+            for mensagem, espera in zip(mensagens, reserva.esperas):
+                liberadas.append(mensagem)
+                liberacoes[mensagem.id] = agora + espera
+            excedentes = mensagens[len(reserva.esperas):]
+            adiadas += [self._adiamento(m, espera) for m, espera in zip(excedentes, reserva.adiamentos)]
+            if excedentes:
+                logger.info("%d mensagem(ns) de %s adiada(s) pelo limite de taxa (próxima em %.1fs)",
+                            len(excedentes), canal, reserva.adiamentos[0])
+        return liberadas, liberacoes, adiadas
+
+    @staticmethod
+    def _adiamento(mensagem: MensagemAgendada, espera: float) -> dict:
+        """
+        Parâmetros do UPDATE de uma mensagem que passou da cota: volta para a
+        fila de retentativas sem contar como tentativa nem alterar o último erro.
+        """
+        return {
+            "b_id": mensagem.id,
+            "b_worker_id": mensagem.worker_id,
+            "b_status": STATUS_RETENTATIVA,
+            "b_enviado_em": None,
+            "b_erro_mensagem": mensagem.erro_mensagem,
+            "b_tentativas": mensagem.tentativas or 0,
+            "b_proximo_envio_em": datetime.utcnow() + timedelta(seconds=espera),
+            "b_classe_erro": mensagem.classe_erro,
+        }
+
+    @staticmethod
+    def _aguardar_cota(adiadas: list, continuar: Callable[[], bool] = None):
+        """
+        Dorme até o primeiro adiamento de um lote que não pôde enviar nada:
+        reivindicar antes disso só adiaria as próximas mensagens da fila.
+        """
+        fim = min(adiamento["b_proximo_envio_em"] for adiamento in adiadas)
+        while continuar is None or continuar():
+            espera = (fim - datetime.utcnow()).total_seconds()
+            if espera <= 0:
+                return
+            # Em passos curtos, para que `continuar` seja consultado durante a espera
+            time.sleep(min(espera, 1.0))
+
+    @staticmethod
+    def _aguardar_vez(mensagem: MensagemAgendada, liberacoes: dict = None):
+        """Dorme até o instante reservado para a mensagem pelo limitador."""
+        espera = (liberacoes or {}).get(mensagem.id, 0.0) - time.monotonic()
+        if espera > 0:
+            time.sleep(espera)
+
+    def _resultado(self, mensagem: MensagemAgendada, sucesso: bool, erro: str = None,
+                   classe_erro: str = None) -> dict:
+        """
+        Parâmetros do UPDATE de resultado de uma mensagem. Um erro temporário
+        (eh_retentavel) agenda uma nova tentativa com backoff exponencial, até
+        `max_tentativas`; esgotadas as tentativas, a mensagem vai para
+        ESGOTADO. Os demais erros são definitivos (ERRO).
+        """
+        agora = datetime.utcnow()
+        tentativas = (mensagem.tentativas or 0) + 1
+        proximo_envio_em = None
+        if sucesso:
+            status = STATUS_ENVIADO
+            classe_erro = None
+        elif not eh_retentavel(classe_erro):
+            status = STATUS_ERRO
+        elif tentativas < self.max_tentativas:
+            status = STATUS_RETENTATIVA
+            proximo_envio_em = agora + calcular_espera(tentativas)
+        else:
+            status = STATUS_ESGOTADO
+        return {
+            "b_id": mensagem.id,
+            "b_worker_id": mensagem.worker_id,
+            "b_status": status,
+            "b_enviado_em": agora if sucesso else None,
+            "b_erro_mensagem": None if sucesso else (erro or "Falha no envio da mensagem"),
+            "b_tentativas": tentativas,
+            "b_proximo_envio_em": proximo_envio_em,
+            "b_classe_erro": classe_erro,
+        }
+
+    def _enviar_emails(self, mensagens: list, mensagem_service: MensagemService,
+                       liberacoes: dict = None) -> list:
+        """
+        Envia um sublote de emails pela sessão SMTP do pool, respeitando a vez
+        de cada um: os que já podem sair vão juntos, os demais aguardam.
+        """
+        liberacoes = liberacoes or {}
+        resultados = []
+        inicio = 0
+        while inicio < len(mensagens):
+            self._aguardar_vez(mensagens[inicio], liberacoes)
+            agora = time.monotonic()
+            fim = inicio + 1
+            while fim < len(mensagens) and liberacoes.get(mensagens[fim].id, 0.0) <= agora:
+                fim += 1
+            resultados += self._enviar_sublote_emails(mensagens[inicio:fim], mensagem_service)
+            inicio = fim
+        return resultados
+
+    def _enviar_sublote_emails(self, mensagens: list, mensagem_service: MensagemService) -> list:
+        """Envia emails que já podem sair por uma única sessão SMTP."""
         try:
-            agora = datetime.utcnow()
-            mensagens_pendentes = db.query(MensagemAgendada).filter(
-                MensagemAgendada.status == "AGENDADO",
-                MensagemAgendada.data_agendamento <= agora
-            ).all()
+            envios = mensagem_service.enviar_emails([
+                (m.destinatario, m.conteudo, m.assunto) for m in mensagens
+            ])
+            detalhes = mensagem_service.detalhes_lote
+        except Exception as e:
+            logger.exception("Exceção ao enviar lote de %d emails", len(mensagens))
+            envios = [(False, str(e))] * len(mensagens)
+            detalhes = [(None, None, classificar_erro(e))] * len(mensagens)
+        for mensagem, (sucesso, erro), (provider_id, latencia_ms, _) in zip(mensagens, envios, detalhes):
+            self._registrar_envio(mensagem, sucesso, erro, latencia_ms, provider_id)
+        return [
+            self._resultado(mensagem, sucesso, erro, classe_erro)
+            for mensagem, (sucesso, erro), (_, _, classe_erro) in zip(mensagens, envios, detalhes)
+        ]
+
+    def _enviar(self, mensagem: MensagemAgendada, mensagem_service: MensagemService,
+                liberacoes: dict = None) -> dict:
+        """Envia uma mensagem reivindicada e devolve os parâmetros do UPDATE de resultado."""
+        self._aguardar_vez(mensagem, liberacoes)
+        inicio = time.perf_counter()
+        try:
+            sucesso, erro = mensagem_service.enviar_mensagem(
+                canal=mensagem.canal,
+                destinatario=mensagem.destinatario,
+                conteudo=mensagem.conteudo,
+                assunto=mensagem.assunto
+            )
             
-            processadas = 0
-            for mensagem in mensagens_pendentes:
-                try:
-                    sucesso = self.mensagem_service.enviar_mensagem(
-                        canal=mensagem.canal,
-                        destinatario=mensagem.destinatario,
-                        conteudo=mensagem.conteudo,
-                        assunto=mensagem.assunto
-                    )
-                    
-                    if sucesso:
-                        mensagem.status = "ENVIADO"
-                        mensagem.enviado_em = datetime.utcnow()
-                        print(f"[AGENDAMENTO] Mensagem {mensagem.id} enviada com sucesso.")
-                    else:
-                        mensagem.status = "ERRO"
-                        mensagem.erro_mensagem = "Falha no envio da mensagem"
-                        print(f"[AGENDAMENTO] Erro ao enviar mensagem {mensagem.id}.")
-                    
-                    processadas += 1
-                    
-                except Exception as e:
-                    mensagem.status = "ERRO"
-                    mensagem.erro_mensagem = str(e)
-                    print(f"[AGENDAMENTO] Exceção ao processar mensagem {mensagem.id}: {e}")
+            self._registrar_envio(mensagem, sucesso, erro, (time.perf_counter() - inicio) * 1000,
+                                  mensagem_service.last_provider_id)
+            return self._resultado(mensagem, sucesso, erro, None if sucesso else mensagem_service.last_error_class)
                 
-                db.commit()
-            
-            return processadas
-            
         except Exception as e:
-            print(f"[AGENDAMENTO] Erro ao processar mensagens: {e}")
-            return 0
-        finally:
-            db.close()
+            logger.exception("Exceção ao processar mensagem %s", mensagem.id)
+            self._registrar_envio(mensagem, False, str(e), (time.perf_counter() - inicio) * 1000)
+            return self._resultado(mensagem, False, str(e), classificar_erro(e))
+
+    @staticmethod
+    def _registrar_envio(mensagem: MensagemAgendada, sucesso: bool, erro,
+                         latencia_ms: float = None, provider_id: str = None):
+        """Registra o envio no log e no histórico (gravado em lote, fora desta thread)."""
+        if sucesso:
+            logger.debug("Mensagem %s enviada com sucesso.", mensagem.id, extra=AMOSTRAR)
+        else:
+            logger.warning("Erro ao enviar mensagem %s: %s", mensagem.id, erro)
+        registrar_envio(
+            mensagem.canal, mensagem.destinatario, mensagem.conteudo, sucesso, erro,
+            latencia_ms=latencia_ms, provider_id=provider_id,
+            contato_id=mensagem.contato_id, mensagem_agendada_id=mensagem.id,
+        )
+
+    def _gravar_resultados(self, db: Session, resultados: list):
+        """
+        Grava o resultado de um lote com um único UPDATE (executemany).
+
+        O UPDATE só afeta linhas ainda reivindicadas por este lote; se o lease
+        expirou e outro worker assumiu a linha, o resultado dele prevalece.
+        """
+        if not resultados:
+            return
+        tabela = MensagemAgendada.__table__
+        db.execute(
+            update(tabela)
+            .where(
+                tabela.c.id == bindparam("b_id"),
+                tabela.c.worker_id == bindparam("b_worker_id"),
+                tabela.c.status == STATUS_PROCESSANDO,
+            )
+            .values(
+                status=bindparam("b_status"),
+                enviado_em=bindparam("b_enviado_em"),
+                erro_mensagem=bindparam("b_erro_mensagem"),
+                tentativas=bindparam("b_tentativas"),
+                proximo_envio_em=bindparam("b_proximo_envio_em"),
+                classe_erro=bindparam("b_classe_erro"),
+                worker_id=None,
+                lease_expira_em=None,
+            ),
+            resultados,
+        )
+        db.commit()
     
+    @staticmethod
+    def proximos_vencimentos(db: Session, limite: int) -> list:
+        """
+        Retorna, em ordem, até `limite` instantes em que haverá trabalho para o
+        despachante: os data_agendamento pendentes, os leases a expirar e as
+        retentativas. Os dois primeiros são resolvidos pelo índice (status,
+        data_agendamento), as retentativas pelo índice (status, proximo_envio_em):
+        o despachante dorme até a próxima tentativa em vez de consultar a fila.
+        """
+        agendadas = (
+            db.query(MensagemAgendada.data_agendamento)
+            .filter(MensagemAgendada.status == STATUS_AGENDADO)
+            .order_by(MensagemAgendada.data_agendamento)
+            .limit(limite)
+        )
+        leases = (
+            db.query(MensagemAgendada.lease_expira_em)
+            .filter(MensagemAgendada.status == STATUS_PROCESSANDO,
+                    MensagemAgendada.lease_expira_em.isnot(None))
+            .order_by(MensagemAgendada.lease_expira_em)
+            .limit(limite)
+        )
+        retentativas = (
+            db.query(MensagemAgendada.proximo_envio_em)
+            .filter(MensagemAgendada.status == STATUS_RETENTATIVA,
+                    MensagemAgendada.proximo_envio_em.isnot(None))
+            .order_by(MensagemAgendada.proximo_envio_em)
+            .limit(limite)
+        )
+        vencimentos = [linha[0] for linha in agendadas] + [linha[0] for linha in leases] \
+            + [linha[0] for linha in retentativas]
+        return sorted(vencimentos)[:limite]
+
+    @staticmethod
+    def proximo_vencimento(db: Session):
+        """Retorna o próximo instante em que haverá trabalho para o despachante, ou None."""
+        vencimentos = AgendamentoService.proximos_vencimentos(db, 1)
+        return vencimentos[0] if vencimentos else None
+
     def cancelar_agendamento(self, mensagem_id: int, db: Session) -> bool:
         """
         Cancela um agendamento específico.
@@ -69,21 +450,13 @@ class AgendamentoService:
         if not mensagem:
             return False
         
-        if mensagem.status != "AGENDADO":
+        if mensagem.status not in (STATUS_AGENDADO, STATUS_RETENTATIVA):
             return False
         
-        mensagem.status = "CANCELADO"
+        mensagem.status = STATUS_CANCELADO
         db.commit()
         return True
     
-    def obter_agendamentos_ativos(self, db: Session):
-        """
-        Retorna todos os agendamentos com status AGENDADO.
-        """
-        return db.query(MensagemAgendada).filter(
-            MensagemAgendada.status == "AGENDADO"
-        ).order_by(MensagemAgendada.data_agendamento).all()
-
     def listar_agendamentos(self):
         """
         Retorna todos os agendamentos cadastrados.
@@ -0,0 +1,128 @@
+import logging
+import os
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Callable
+
+from sqlalchemy import DateTime, literal, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, MensagemAgendada, MensagemAgendadaArquivada, ResumoEnvioDiario
+from service.agendamento_service import STATUS_CANCELADO, STATUS_ENVIADO, STATUS_ERRO, STATUS_ESGOTADO
+
+logger = logging.getLogger(__name__)
+
+# Idade (pelo data_agendamento) a partir da qual uma mensagem finalizada sai da tabela quente
+DIAS_RETENCAO = int(os.getenv("ARQUIVAMENTO_DIAS", "30"))
+# Mensagens movidas por transação; limita o tempo em que a escrita fica travada
+TAMANHO_LOTE = int(os.getenv("ARQUIVAMENTO_TAMANHO_LOTE", "1000"))
+# Pausa entre lotes, para o despachante e as rotas gravarem no meio do arquivamento
+PAUSA_SEGUNDOS = float(os.getenv("ARQUIVAMENTO_PAUSA_SEGUNDOS", "0.1"))
+
+# Status que não mudam mais: só essas mensagens são arquivadas
+STATUS_FINALIZADOS = (STATUS_ENVIADO, STATUS_ERRO, STATUS_CANCELADO, STATUS_ESGOTADO)
+
+_INSERT_POR_DIALETO = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+class ArquivadorMensagens:
+    """
+    Move as mensagens agendadas finalizadas e antigas de mensagens_agendadas
+    para mensagens_agendadas_arquivo, em lotes de `tamanho_lote`.
+
+    Cada lote é uma transação: copia as linhas para o arquivo (INSERT ...
+    SELECT), soma os totais do lote em resumo_envios_diario e as remove da
+    tabela quente. Assim a tabela do despachante e das listagens guarda só os
+    últimos `dias` dias, qualquer que seja o tempo de operação.
+    """
+
+    def __init__(self, dias: int = None, tamanho_lote: int = None, pausa: float = None,
+                 fabrica_sessao: Callable[[], Session] = None):
+        self.retencao = timedelta(days=DIAS_RETENCAO if dias is None else dias)
+        self.tamanho_lote = tamanho_lote or TAMANHO_LOTE
+        self.pausa = PAUSA_SEGUNDOS if pausa is None else pausa
+        self.fabrica_sessao = fabrica_sessao or SessionLocal
+
+    def arquivar(self, continuar: Callable[[], bool] = None) -> int:
+        """
+        Arquiva, lote a lote, todas as mensagens elegíveis. `continuar`, se
+        informado, é consultado antes de cada lote. Retorna quantas foram movidas.
+        """
+        agora = datetime.utcnow()
+        corte = agora - self.retencao
+        total = 0
+        while continuar is None or continuar():
+            db = self.fabrica_sessao()
+            try:
+                movidas = self._arquivar_lote(db, corte, agora)
+            except Exception:
+                db.rollback()
+                logger.exception("Erro ao arquivar mensagens agendadas")
+                break
+            finally:
+                db.close()
+            total += movidas
+            if movidas < self.tamanho_lote:
+                break
+            time.sleep(self.pausa)
+        logger.info("Arquivamento: %d mensagem(ns) anterior(es) a %s arquivada(s)", total, corte)
+        return total
+
+    def _arquivar_lote(self, db: Session, corte: datetime, agora: datetime) -> int:
+        quente = MensagemAgendada.__table__
+        arquivo = MensagemAgendadaArquivada.__table__
+
+        # Sem ORDER BY: qualquer lote elegível serve, e o filtro é resolvido
+        # pelo índice (status, data_agendamento). No PostgreSQL, FOR UPDATE
+        # SKIP LOCKED evita que duas execuções copiem a mesma linha
+        linhas = db.execute(
+            select(quente.c.id, quente.c.canal, quente.c.status, quente.c.data_agendamento)
+            .where(quente.c.status.in_(STATUS_FINALIZADOS), quente.c.data_agendamento < corte)
+            .limit(self.tamanho_lote)
+            .with_for_update(skip_locked=True)
+        ).all()
+        if not linhas:
+            return 0
+        ids = [linha.id for linha in linhas]
+
+        colunas = [coluna.name for coluna in arquivo.columns if coluna.name != "arquivado_em"]
+        db.execute(
+            arquivo.insert().from_select(
+                colunas + ["arquivado_em"],
+                select(*[quente.c[nome] for nome in colunas], literal(agora, DateTime()))
+                .where(quente.c.id.in_(ids)),
+            )
+        )
+        self._somar_resumo(db, linhas)
+        db.execute(quente.delete().where(quente.c.id.in_(ids)))
+        db.commit()
+        return len(ids)
+
+    @staticmethod
+    def _somar_resumo(db: Session, linhas: list):
+        """Acrescenta os totais do lote por (dia, canal, status), com upsert."""
+        totais = Counter(
+            (linha.data_agendamento.date(), (linha.canal or "").lower(), linha.status) for linha in linhas
+        )
+        tabela = ResumoEnvioDiario.__table__
+        insert = _INSERT_POR_DIALETO[db.get_bind().dialect.name](tabela)
+        db.execute(
+            insert.on_conflict_do_update(
+                index_elements=[tabela.c.dia, tabela.c.canal, tabela.c.status],
+                set_={"quantidade": tabela.c.quantidade + insert.excluded.quantidade},
+            ),
+            [
+                {"dia": dia, "canal": canal, "status": status, "quantidade": quantidade}
+                for (dia, canal, status), quantidade in totais.items()
+            ],
+        )
+
+
+if __name__ == "__main__":
+    # Execução avulsa (cron), para instalações sem o Celery Beat:
+    #   python -m service.arquivamento
+    from log_config import configurar_log
+    configurar_log()
+    ArquivadorMensagens().arquivar()
@@ -0,0 +1,29 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Protocol, Tuple
+
+# Threads reservadas para o I/O bloqueante dos canais chamados a partir do event loop
+WORKERS_CANAIS_ASYNC = int(os.getenv("CANAIS_ASYNC_WORKERS", "16"))
+
+_executor = ThreadPoolExecutor(max_workers=WORKERS_CANAIS_ASYNC, thread_name_prefix="canal-async")
+
+
+class CanalAssincrono(Protocol):
+    """Interface dos canais usados pelas rotas (event loop)."""
+
+    async def enviar(self, destinatario: str, conteudo: str,
+                     assunto: Optional[str] = None) -> Tuple[bool, Optional[str], Optional[str], Optional[str]]:
+        """Envia a mensagem e retorna (sucesso, erro, id da mensagem no provedor, classe do erro)."""
+        ...
+
+
+async def executar_bloqueante(funcao, *args):
+    """
+    Executa uma chamada bloqueante (SMTP, HTTP do Twilio) no executor dos
+    canais, liberando o event loop enquanto ela não termina. O executor é
+    separado do threadpool padrão do FastAPI, então envios lentos não
+    disputam threads com as rotas síncronas.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, funcao, *args)
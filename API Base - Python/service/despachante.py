@@ -0,0 +1,90 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from service.mensagem_service import MensagemService
+
+# Envios simultâneos permitidos por canal
+LIMITES_PADRAO = {
+    "email": int(os.getenv("DESPACHO_WORKERS_EMAIL", "4")),
+    "whatsapp": int(os.getenv("DESPACHO_WORKERS_WHATSAPP", "4")),
+}
+
+
+class DespachanteConcorrente:
+    """
+    Distribui um lote de mensagens entre pools de threads, um por canal.
+
+    O tamanho de cada pool é o limite de envios simultâneos daquele canal, de
+    modo que um canal lento não ocupa as threads do outro. Canais sem limite
+    configurado compartilham um pool de uma thread.
+    """
+
+    def __init__(self, limites: dict = None, fabrica_servico=MensagemService):
+        self.limites = dict(LIMITES_PADRAO if limites is None else limites)
+        self._fabrica_servico = fabrica_servico
+        self._local = threading.local()
+        self._pools = {
+            canal: ThreadPoolExecutor(max_workers=max(1, n), thread_name_prefix=f"despacho-{canal}")
+            for canal, n in self.limites.items()
+        }
+        self._pool_padrao = ThreadPoolExecutor(max_workers=1, thread_name_prefix="despacho")
+
+    def _servico(self) -> MensagemService:
+        # MensagemService e os canais guardam estado do último envio (last_error),
+        # então cada thread usa a sua própria instância.
+        servico = getattr(self._local, "servico", None)
+        if servico is None:
+            servico = self._local.servico = self._fabrica_servico()
+        return servico
+
+    def _executar(self, enviar, mensagem):
+        return enviar(mensagem, self._servico())
+
+    def despachar(self, mensagens: list, enviar) -> list:
+        """
+        Executa `enviar(mensagem, mensagem_service)` para cada mensagem em paralelo.
+        Retorna os resultados na mesma ordem das mensagens.
+        """
+        futuros = [
+            self._pools.get((mensagem.canal or "").lower(), self._pool_padrao).submit(
+                self._executar, enviar, mensagem
+            )
+            for mensagem in mensagens
+        ]
+        return [futuro.result() for futuro in futuros]
+
+    def despachar_em_lotes(self, canal: str, mensagens: list, enviar_lote) -> list:
+        """
+        Divide as mensagens de um canal em um sublote por worker do canal e
+        executa `enviar_lote(sublote, mensagem_service)` em paralelo.
+        Retorna os resultados de todos os sublotes, na ordem das mensagens.
+        """
+        if not mensagens:
+            return []
+        workers = max(1, self.limites.get(canal, 1))
+        tamanho = -(-len(mensagens) // workers)
+        pool = self._pools.get(canal, self._pool_padrao)
+        futuros = [
+            pool.submit(self._executar, enviar_lote, mensagens[i:i + tamanho])
+            for i in range(0, len(mensagens), tamanho)
+        ]
+        return [resultado for futuro in futuros for resultado in futuro.result()]
+
+    def encerrar(self, aguardar: bool = True):
+        """Finaliza os pools, aguardando os envios em andamento."""
+        for pool in list(self._pools.values()) + [self._pool_padrao]:
+            pool.shutdown(wait=aguardar)
+
+
+_despachante = None
+_lock = threading.Lock()
+
+
+def obter_despachante() -> DespachanteConcorrente:
+    """Retorna o despachante compartilhado pelo processo, criando-o na primeira chamada."""
+    global _despachante
+    if _despachante is None:
+        with _lock:
+            if _despachante is None:
+                _despachante = DespachanteConcorrente()
+    return _despachante
@@ -0,0 +1,149 @@
+import asyncio
+import heapq
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Optional
+
+from database import SessionLocal
+from service import despertador
+from service.agendamento_service import AgendamentoService
+
+logger = logging.getLogger(__name__)
+
+# Liga o despachante dentro do processo da API (sem Redis, Celery worker ou Beat)
+ATIVO = os.getenv("DESPACHANTE_EMBUTIDO", "False").lower() in ("1", "true", "yes")
+# Quantos vencimentos futuros são mantidos em memória
+VENCIMENTOS_EM_MEMORIA = int(os.getenv("DESPACHANTE_EMBUTIDO_VENCIMENTOS", "1000"))
+# Espera máxima entre verificações, cobrindo linhas inseridas fora da API
+ESPERA_MAXIMA_SEGUNDOS = float(os.getenv("DESPACHANTE_EMBUTIDO_ESPERA_MAXIMA", "60"))
+
+
+class DespachanteEmbutido:
+    """
+    Despachante de agendamentos que roda no event loop da API.
+
+    Mantém um heap com os próximos vencimentos da tabela mensagens_agendadas
+    e dorme até o primeiro deles. Ao acordar, executa o AgendamentoService em
+    uma thread própria (o envio e o banco são bloqueantes) e recarrega o heap
+    pelo índice. As rotas de agendamento o avisam via service.despertador.
+    """
+
+    def __init__(self, servico: AgendamentoService = None,
+                 vencimentos_em_memoria: int = None, espera_maxima: float = None):
+        self.servico = servico or AgendamentoService()
+        self.vencimentos_em_memoria = vencimentos_em_memoria or VENCIMENTOS_EM_MEMORIA
+        self.espera_maxima = espera_maxima or ESPERA_MAXIMA_SEGUNDOS
+        self._vencimentos = []
+        # Horários avisados desde o início da última recarga do heap
+        self._avisos_recentes = []
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="despachante-embutido")
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._acordar: Optional[asyncio.Event] = None
+        self._tarefa: Optional[asyncio.Task] = None
+        self._encerrando = False
+
+    async def iniciar(self):
+        self._loop = asyncio.get_running_loop()
+        self._acordar = asyncio.Event()
+        self._encerrando = False
+        self._tarefa = asyncio.create_task(self._executar())
+        logger.info("Despachante embutido iniciado.")
+
+    async def encerrar(self):
+        """Para de reivindicar lotes e aguarda o lote em andamento terminar de ser enviado."""
+        if self._tarefa is None:
+            return
+        self._encerrando = True
+        self._acordar.set()
+        await self._tarefa
+        self._tarefa = None
+        self._executor.shutdown(wait=True)
+        logger.info("Despachante embutido encerrado.")
+
+    def notificar(self, data_agendamento: Optional[datetime] = None):
+        """Recebe um horário novo (ou apenas um aviso) de qualquer thread."""
+        if self._loop is None or self._loop.is_closed():
+            return
+        self._loop.call_soon_threadsafe(self._registrar_vencimento, data_agendamento)
+
+    def _registrar_vencimento(self, data_agendamento: Optional[datetime]):
+        if data_agendamento is not None:
+            heapq.heappush(self._vencimentos, data_agendamento)
+            self._avisos_recentes.append(data_agendamento)
+        self._acordar.set()
+
+    def _segundos_ate_proximo(self) -> float:
+        if not self._vencimentos:
+            return self.espera_maxima
+        restante = (self._vencimentos[0] - datetime.utcnow()).total_seconds()
+        return min(max(restante, 0.0), self.espera_maxima)
+
+    async def _executar(self):
+        # Na inicialização processa o que venceu com a API parada e carrega o heap
+        await self._processar()
+        while not self._encerrando:
+            try:
+                await asyncio.wait_for(self._acordar.wait(), self._segundos_ate_proximo())
+            except asyncio.TimeoutError:
+                pass
+            self._acordar.clear()
+            if self._encerrando:
+                break
+            if self._segundos_ate_proximo() > 0:
+                # Acordou por um aviso de horário futuro: só recalcula a espera
+                continue
+            await self._processar()
+
+    async def _processar(self):
+        inicio = datetime.utcnow()
+        self._avisos_recentes = []
+        try:
+            vencimentos = await self._loop.run_in_executor(self._executor, self._processar_e_recarregar)
+        except Exception:
+            logger.exception("Erro ao processar agendamentos")
+            vencimentos = []
+        # O heap passa a ser o que está no banco mais os avisos recebidos
+        # durante o processamento (a recarga pode ter lido antes do commit
+        # deles). Horários anteriores ao início já foram reivindicados por esta
+        # execução; se ainda aparecem (erro no envio ou no banco), ficam para a
+        # espera máxima em vez de reprocessar em laço.
+        self._vencimentos = [v for v in vencimentos if v > inicio] + self._avisos_recentes
+        heapq.heapify(self._vencimentos)
+
+    def _processar_e_recarregar(self) -> list:
+        """Roda na thread do despachante: envia o que venceu e lê os próximos vencimentos."""
+        processadas = self.servico.processar_mensagens_pendentes(
+            continuar=lambda: not self._encerrando
+        )
+        if processadas:
+            logger.info("%d mensagens processadas.", processadas)
+        db = SessionLocal()
+        try:
+            return AgendamentoService.proximos_vencimentos(db, self.vencimentos_em_memoria)
+        finally:
+            db.close()
+
+
+_despachante: Optional[DespachanteEmbutido] = None
+
+
+async def iniciar_despachante_embutido() -> Optional[DespachanteEmbutido]:
+    """Inicia o despachante embutido se DESPACHANTE_EMBUTIDO estiver ligado."""
+    global _despachante
+    if not ATIVO or _despachante is not None:
+        return _despachante
+    _despachante = DespachanteEmbutido()
+    await _despachante.iniciar()
+    despertador.registrar(_despachante)
+    return _despachante
+
+
+async def encerrar_despachante_embutido():
+    """Encerra o despachante embutido, aguardando os envios em andamento."""
+    global _despachante
+    if _despachante is not None:
+        despertador.remover(_despachante)
+        await _despachante.encerrar()
+        _despachante = None
@@ -0,0 +1,125 @@
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import redis
+from sqlalchemy.orm import Session
+
+from celery_app import celery_app, INTERVALO_SEGURANCA, MODO_AGENDAMENTO, REDIS_URL
+from service.agendamento_service import AgendamentoService
+
+logger = logging.getLogger(__name__)
+
+# Instante (epoch UTC) do despertar atualmente armado no Celery
+CHAVE_DESPERTAR = "agendamentos:despertar_em"
+
+# Arma um novo despertar se não houver um pendente, se o pendente já passou ou
+# se o novo for mais cedo. Com `forcar`, substitui qualquer horário diferente.
+_SCRIPT_ARMAR = """
+local atual = tonumber(redis.call('GET', KEYS[1]))
+local novo = tonumber(ARGV[1])
+local agora = tonumber(ARGV[2])
+if (not atual) or atual <= agora or novo < atual or (ARGV[3] == '1' and novo ~= atual) then
+    redis.call('SET', KEYS[1], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+
+class DespertadorCelery:
+    """
+    Acorda o despachante exatamente no horário do próximo agendamento.
+
+    Em vez de consultar o banco a cada minuto, mantém uma única tarefa
+    `tasks.processar_agendamentos` agendada (ETA) para o menor
+    data_agendamento pendente. O horário armado fica no Redis, para que API
+    e workers só antecipem o despertar quando o novo horário for mais cedo.
+
+    O ETA nunca passa de AGENDAMENTO_INTERVALO_SEGURANCA: o broker Redis
+    reentrega tarefas com ETA distante (visibility_timeout), e cada despertar
+    se rearma para o próximo vencimento. Um vencimento daqui a dias é
+    alcançado em vários despertares curtos.
+    """
+
+    def __init__(self, cliente_redis: redis.Redis = None):
+        # Timeouts curtos: as rotas notificam a cada agendamento criado ou alterado
+        self._redis = cliente_redis or redis.Redis.from_url(
+            REDIS_URL, socket_connect_timeout=1, socket_timeout=1,
+        )
+        self._script_armar = self._redis.register_script(_SCRIPT_ARMAR)
+
+    def armar(self, quando: datetime, forcar: bool = False) -> bool:
+        """
+        Agenda o despertar para `quando` (UTC sem fuso, como no banco), se ele
+        for mais cedo que o já armado. Retorna True se uma tarefa foi agendada.
+        """
+        quando = min(quando, datetime.utcnow() + timedelta(seconds=INTERVALO_SEGURANCA))
+        eta = quando.replace(tzinfo=timezone.utc)
+        armou = self._script_armar(
+            keys=[CHAVE_DESPERTAR],
+            args=[eta.timestamp(), time.time(), "1" if forcar else "0"],
+        )
+        if armou:
+            try:
+                # Sem as retentativas padrão do Kombu: com o broker fora do ar,
+                # o Beat de segurança cobre o atraso
+                celery_app.send_task(
+                    "tasks.processar_agendamentos", eta=eta,
+                    retry_policy={"max_retries": 1, "interval_start": 0, "interval_step": 0.5},
+                )
+            except Exception:
+                # Sem a tarefa, o horário gravado bloquearia os próximos despertares
+                self._redis.delete(CHAVE_DESPERTAR)
+                raise
+            logger.info("Despachante armado para %s (UTC).", quando)
+        return bool(armou)
+
+    def notificar(self, data_agendamento: Optional[datetime] = None):
+        """Chamado quando um agendamento é criado, alterado ou cancelado."""
+        # Um cancelamento não exige nada: o despertar armado, se houver,
+        # roda uma consulta vazia e se rearma para o próximo vencimento.
+        if data_agendamento is not None:
+            self.armar(data_agendamento)
+
+    def rearmar(self, db: Session) -> Optional[datetime]:
+        """Arma o despertar para o próximo vencimento; chamado ao fim de cada processamento."""
+        quando = AgendamentoService.proximo_vencimento(db)
+        if quando is None:
+            self._redis.delete(CHAVE_DESPERTAR)
+        else:
+            self.armar(quando, forcar=True)
+        return quando
+
+
+_despertadores = []
+
+
+def registrar(despertador):
+    """Registra um despertador para receber as notificações das rotas."""
+    _despertadores.append(despertador)
+
+
+def remover(despertador):
+    """Remove um despertador registrado (ex.: ao encerrar a aplicação)."""
+    if despertador in _despertadores:
+        _despertadores.remove(despertador)
+
+
+def configurar_despertadores():
+    """Registra os despertadores do modo configurado (AGENDAMENTO_MODO)."""
+    if MODO_AGENDAMENTO == "adaptativo":
+        registrar(DespertadorCelery())
+
+
+def notificar(data_agendamento: Optional[datetime] = None):
+    """
+    Avisa os despertadores que a fila mudou. Falhas (ex.: Redis fora do ar)
+    não afetam a requisição: a verificação periódica do Beat cobre o atraso.
+    """
+    for despertador in _despertadores:
+        try:
+            despertador.notificar(data_agendamento)
+        except Exception as e:
+            logger.warning("Falha ao notificar %s: %s", type(despertador).__name__, e)
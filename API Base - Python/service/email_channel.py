@@ -1,49 +1,153 @@
+import logging
 import smtplib
+import time
 from email.mime.text import MIMEText
-import os
+from email.utils import make_msgid
+from log_config import AMOSTRAR
+from service.canal import executar_bloqueante
+from service.retentativa import (
+    CLASSE_CONFIGURACAO, classe_por_recusados, classificar_erro,
+)
+from service.smtp_pool import ERROS_DA_MENSAGEM, PoolSMTP, obter_pool
+
+logger = logging.getLogger(__name__)
 
 
 class EmailChannel:
-    def __init__(self):
+    def __init__(self, pool: PoolSMTP = None):
         self.last_error = None
-    
-    def enviar(self, destinatario: str, assunto: str, conteudo: str):
-        remetente = os.getenv("EMAIL_USER")
-        senha = os.getenv("EMAIL_PASS")
-
-        # Ler configurações SMTP do ambiente (fallback para Gmail)
-        smtp_host = os.getenv("SMTP_HOST", "smtp.gmail.com")
-        try:
-            smtp_port = int(os.getenv("SMTP_PORT", "587"))
-        except ValueError:
-            smtp_port = 587
-
-        use_tls = os.getenv("SMTP_USE_TLS", "True").lower() in ("1", "true", "yes")
+        # Classe do último erro (service/retentativa.py): decide se o envio é repetido
+        self.last_error_class = None
+        # Message-ID do último envio, e (Message-ID, latência em ms, classe do
+        # erro) de cada mensagem do último lote
+        self.last_provider_id = None
+        self.detalhes_lote = []
+        # Pool de conexões SMTP compartilhado pelo processo (configuração lida uma vez)
+        self.pool = pool or obter_pool()
 
+    def _credenciais_ok(self) -> bool:
         # Validação básica
-        if not remetente or not senha:
+        config = self.pool.config
+        if not config.usuario or not config.senha:
             msg = "EMAIL_USER ou EMAIL_PASS não configurados no .env"
             self.last_error = msg
-            print(f"[EMAIL] Erro: {msg}")
+            self.last_error_class = CLASSE_CONFIGURACAO
+            logger.error(msg)
             return False
+        return True
 
+    def _montar(self, destinatario: str, assunto: str, conteudo: str) -> MIMEText:
         msg_obj = MIMEText(conteudo, "plain", "utf-8")
         msg_obj["Subject"] = assunto
-        msg_obj["From"] = remetente
+        msg_obj["From"] = self.pool.config.usuario
         msg_obj["To"] = destinatario
+        # Gerado aqui (e não pelo servidor) para identificar a mensagem no
+        # histórico; o domínio vem do remetente para evitar um getfqdn por envio
+        dominio = (self.pool.config.usuario or "").rpartition("@")[2] or "localhost"
+        msg_obj["Message-ID"] = make_msgid(domain=dominio)
+        return msg_obj
+
+    def enviar(self, destinatario: str, assunto: str, conteudo: str):
+        config = self.pool.config
+        if not self._credenciais_ok():
+            return False
+
+        msg_obj = self._montar(destinatario, assunto, conteudo)
+        self.last_provider_id = msg_obj["Message-ID"]
 
         try:
-            with smtplib.SMTP(smtp_host, smtp_port, timeout=20) as server:
-                if use_tls:
-                    server.starttls()
-                server.login(remetente, senha)
-                server.send_message(msg_obj)
-            print(f"[EMAIL] Mensagem enviada para {destinatario} via {smtp_host}:{smtp_port}")
+            self.pool.enviar(msg_obj)
+            logger.debug("Mensagem enviada para %s via %s:%s", destinatario, config.host, config.port,
+                         extra=AMOSTRAR)
             self.last_error = None
+            self.last_error_class = None
             return True
         except Exception as e:
             # Logar erro completo para diagnóstico
             err_msg = str(e)
-            print(f"[EMAIL] Erro ao enviar: {err_msg}")
+            logger.warning("Erro ao enviar para %s: %s", destinatario, err_msg)
             self.last_error = err_msg
+            self.last_error_class = classificar_erro(e)
             return False
+
+    def enviar_lote(self, mensagens: list) -> list:
+        """
+        Envia várias mensagens pela mesma sessão SMTP autenticada.
+
+        `mensagens` é uma lista de tuplas (destinatario, assunto, conteudo).
+        Retorna uma lista alinhada com a entrada de tuplas (sucesso, erro): um
+        destinatário recusado marca apenas a própria mensagem como erro. Se o
+        servidor derrubar a sessão no meio do lote, a mensagem interrompida
+        fica com erro de conexão (o servidor pode já tê-la aceitado; quem
+        reenvia é a retentativa) e as seguintes saem por uma nova conexão.
+
+        O Message-ID, a latência e a classe do erro de cada mensagem ficam
+        em `detalhes_lote`, na mesma ordem.
+        """
+        if not self._credenciais_ok():
+            self.detalhes_lote = [(None, None, self.last_error_class)] * len(mensagens)
+            return [(False, self.last_error)] * len(mensagens)
+
+        self.detalhes_lote = [(None, None, None)] * len(mensagens)
+
+        resultados = [None] * len(mensagens)
+        proxima = 0
+        while proxima < len(mensagens):
+            try:
+                with self.pool.conexao() as conexao:
+                    while proxima < len(mensagens):
+                        destinatario, assunto, conteudo = mensagens[proxima]
+                        msg_obj = self._montar(destinatario, assunto, conteudo)
+                        inicio = time.perf_counter()
+                        classe = None
+                        try:
+                            recusados = conexao.send_message(msg_obj)
+                            resultados[proxima] = (False, str(recusados)) if recusados else (True, None)
+                            classe = classe_por_recusados(recusados) if recusados else None
+                        except ERROS_DA_MENSAGEM as e:
+                            resultados[proxima] = (False, str(e))
+                            classe = classificar_erro(e)
+                        self.detalhes_lote[proxima] = (
+                            msg_obj["Message-ID"], round((time.perf_counter() - inicio) * 1000), classe
+                        )
+                        proxima += 1
+            except smtplib.SMTPServerDisconnected as e:
+                # Caiu durante o envio da mensagem `proxima`: não é reenviada
+                # aqui para não duplicar; as seguintes vão por outra conexão
+                resultados[proxima] = (False, str(e))
+                self.detalhes_lote[proxima] = (None, None, classificar_erro(e))
+                proxima += 1
+            except Exception as e:
+                # Falha de conexão, login ou timeout: as mensagens restantes não saem
+                classe = classificar_erro(e)
+                for i in range(proxima, len(mensagens)):
+                    resultados[i] = (False, str(e))
+                    self.detalhes_lote[i] = (None, None, classe)
+                break
+
+        falhas = [erro for sucesso, erro in resultados if not sucesso]
+        self.last_error = falhas[-1] if falhas else None
+        logger.info("Lote de %d mensagens enviado via %s:%s (%d falha(s))",
+                    len(mensagens), self.pool.config.host, self.pool.config.port, len(falhas))
+        return resultados
+
+
+class EmailChannelAsync:
+    """
+    Canal de email para o event loop. O envio usa o mesmo pool SMTP do
+    EmailChannel, mas roda no executor dos canais em vez de bloquear o loop.
+    """
+
+    def __init__(self, pool: PoolSMTP = None):
+        self.pool = pool or obter_pool()
+
+    def _enviar(self, destinatario: str, assunto: str, conteudo: str):
+        # Um EmailChannel por chamada: o last_error não é compartilhado entre envios simultâneos
+        canal = EmailChannel(self.pool)
+        sucesso = canal.enviar(destinatario, assunto, conteudo)
+        return (sucesso, canal.last_error, canal.last_provider_id, canal.last_error_class)
+
+    async def enviar(self, destinatario: str, conteudo: str, assunto: str = None):
+        return await executar_bloqueante(
+            self._enviar, destinatario, assunto or "Notificação Automática", conteudo
+        )
@@ -0,0 +1,91 @@
+import csv
+import io
+import logging
+import os
+import zlib
+from typing import Callable, Iterator, Optional
+
+from sqlalchemy import select
+
+from database import SessionLocal, Contact
+
+logger = logging.getLogger(__name__)
+
+# Linhas lidas do banco e escritas no CSV por bloco; é o que fica em memória durante a exportação
+TAMANHO_BLOCO_EXPORTACAO = int(os.getenv("EXPORTACAO_TAMANHO_BLOCO", "5000"))
+
+COLUNAS_CSV = ["id", "name", "email", "phone", "canalPref", "codExterno", "cliente_id"]
+
+
+def filtrar_contatos(consulta, contact_id: Optional[int] = None, cliente_id: Optional[int] = None,
+                     search: Optional[str] = None):
+    """Aplica os filtros da exportação a uma Query ou a um select()."""
+    if contact_id is not None:
+        return consulta.filter(Contact.id == contact_id)
+    if cliente_id is not None:
+        consulta = consulta.filter(Contact.cliente_id == cliente_id)
+    if search:
+        termo = f"%{search}%"
+        consulta = consulta.filter(
+            Contact.name.ilike(termo) | Contact.email.ilike(termo) | Contact.phone.ilike(termo)
+        )
+    return consulta
+
+
+def gerar_csv_contatos(contact_id: Optional[int] = None, cliente_id: Optional[int] = None,
+                       search: Optional[str] = None, compactar: bool = False,
+                       tamanho_bloco: int = None,
+                       progresso: Callable[[int], None] = None) -> Iterator[bytes]:
+    """
+    Gera o CSV dos contatos em blocos de bytes, para um StreamingResponse.
+
+    Lê o banco com yield_per (cursor do lado do servidor no PostgreSQL;
+    leitura incremental no SQLite) e emite cada bloco assim que ele é
+    escrito, então a memória usada não depende do número de contatos e o
+    primeiro byte sai logo após a primeira leitura. Com `compactar`, o CSV sai
+    em gzip, compactado conforme é gerado.
+
+    Usa uma sessão própria: a resposta continua sendo transmitida depois que a
+    sessão da requisição (get_async_db) já foi fechada. `progresso`, se informado,
+    recebe o total de linhas exportadas após cada bloco.
+    """
+    tamanho_bloco = tamanho_bloco or TAMANHO_BLOCO_EXPORTACAO
+    # wbits=31 gera o formato gzip (cabeçalho e CRC) em vez de zlib puro
+    compressor = zlib.compressobj(wbits=31) if compactar else None
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+
+    def esvaziar() -> bytes:
+        bloco = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+        return compressor.compress(bloco) if compressor else bloco
+
+    escritor.writerow(COLUNAS_CSV)
+    yield esvaziar()
+
+    total = 0
+    db = SessionLocal()
+    try:
+        consulta = filtrar_contatos(
+            select(*[getattr(Contact, coluna) for coluna in COLUNAS_CSV]), contact_id, cliente_id, search
+        ).order_by(Contact.id)
+        resultado = db.execute(consulta.execution_options(yield_per=tamanho_bloco))
+        for linhas in resultado.partitions():
+            escritor.writerows(["" if valor is None else valor for valor in linha] for linha in linhas)
+            total += len(linhas)
+            if progresso:
+                progresso(total)
+            bloco = esvaziar()
+            if bloco:
+                yield bloco
+    except Exception:
+        # A resposta já começou; só resta registrar e interromper a transmissão
+        logger.exception("Erro ao exportar contatos após %d linhas", total)
+        raise
+    finally:
+        db.close()
+
+    if compressor:
+        yield compressor.flush()
+    logger.info("Exportação de contatos concluída: %d linhas", total)
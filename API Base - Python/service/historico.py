@@ -0,0 +1,162 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import insert
+
+from database import HistoricoMensagem, engine
+
+logger = logging.getLogger(__name__)
+
+# Registros pendentes que disparam a gravação imediata de um lote
+TAMANHO_LOTE = int(os.getenv("HISTORICO_TAMANHO_LOTE", "200"))
+# Tempo máximo que um registro espera em memória antes de ser gravado
+INTERVALO_SEGUNDOS = float(os.getenv("HISTORICO_INTERVALO_SEGUNDOS", "2"))
+# Registros guardados enquanto o banco não aceita gravações; acima disso os
+# mais antigos são descartados (o envio nunca espera pelo histórico)
+MAX_PENDENTES = int(os.getenv("HISTORICO_MAX_PENDENTES", "50000"))
+
+STATUS_ENVIADO = "ENVIADO"
+STATUS_ERRO = "ERRO"
+
+
+class GravadorHistorico:
+    """
+    Grava o histórico de envios em lotes, por uma thread de fundo.
+
+    `registrar` só acrescenta o registro a um buffer em memória; a thread
+    grava o buffer com um único INSERT (executemany) quando ele chega a
+    `tamanho_lote` registros ou quando o registro mais antigo completa
+    `intervalo` segundos. Se a gravação falhar, o lote volta ao buffer e é
+    tentado de novo no próximo intervalo.
+    """
+
+    def __init__(self, engine_historico=None, tamanho_lote: int = None,
+                 intervalo: float = None, max_pendentes: int = None):
+        self.engine = engine_historico or engine
+        self.tamanho_lote = tamanho_lote or TAMANHO_LOTE
+        self.intervalo = INTERVALO_SEGUNDOS if intervalo is None else intervalo
+        self.max_pendentes = max_pendentes or MAX_PENDENTES
+        self.gravados = 0
+        self.descartados = 0
+        self._pendentes = []
+        self._condicao = threading.Condition()
+        self._encerrado = False
+        self._thread = threading.Thread(target=self._executar, name="historico", daemon=True)
+        self._thread.start()
+
+    def registrar(self, registro: dict):
+        """Enfileira um registro (colunas de historico_mensagens) para o próximo lote."""
+        with self._condicao:
+            self._pendentes.append(registro)
+            self._limitar_pendentes()
+            # O primeiro registro inicia a contagem do intervalo; o lote cheio grava na hora
+            if len(self._pendentes) == 1 or len(self._pendentes) >= self.tamanho_lote:
+                self._condicao.notify()
+
+    def _limitar_pendentes(self):
+        excesso = len(self._pendentes) - self.max_pendentes
+        if excesso > 0:
+            del self._pendentes[:excesso]
+            self.descartados += excesso
+            logger.warning("Histórico: %d registro(s) descartado(s), buffer cheio", excesso)
+
+    def _executar(self):
+        falhou = False
+        while True:
+            with self._condicao:
+                while not self._pendentes and not self._encerrado:
+                    self._condicao.wait()
+                # Depois de uma falha, espera o intervalo inteiro antes de tentar de novo
+                limite = time.monotonic() + self.intervalo
+                while not self._encerrado and (falhou or len(self._pendentes) < self.tamanho_lote):
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        break
+                    self._condicao.wait(restante)
+                lote, self._pendentes = self._pendentes, []
+                encerrado = self._encerrado
+            if not lote:
+                return
+            falhou = not self._gravar(lote)
+            if falhou and not encerrado:
+                with self._condicao:
+                    self._pendentes[:0] = lote
+                    self._limitar_pendentes()
+            elif falhou:
+                self.descartados += len(lote)
+
+    def _gravar(self, lote: list) -> bool:
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(insert(HistoricoMensagem.__table__), lote)
+        except Exception:
+            logger.exception("Erro ao gravar %d registro(s) do histórico", len(lote))
+            return False
+        self.gravados += len(lote)
+        logger.debug("Histórico: %d registro(s) gravado(s)", len(lote))
+        return True
+
+    def descarregar(self):
+        """Encerra a thread depois de gravar os registros pendentes."""
+        with self._condicao:
+            self._encerrado = True
+            self._condicao.notify()
+        self._thread.join()
+
+
+_gravador = None
+_lock = threading.Lock()
+
+
+def obter_gravador() -> GravadorHistorico:
+    """Retorna o gravador do processo, criando-o na primeira chamada."""
+    global _gravador
+    if _gravador is None:
+        with _lock:
+            if _gravador is None:
+                _gravador = GravadorHistorico()
+                atexit.register(encerrar_historico)
+    return _gravador
+
+
+def encerrar_historico():
+    """Grava os registros pendentes e para a thread do gravador."""
+    global _gravador
+    with _lock:
+        gravador, _gravador = _gravador, None
+    if gravador is not None:
+        gravador.descarregar()
+
+
+def _descartar_apos_fork():
+    # A thread não sobrevive ao fork (ex.: processos filhos do Celery) e os
+    # registros pendentes são do processo pai, que os grava; o filho cria o seu
+    global _gravador
+    _gravador = None
+
+
+os.register_at_fork(after_in_child=_descartar_apos_fork)
+
+
+def registrar_envio(canal: str, destinatario: str, conteudo: str, sucesso: bool,
+                    erro: Optional[str] = None, latencia_ms: Optional[float] = None,
+                    provider_id: Optional[str] = None, contato_id: Optional[int] = None,
+                    mensagem_agendada_id: Optional[int] = None):
+    """Registra no histórico o resultado de um envio, sem acessar o banco."""
+    obter_gravador().registrar({
+        "canal": (canal or "").lower(),
+        "destinatario": destinatario,
+        "conteudo": conteudo,
+        "status": STATUS_ENVIADO if sucesso else STATUS_ERRO,
+        "data_envio": datetime.utcnow(),
+        "contato_id": contato_id,
+        "mensagem_agendada_id": mensagem_agendada_id,
+        "latencia_ms": None if latencia_ms is None else round(latencia_ms),
+        "provider_id": provider_id,
+        "erro": None if sucesso else erro,
+    })
@@ -0,0 +1,306 @@
+import codecs
+import csv
+import io
+import logging
+import os
+from typing import BinaryIO, Callable, Iterator, List, Tuple
+
+from sqlalchemy import insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, Cliente, Contact
+
+logger = logging.getLogger(__name__)
+
+# Linhas validadas e gravadas por vez (uma consulta de pré-carga e um INSERT por lote)
+TAMANHO_LOTE_IMPORTACAO = int(os.getenv("IMPORTACAO_TAMANHO_LOTE", "5000"))
+
+# Modos de importação: "inserir" recusa emails já cadastrados (comportamento
+# original); "atualizar" atualiza o contato existente (upsert pelo email)
+MODO_INSERIR = "inserir"
+MODO_ATUALIZAR = "atualizar"
+
+CAMPOS_OBRIGATORIOS = {"name", "email"}
+CAMPOS_ATUALIZADOS = ["name", "phone", "canalPref", "codExterno", "cliente_id"]
+
+_BLOCO_LEITURA = 1024 * 1024
+
+
+class ArquivoInvalido(ValueError):
+    """O arquivo não pôde ser lido como CSV de contatos."""
+
+
+def detectar_codificacao(arquivo: BinaryIO) -> str:
+    """
+    Decide entre UTF-8 e latin-1 lendo o arquivo em blocos, sem carregá-lo
+    inteiro, e volta ao início. O BOM do UTF-8, se houver, é descartado.
+    """
+    decodificador = codecs.getincrementaldecoder("utf-8")()
+    try:
+        while True:
+            bloco = arquivo.read(_BLOCO_LEITURA)
+            decodificador.decode(bloco, final=not bloco)
+            if not bloco:
+                return "utf-8-sig"
+    except UnicodeDecodeError:
+        return "latin-1"
+    finally:
+        arquivo.seek(0)
+
+
+def _normalizar(linha: List[str], posicoes: dict) -> dict:
+    """
+    Converte uma linha do CSV (lista de valores) nos campos do contato, com
+    as mesmas regras da importação original. `posicoes` mapeia cada campo
+    para a sua coluna no cabeçalho.
+    """
+    if len(linha) < posicoes["_colunas"]:
+        raise ValueError("a linha tem menos colunas que o cabeçalho")
+
+    def valor(campo: str) -> str:
+        posicao = posicoes.get(campo)
+        return linha[posicao].strip() if posicao is not None else ""
+
+    dados = {
+        "name": valor("name"),
+        "email": valor("email").lower(),
+        "phone": valor("phone") or None,
+        "canalPref": valor("canalPref").lower() or None,
+        "codExterno": valor("codExterno") or None,
+        "cliente_id": None,
+    }
+    cliente_id = valor("cliente_id")
+    if cliente_id:
+        try:
+            dados["cliente_id"] = int(cliente_id)
+        except ValueError:
+            pass
+    if not dados["name"] or not dados["email"]:
+        raise ValueError("nome e email são obrigatórios")
+    return dados
+
+
+class ImportadorContatos:
+    """
+    Importa contatos de um CSV em lotes.
+
+    O arquivo é lido linha a linha (a memória usada depende do tamanho do
+    lote, não do arquivo). Para cada lote, os emails, códigos externos e
+    clientes já cadastrados são carregados em até três consultas, as linhas
+    são validadas em
+    memória e as válidas são gravadas em um único INSERT com vários valores
+    (COPY no PostgreSQL, ou INSERT ... ON CONFLICT no modo "atualizar"). Os
+    erros continuam sendo reportados por linha.
+
+    `progresso`, se informado, é chamado com o próprio importador ao fim de
+    cada lote (contadores importados, atualizados, total_linhas e erros).
+    """
+
+    def __init__(self, db: Session, modo: str = MODO_INSERIR, tamanho_lote: int = None,
+                 progresso: Callable[["ImportadorContatos"], None] = None):
+        if modo not in (MODO_INSERIR, MODO_ATUALIZAR):
+            raise ValueError(f"Modo de importação inválido: {modo}")
+        self.db = db
+        self.modo = modo
+        self.tamanho_lote = tamanho_lote or TAMANHO_LOTE_IMPORTACAO
+        self.progresso = progresso
+        self.importados = 0
+        self.atualizados = 0
+        self.total_linhas = 0
+        # (número da linha, mensagem)
+        self.erros: List[Tuple[int, str]] = []
+        self._campos_atualizados = CAMPOS_ATUALIZADOS
+
+    def importar(self, arquivo: BinaryIO) -> dict:
+        texto = io.TextIOWrapper(arquivo, encoding=detectar_codificacao(arquivo), newline="")
+        try:
+            leitor = csv.reader(texto)
+            campos = [campo.strip() for campo in next(leitor, [])]
+            if not CAMPOS_OBRIGATORIOS.issubset(campos):
+                faltando = CAMPOS_OBRIGATORIOS - set(campos)
+                raise ArquivoInvalido(f"Campos obrigatórios ausentes no CSV: {', '.join(sorted(faltando))}")
+            # No upsert, colunas ausentes do arquivo mantêm o valor cadastrado
+            self._campos_atualizados = [campo for campo in CAMPOS_ATUALIZADOS if campo in campos]
+
+            posicoes = {campo: campos.index(campo) for campo in ["email", *CAMPOS_ATUALIZADOS] if campo in campos}
+            posicoes["_colunas"] = max(posicoes.values()) + 1
+            for lote in self._lotes(leitor, posicoes):
+                self._gravar_lote(lote)
+                if self.progresso:
+                    self.progresso(self)
+        finally:
+            # Não fecha o arquivo recebido junto com o wrapper
+            texto.detach()
+        return self.resultado()
+
+    def resultado(self) -> dict:
+        resposta = {
+            "status": "sucesso",
+            "importados": self.importados,
+            "total_linhas": self.total_linhas,
+        }
+        if self.modo == MODO_ATUALIZAR:
+            resposta["atualizados"] = self.atualizados
+        if self.erros:
+            resposta["erros"] = [mensagem for _, mensagem in sorted(self.erros, key=lambda erro: erro[0])]
+            resposta["status"] = "parcial" if self.importados or self.atualizados else "erro"
+        return resposta
+
+    def _lotes(self, leitor, posicoes: dict) -> Iterator[List[Tuple[int, dict]]]:
+        """Agrupa as linhas normalizadas em lotes; linhas inválidas viram erro."""
+        lote = []
+        emails_no_lote = set()
+        for linha in leitor:
+            # Linha do arquivo onde o registro termina (um campo entre aspas pode ocupar várias)
+            numero = leitor.line_num
+            if not linha:
+                continue
+            self.total_linhas += 1
+            try:
+                dados = _normalizar(linha, posicoes)
+            except Exception as e:
+                self._erro(numero, f"Erro na linha {numero}: {e}")
+                continue
+            # No modo "atualizar" um email repetido dentro do lote fecha o lote:
+            # a repetição vira um conflito com a linha já gravada e a atualiza
+            if (len(lote) >= self.tamanho_lote
+                    or (self.modo == MODO_ATUALIZAR and dados["email"] in emails_no_lote)):
+                yield lote
+                lote = []
+                emails_no_lote = set()
+            lote.append((numero, dados))
+            emails_no_lote.add(dados["email"])
+        if lote:
+            yield lote
+
+    def _gravar_lote(self, lote: List[Tuple[int, dict]]):
+        emails = {dados["email"] for _, dados in lote}
+        codigos = {dados["codExterno"] for _, dados in lote if dados["codExterno"]}
+        emails_existentes = set(self.db.scalars(select(Contact.email).where(Contact.email.in_(emails))))
+        dono_codigo = dict(self.db.execute(
+            select(Contact.codExterno, Contact.email).where(Contact.codExterno.in_(codigos))
+        ).all()) if codigos else {}
+        # Com as chaves estrangeiras ativas, um cliente_id inexistente faria o
+        # INSERT do lote inteiro falhar; a linha é recusada antes
+        clientes = {dados["cliente_id"] for _, dados in lote if dados["cliente_id"] is not None}
+        clientes_existentes = set(self.db.scalars(
+            select(Cliente.id).where(Cliente.id.in_(clientes))
+        )) if clientes else set()
+
+        # (linha, dados, se o email já estava cadastrado)
+        validas = []
+        for numero, dados in lote:
+            email, codigo = dados["email"], dados["codExterno"]
+            existente = email in emails_existentes
+            if existente and self.modo == MODO_INSERIR:
+                self._erro(numero, f"Linha {numero}: Email {email} já existe")
+                continue
+            if codigo and dono_codigo.get(codigo, email) != email:
+                self._erro(numero, f"Linha {numero}: Código externo {codigo} já existe")
+                continue
+            if dados["cliente_id"] is not None and dados["cliente_id"] not in clientes_existentes:
+                self._erro(numero, f"Linha {numero}: Cliente {dados['cliente_id']} não existe")
+                continue
+            validas.append((numero, dados, existente))
+            # Linhas seguintes do mesmo lote enxergam as anteriores como já cadastradas
+            emails_existentes.add(email)
+            if codigo:
+                dono_codigo[codigo] = email
+
+        if not validas:
+            return
+        dialeto = self.db.get_bind().dialect
+        # No PostgreSQL a violação de unicidade do COPY chega como exceção do
+        # próprio driver, sem passar pelo SQLAlchemy
+        conflitos = (IntegrityError, dialeto.dbapi.IntegrityError) if dialeto.name == "postgresql" else IntegrityError
+        try:
+            if self.modo == MODO_INSERIR and dialeto.name == "postgresql":
+                self._copiar([dados for _, dados, _ in validas])
+            else:
+                self.db.execute(self._comando(), [dados for _, dados, _ in validas])
+            self.db.commit()
+        except conflitos:
+            # Conflito não previsto na pré-carga (ex.: gravação concorrente):
+            # refaz o lote linha a linha para apontar as linhas com problema
+            self.db.rollback()
+            validas = self._gravar_linha_a_linha(validas)
+
+        atualizados = sum(1 for _, _, existente in validas if existente)
+        self.atualizados += atualizados
+        self.importados += len(validas) - atualizados
+
+    def _gravar_linha_a_linha(self, validas: list) -> list:
+        gravadas = []
+        comando = self._comando()
+        for numero, dados, existente in validas:
+            try:
+                with self.db.begin_nested():
+                    self.db.execute(comando, [dados])
+                gravadas.append((numero, dados, existente))
+            except IntegrityError as e:
+                self._erro(numero, f"Erro na linha {numero}: {e.orig}")
+        self.db.commit()
+        return gravadas
+
+    def _copiar(self, linhas: List[dict]):
+        """
+        Grava um lote com COPY ... FROM STDIN (PostgreSQL): as linhas vão ao
+        servidor como um único CSV, sem um comando por linha nem parâmetros.
+        """
+        tabela = Contact.__table__
+        colunas = list(linhas[0])
+        preparador = self.db.get_bind().dialect.identifier_preparer
+        comando = "COPY {} ({}) FROM STDIN WITH (FORMAT csv)".format(
+            preparador.format_table(tabela),
+            ", ".join(preparador.quote(coluna) for coluna in colunas),
+        )
+        buffer = io.StringIO()
+        # None vira campo vazio sem aspas, que o COPY em CSV lê como NULL
+        csv.writer(buffer).writerows([linha[coluna] for coluna in colunas] for linha in linhas)
+        buffer.seek(0)
+        cursor = self.db.connection().connection.cursor()
+        try:
+            cursor.copy_expert(comando, buffer)
+        finally:
+            cursor.close()
+
+    def _comando(self):
+        # INSERT do Core sobre a tabela: vai direto para o executemany do
+        # driver, sem o processamento por linha da gravação em massa do ORM
+        tabela = Contact.__table__
+        if self.modo == MODO_INSERIR:
+            return insert(tabela)
+        dialeto = self.db.get_bind().dialect.name
+        if dialeto == "postgresql":
+            comando = postgresql.insert(tabela)
+        elif dialeto == "sqlite":
+            comando = sqlite.insert(tabela)
+        else:
+            raise ArquivoInvalido(f"Modo 'atualizar' não suportado no banco {dialeto}")
+        return comando.on_conflict_do_update(
+            index_elements=[tabela.c.email],
+            set_={campo: comando.excluded[campo] for campo in self._campos_atualizados},
+        )
+
+    def _erro(self, numero: int, mensagem: str):
+        logger.debug(mensagem)
+        self.erros.append((numero, mensagem))
+
+
+def importar_contatos(arquivo: BinaryIO, modo: str = MODO_INSERIR, tamanho_lote: int = None) -> dict:
+    """
+    Importa o CSV de `arquivo` (binário, posicionado no início) com uma
+    sessão própria e retorna o resumo da importação.
+    """
+    db = SessionLocal()
+    try:
+        resultado = ImportadorContatos(db, modo, tamanho_lote).importar(arquivo)
+    finally:
+        db.close()
+    logger.info(
+        "Importação concluída: %d contatos importados, %d atualizados, %d erro(s).",
+        resultado["importados"], resultado.get("atualizados", 0), len(resultado.get("erros", [])),
+    )
+    return resultado
@@ -0,0 +1,263 @@
+import csv
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Optional
+
+import redis
+
+from celery_app import celery_app, REDIS_URL
+from database import SessionLocal
+from service.exportacao_contatos import gerar_csv_contatos
+from service.importacao_contatos import ImportadorContatos
+
+logger = logging.getLogger(__name__)
+
+# Onde os jobs executam: "local" (threads do próprio processo da API) ou
+# "celery" (tarefa tasks.executar_job nos workers)
+EXECUTOR_JOBS = os.getenv("JOBS_EXECUTOR", "local").lower()
+# Onde o estado dos jobs fica: "memoria" (só o processo da API enxerga) ou
+# "redis" (obrigatório com o executor celery ou com vários processos da API)
+ARMAZENAMENTO_JOBS = os.getenv("JOBS_ARMAZENAMENTO", "redis" if EXECUTOR_JOBS == "celery" else "memoria").lower()
+# Tempo que o estado e os arquivos de um job são mantidos após a última atualização
+TTL_JOBS_SEGUNDOS = int(os.getenv("JOBS_TTL_SEGUNDOS", "86400"))
+# Diretório dos arquivos enviados e gerados; com o executor celery, precisa ser
+# compartilhado entre a API e os workers
+DIRETORIO_JOBS = os.getenv("JOBS_DIRETORIO", "./jobs_arquivos")
+# Jobs executados ao mesmo tempo pelo executor local
+WORKERS_JOBS = int(os.getenv("JOBS_WORKERS", "2"))
+# Erros de importação guardados no estado; a lista completa vai para o arquivo de resultado
+AMOSTRA_ERROS = 20
+
+TIPO_IMPORTACAO = "importacao_contatos"
+TIPO_EXPORTACAO = "exportacao_contatos"
+
+STATUS_PENDENTE = "PENDENTE"
+STATUS_EXECUTANDO = "EXECUTANDO"
+STATUS_CONCLUIDO = "CONCLUIDO"
+STATUS_ERRO = "ERRO"
+
+
+class ArmazenamentoMemoria:
+    """Estado dos jobs em um dicionário do processo, com expiração por TTL."""
+
+    def __init__(self, ttl: int = None):
+        self.ttl = ttl or TTL_JOBS_SEGUNDOS
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def salvar(self, estado: dict):
+        agora = time.time()
+        with self._lock:
+            # Poucos jobs por processo: a limpeza a cada gravação é barata
+            for job_id in [j for j, (expira_em, _) in self._jobs.items() if expira_em <= agora]:
+                del self._jobs[job_id]
+            self._jobs[estado["id"]] = (agora + self.ttl, json.dumps(estado, separators=(",", ":")))
+
+    def obter(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            item = self._jobs.get(job_id)
+        if item is None or item[0] <= time.time():
+            return None
+        return json.loads(item[1])
+
+
+class ArmazenamentoRedis:
+    """Estado dos jobs no Redis, uma chave JSON por job com expiração (SET EX)."""
+
+    PREFIXO = "jobs:"
+
+    def __init__(self, cliente_redis: redis.Redis = None, ttl: int = None):
+        self._redis = cliente_redis or redis.Redis.from_url(REDIS_URL)
+        self.ttl = ttl or TTL_JOBS_SEGUNDOS
+
+    def salvar(self, estado: dict):
+        self._redis.set(self.PREFIXO + estado["id"], json.dumps(estado, separators=(",", ":")), ex=self.ttl)
+
+    def obter(self, job_id: str) -> Optional[dict]:
+        dados = self._redis.get(self.PREFIXO + job_id)
+        return json.loads(dados) if dados else None
+
+
+_armazenamento = None
+_executor_local = None
+_lock = threading.Lock()
+
+
+def obter_armazenamento():
+    """Retorna o armazenamento configurado (JOBS_ARMAZENAMENTO), criando-o na primeira chamada."""
+    global _armazenamento
+    if _armazenamento is None:
+        with _lock:
+            if _armazenamento is None:
+                _armazenamento = ArmazenamentoRedis() if ARMAZENAMENTO_JOBS == "redis" else ArmazenamentoMemoria()
+    return _armazenamento
+
+
+def caminho_arquivo(nome: str) -> str:
+    return os.path.join(DIRETORIO_JOBS, nome)
+
+
+def limpar_arquivos_expirados():
+    """Remove do diretório dos jobs os arquivos mais antigos que o TTL."""
+    if not os.path.isdir(DIRETORIO_JOBS):
+        return
+    limite = time.time() - TTL_JOBS_SEGUNDOS
+    for nome in os.listdir(DIRETORIO_JOBS):
+        caminho = caminho_arquivo(nome)
+        try:
+            if os.path.getmtime(caminho) < limite:
+                os.remove(caminho)
+        except OSError:
+            # Já removido por outro processo
+            pass
+
+
+def guardar_arquivo_entrada(arquivo: BinaryIO) -> str:
+    """Copia um upload para o diretório dos jobs e retorna o nome do arquivo gravado."""
+    os.makedirs(DIRETORIO_JOBS, exist_ok=True)
+    nome = f"{uuid.uuid4().hex}_entrada.csv"
+    with open(caminho_arquivo(nome), "wb") as destino:
+        shutil.copyfileobj(arquivo, destino, 1024 * 1024)
+    return nome
+
+
+def criar_job(tipo: str, usuario: str, parametros: dict) -> dict:
+    """Registra um job PENDENTE e retorna o seu estado (o id é gerado aqui)."""
+    os.makedirs(DIRETORIO_JOBS, exist_ok=True)
+    limpar_arquivos_expirados()
+    estado = {
+        "id": uuid.uuid4().hex,
+        "tipo": tipo,
+        "usuario": usuario,
+        "status": STATUS_PENDENTE,
+        "parametros": parametros,
+        "criado_em": time.time(),
+        "iniciado_em": None,
+        "concluido_em": None,
+        "processadas": 0,
+        "erros": 0,
+        "amostra_erros": [],
+        "arquivo": None,
+        "resultado": None,
+        "mensagem": None,
+    }
+    obter_armazenamento().salvar(estado)
+    return estado
+
+
+def submeter_job(estado: dict):
+    """Envia o job para o executor configurado (JOBS_EXECUTOR)."""
+    global _executor_local
+    if EXECUTOR_JOBS == "celery":
+        celery_app.send_task("tasks.executar_job", args=[estado["id"]])
+        return
+    if _executor_local is None:
+        with _lock:
+            if _executor_local is None:
+                _executor_local = ThreadPoolExecutor(max_workers=WORKERS_JOBS, thread_name_prefix="job")
+    _executor_local.submit(executar_job, estado["id"])
+
+
+def encerrar_executor_local():
+    """Descarta os jobs locais ainda na fila; os em execução terminam em segundo plano."""
+    global _executor_local
+    if _executor_local is not None:
+        _executor_local.shutdown(wait=False, cancel_futures=True)
+        _executor_local = None
+
+
+def obter_job(job_id: str) -> Optional[dict]:
+    """Retorna o estado do job com a vazão calculada, ou None se não existir ou tiver expirado."""
+    estado = obter_armazenamento().obter(job_id)
+    if estado is None:
+        return None
+    estado["linhas_por_segundo"] = None
+    if estado["iniciado_em"]:
+        duracao = (estado["concluido_em"] or time.time()) - estado["iniciado_em"]
+        if duracao > 0:
+            estado["linhas_por_segundo"] = round(estado["processadas"] / duracao, 1)
+    return estado
+
+
+def executar_job(job_id: str):
+    """Executa um job registrado; chamado pelo executor local ou pela tarefa do Celery."""
+    armazenamento = obter_armazenamento()
+    estado = armazenamento.obter(job_id)
+    if estado is None:
+        logger.warning("Job %s não encontrado (expirado?)", job_id)
+        return
+    estado["status"] = STATUS_EXECUTANDO
+    estado["iniciado_em"] = time.time()
+    armazenamento.salvar(estado)
+    logger.info("Job %s (%s) iniciado", job_id, estado["tipo"])
+    try:
+        if estado["tipo"] == TIPO_IMPORTACAO:
+            _executar_importacao(estado, armazenamento)
+        elif estado["tipo"] == TIPO_EXPORTACAO:
+            _executar_exportacao(estado, armazenamento)
+        else:
+            raise ValueError(f"Tipo de job desconhecido: {estado['tipo']}")
+        estado["status"] = STATUS_CONCLUIDO
+    except Exception as e:
+        logger.exception("Erro no job %s", job_id)
+        estado["status"] = STATUS_ERRO
+        estado["mensagem"] = str(e)
+    finally:
+        estado["concluido_em"] = time.time()
+        armazenamento.salvar(estado)
+    logger.info("Job %s terminou com status %s: %d linhas", job_id, estado["status"], estado["processadas"])
+
+
+def _executar_importacao(estado: dict, armazenamento):
+    def progresso(importador):
+        estado["processadas"] = importador.total_linhas
+        estado["erros"] = len(importador.erros)
+        armazenamento.salvar(estado)
+
+    entrada = caminho_arquivo(estado["parametros"]["arquivo_entrada"])
+    db = SessionLocal()
+    try:
+        importador = ImportadorContatos(db, estado["parametros"]["modo"], progresso=progresso)
+        with open(entrada, "rb") as arquivo:
+            resultado = importador.importar(arquivo)
+    finally:
+        db.close()
+        if os.path.exists(entrada):
+            os.remove(entrada)
+
+    erros = resultado.pop("erros", [])
+    estado["processadas"] = resultado["total_linhas"]
+    estado["erros"] = len(erros)
+    estado["amostra_erros"] = erros[:AMOSTRA_ERROS]
+    estado["resultado"] = resultado
+    if erros:
+        # O relatório completo de erros é o arquivo para download
+        nome = f"{estado['id']}_erros.csv"
+        with open(caminho_arquivo(nome), "w", encoding="utf-8", newline="") as saida:
+            escritor = csv.writer(saida)
+            escritor.writerow(["erro"])
+            escritor.writerows([erro] for erro in erros)
+        estado["arquivo"] = nome
+
+
+def _executar_exportacao(estado: dict, armazenamento):
+    def progresso(total: int):
+        estado["processadas"] = total
+        armazenamento.salvar(estado)
+
+    parametros = estado["parametros"]
+    nome = f"{estado['id']}.csv.gz" if parametros["gzip"] else f"{estado['id']}.csv"
+    with open(caminho_arquivo(nome), "wb") as saida:
+        for bloco in gerar_csv_contatos(
+            parametros["contact_id"], parametros["cliente_id"], parametros["search"],
+            compactar=parametros["gzip"], progresso=progresso,
+        ):
+            saida.write(bloco)
+    estado["arquivo"] = nome
+    estado["resultado"] = {"exportados": estado["processadas"]}
@@ -0,0 +1,75 @@
+import math
+import threading
+import time
+
+
+class Reserva:
+    """
+    Resultado de uma reserva de envios em um token bucket: `esperas` traz,
+    para cada envio concedido, quantos segundos ele ainda deve aguardar pela
+    sua vez; `adiamentos`, para cada envio que não coube na espera máxima,
+    em quantos segundos ele deve voltar a ser tentado (espaçados pela taxa).
+    """
+
+    def __init__(self, esperas: list, adiamentos: list):
+        self.esperas = esperas
+        self.adiamentos = adiamentos
+
+    @classmethod
+    def livre(cls, quantidade: int) -> "Reserva":
+        return cls([0.0] * quantidade, [])
+
+    @classmethod
+    def calcular(cls, taxa: float, tokens: float, concedidos: int, adiados: int,
+                 inicio_adiamentos: float) -> "Reserva":
+        """Monta a reserva a partir dos tokens disponíveis antes dela."""
+        return cls(
+            [max(0.0, (j + 1 - tokens) / taxa) for j in range(concedidos)],
+            [inicio_adiamentos + i / taxa for i in range(adiados)],
+        )
+
+
+class LimitadorTaxa:
+    """
+    Token bucket local e thread-safe: permite no máximo `taxa` operações por
+    segundo, com rajadas de até `capacidade` operações.
+    """
+
+    def __init__(self, taxa: float, capacidade: float = None):
+        self.taxa = float(taxa)
+        self.capacidade = float(capacidade or max(1.0, taxa))
+        self._tokens = self.capacidade
+        self._atualizado_em = time.monotonic()
+        # Até quando já há envios adiados (ver reservar)
+        self._fila_ate = 0.0
+        self._lock = threading.Lock()
+
+    def _reabastecer(self, agora: float):
+        self._tokens = min(self.capacidade, self._tokens + (agora - self._atualizado_em) * self.taxa)
+        self._atualizado_em = agora
+
+    def reservar(self, quantidade: int, espera_maxima: float) -> Reserva:
+        """
+        Reserva de uma vez a vez de `quantidade` operações, sem bloquear.
+
+        São concedidas as que ficam disponíveis em até `espera_maxima`
+        segundos (os tokens podem ficar negativos: cada reserva entra depois
+        das anteriores). As demais não consomem tokens: recebem horários
+        futuros, um a cada 1/taxa segundos, depois dos adiamentos anteriores,
+        para que voltem uma por vez em vez de todas juntas.
+        """
+        if self.taxa <= 0:
+            return Reserva.livre(quantidade)
+        with self._lock:
+            agora = time.monotonic()
+            self._reabastecer(agora)
+            tokens = self._tokens
+            concedidos = max(0, min(quantidade, math.floor(tokens + self.taxa * espera_maxima)))
+            self._tokens -= concedidos
+            adiados = quantidade - concedidos
+            inicio = 0.0
+            if adiados:
+                inicio = max(agora + max(0.0, (1 - self._tokens) / self.taxa), self._fila_ate)
+                self._fila_ate = inicio + adiados / self.taxa
+                inicio -= agora
+        return Reserva.calcular(self.taxa, tokens, concedidos, adiados, inicio)
@@ -0,0 +1,181 @@
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+import redis
+
+from celery_app import REDIS_URL
+from service.limitador import LimitadorTaxa, Reserva
+from service.smtp_pool import obter_pool
+from service.whatsapp_channel import obter_cliente
+
+logger = logging.getLogger(__name__)
+
+# Onde ficam os baldes: "redis" (compartilhados por todos os workers e
+# processos da API) ou "memoria" (um por processo). Sem REDIS_URL ou com o
+# despachante embutido (um único processo envia), o padrão é "memoria"
+_SEM_REDIS = (not os.getenv("REDIS_URL")
+              or os.getenv("DESPACHANTE_EMBUTIDO", "False").lower() in ("1", "true", "yes"))
+ARMAZENAMENTO_LIMITES = os.getenv("LIMITE_ARMAZENAMENTO", "memoria" if _SEM_REDIS else "redis").lower()
+# Envios por segundo de cada canal, por conta remetente (0 desliga o limite)
+TAXAS_PADRAO = {
+    "email": float(os.getenv("LIMITE_TAXA_EMAIL", "5")),
+    "whatsapp": float(os.getenv("LIMITE_TAXA_WHATSAPP", "20")),
+}
+# Rajada máxima de cada canal (0: igual à taxa)
+RAJADAS_PADRAO = {
+    "email": float(os.getenv("LIMITE_RAJADA_EMAIL", "0")),
+    "whatsapp": float(os.getenv("LIMITE_RAJADA_WHATSAPP", "0")),
+}
+# Limites de contas específicas, que substituem os do canal:
+# "canal:conta=taxa[/rajada]" separados por vírgula
+LIMITES_CONTAS = os.getenv("LIMITE_CONTAS", "")
+# Quanto um envio pode aguardar pela sua vez; acima disso ele é adiado
+ESPERA_MAXIMA_SEGUNDOS = float(os.getenv("LIMITE_ESPERA_MAXIMA_SEGUNDOS", "2"))
+# Depois de uma falha do Redis, usa os baldes em memória por este tempo
+REPOUSO_REDIS_SEGUNDOS = float(os.getenv("LIMITE_REDIS_REPOUSO_SEGUNDOS", "30"))
+
+# Mesma conta de LimitadorTaxa.reservar, com o relógio do Redis (TIME) para
+# que todos os workers vejam o mesmo balde. Retorna os tokens antes da
+# reserva, os envios concedidos e em quantos segundos começam os adiamentos
+_SCRIPT_RESERVAR = """
+local relogio = redis.call('TIME')
+local agora = tonumber(relogio[1]) + tonumber(relogio[2]) / 1000000
+local taxa = tonumber(ARGV[1])
+local capacidade = tonumber(ARGV[2])
+local quantidade = tonumber(ARGV[3])
+local espera_maxima = tonumber(ARGV[4])
+local estado = redis.call('HMGET', KEYS[1], 'tokens', 'atualizado_em', 'fila_ate')
+local tokens = tonumber(estado[1]) or capacidade
+local atualizado_em = tonumber(estado[2]) or agora
+local fila_ate = tonumber(estado[3]) or 0
+tokens = math.min(capacidade, tokens + math.max(0, agora - atualizado_em) * taxa)
+local concedidos = math.max(0, math.min(quantidade, math.floor(tokens + taxa * espera_maxima)))
+local restantes = tokens - concedidos
+local adiados = quantidade - concedidos
+local inicio = 0
+if adiados > 0 then
+    inicio = math.max(agora + math.max(0, (1 - restantes) / taxa), fila_ate)
+    fila_ate = inicio + adiados / taxa
+    inicio = inicio - agora
+end
+redis.call('HSET', KEYS[1], 'tokens', restantes, 'atualizado_em', agora, 'fila_ate', fila_ate)
+redis.call('EXPIRE', KEYS[1], math.ceil(math.max(0, fila_ate - agora) + capacidade / taxa) + 1)
+return {tostring(tokens), concedidos, tostring(inicio)}
+"""
+
+
+def limites_do_ambiente(taxas: dict = None, rajadas: dict = None, contas: str = None) -> dict:
+    """
+    Limites (taxa, rajada) por "canal" e por "canal:conta", a partir das
+    variáveis LIMITE_TAXA_*, LIMITE_RAJADA_* e LIMITE_CONTAS.
+    """
+    taxas = TAXAS_PADRAO if taxas is None else taxas
+    rajadas = RAJADAS_PADRAO if rajadas is None else rajadas
+    limites = {canal: (taxa, rajadas.get(canal) or taxa) for canal, taxa in taxas.items()}
+    for item in (LIMITES_CONTAS if contas is None else contas).split(","):
+        if not item.strip():
+            continue
+        try:
+            chave, valor = item.strip().rsplit("=", 1)
+            canal, conta = chave.split(":", 1)
+            taxa, _, rajada = valor.partition("/")
+            limites[f"{canal.lower()}:{conta}"] = (float(taxa), float(rajada or 0) or float(taxa))
+        except ValueError:
+            logger.error("LIMITE_CONTAS: item inválido ignorado: %r", item)
+    return limites
+
+
+def conta_remetente(canal: str) -> str:
+    """Conta que envia pelo canal: o usuário SMTP ou o número do Twilio."""
+    if canal == "email":
+        return obter_pool().config.usuario or ""
+    if canal == "whatsapp":
+        return obter_cliente().config.from_whatsapp or ""
+    return ""
+
+
+class LimitadorEnvios:
+    """
+    Limite de taxa do despachante: um token bucket por canal e conta
+    remetente (o Gmail e o Twilio limitam por conta, não por processo).
+
+    Com o Redis, o balde de cada conta é uma chave compartilhada por todos
+    os workers, atualizada por um script Lua atômico. Se o Redis não
+    responder, cada processo passa a usar baldes em memória com o mesmo
+    limite (o total pode passar do limite enquanto isso) e volta a tentar o
+    Redis depois de REPOUSO_REDIS_SEGUNDOS.
+    """
+
+    PREFIXO = "limite_envio:"
+
+    def __init__(self, limites: dict = None, espera_maxima: float = None,
+                 armazenamento: str = None, cliente_redis: redis.Redis = None, contas: dict = None):
+        self.limites = limites_do_ambiente() if limites is None else limites
+        self.espera_maxima = ESPERA_MAXIMA_SEGUNDOS if espera_maxima is None else espera_maxima
+        if cliente_redis is None and (armazenamento or ARMAZENAMENTO_LIMITES) == "redis":
+            # Timeouts curtos: o limitador é consultado antes de cada lote
+            cliente_redis = redis.Redis.from_url(REDIS_URL, socket_connect_timeout=1, socket_timeout=1)
+        self._redis = cliente_redis
+        self._script = cliente_redis.register_script(_SCRIPT_RESERVAR) if cliente_redis is not None else None
+        self._redis_suspenso_ate = 0.0
+        self._contas = dict(contas or {})
+        self._baldes = {}
+        self._lock = threading.Lock()
+
+    def _conta(self, canal: str) -> str:
+        conta = self._contas.get(canal)
+        if conta is None:
+            conta = self._contas[canal] = conta_remetente(canal)
+        return conta
+
+    def limite(self, canal: str, conta: str) -> tuple:
+        """(taxa, rajada) da conta; sem limite próprio, a do canal; sem nenhum, (0, 0)."""
+        return self.limites.get(f"{canal}:{conta}") or self.limites.get(canal) or (0.0, 0.0)
+
+    def reservar(self, canal: str, quantidade: int) -> Reserva:
+        """Reserva a vez de `quantidade` envios pelo canal (ver LimitadorTaxa.reservar)."""
+        canal = (canal or "").lower()
+        conta = self._conta(canal)
+        taxa, rajada = self.limite(canal, conta)
+        if taxa <= 0 or quantidade <= 0:
+            return Reserva.livre(quantidade)
+        chave = f"{canal}:{conta}"
+        if self._script is not None and time.monotonic() >= self._redis_suspenso_ate:
+            try:
+                return self._reservar_redis(chave, taxa, rajada, quantidade)
+            except redis.RedisError as e:
+                self._redis_suspenso_ate = time.monotonic() + REPOUSO_REDIS_SEGUNDOS
+                logger.warning("Limite de envios: Redis indisponível (%s); usando limites em memória por %ss",
+                               e, REPOUSO_REDIS_SEGUNDOS)
+        return self._balde_local(chave, taxa, rajada).reservar(quantidade, self.espera_maxima)
+
+    def _reservar_redis(self, chave: str, taxa: float, rajada: float, quantidade: int) -> Reserva:
+        tokens, concedidos, inicio = self._script(
+            keys=[self.PREFIXO + chave], args=[taxa, rajada, quantidade, self.espera_maxima],
+        )
+        concedidos = int(concedidos)
+        return Reserva.calcular(taxa, float(tokens), concedidos, quantidade - concedidos, float(inicio))
+
+    def _balde_local(self, chave: str, taxa: float, rajada: float) -> LimitadorTaxa:
+        with self._lock:
+            balde = self._baldes.get(chave)
+            if balde is None:
+                balde = self._baldes[chave] = LimitadorTaxa(taxa, rajada)
+            return balde
+
+
+_limitador: Optional[LimitadorEnvios] = None
+_lock = threading.Lock()
+
+
+def obter_limitador_envios() -> LimitadorEnvios:
+    """Retorna o limitador do processo, criando-o na primeira chamada."""
+    global _limitador
+    if _limitador is None:
+        with _lock:
+            if _limitador is None:
+                _limitador = LimitadorEnvios()
+    return _limitador
@@ -1,35 +1,101 @@
-from service.email_channel import EmailChannel
-from service.whatsapp_channel import WhatsappChannel
+import logging
+
+from service.canal import CanalAssincrono
+from service.email_channel import EmailChannel, EmailChannelAsync
+from service.whatsapp_channel import WhatsappChannel, WhatsappChannelAsync
+from service.retentativa import CLASSE_CONFIGURACAO, classificar_erro
+
+logger = logging.getLogger(__name__)
 
 class MensagemService:
     def __init__(self):
         self.email_channel = EmailChannel()
         self.whatsapp_channel = WhatsappChannel()
+        # Canais assíncronos, usados pelas rotas sem bloquear o event loop
+        self.canais_async: dict[str, CanalAssincrono] = {
+            "email": EmailChannelAsync(self.email_channel.pool),
+            "whatsapp": WhatsappChannelAsync(),
+        }
         self.last_error = None
+        # Classe do último erro (service/retentativa.py): decide se o envio é repetido
+        self.last_error_class = None
+        # Id da mensagem no provedor (Message-ID ou SID do Twilio) do último envio
+        self.last_provider_id = None
+        # (id no provedor, latência em ms, classe do erro) de cada email do último enviar_emails
+        self.detalhes_lote = []
+
+    async def enviar_mensagem_async(self, canal: str, destinatario: str, conteudo: str, assunto: str = None):
+        """
+        Versão assíncrona de `enviar_mensagem`, para uso dentro do event loop
+        (rotas FastAPI). Retorna (True, None) ou (False, erro_msg).
+        """
+        self.last_provider_id = None
+        self.last_error_class = None
+        canal_async = self.canais_async.get(canal.lower())
+        if canal_async is None:
+            msg = f"Canal '{canal}' não suportado."
+            logger.warning(msg)
+            self.last_error = msg
+            self.last_error_class = CLASSE_CONFIGURACAO
+            return (False, msg)
+        try:
+            success, erro, self.last_provider_id, self.last_error_class = await canal_async.enviar(
+                destinatario, conteudo, assunto
+            )
+        except Exception as e:
+            logger.exception("Exceção ao enviar mensagem por %s", canal)
+            success, erro = False, str(e)
+            self.last_error_class = classificar_erro(e)
+        if not success:
+            self.last_error = erro or 'Erro desconhecido'
+        return (success, self.last_error if not success else None)
 
     def enviar_mensagem(self, canal: str, destinatario: str, conteudo: str, assunto: str = None):
         """
-        Envia uma mensagem pelo canal especificado.
+        Envia uma mensagem pelo canal especificado (versão síncrona, usada pelo
+        Celery e pelo despachante, que rodam fora do event loop).
         Retorna (True, None) se enviado com sucesso, (False, erro_msg) caso contrário.
         """
+        self.last_provider_id = None
+        self.last_error_class = None
         try:
             if canal.lower() == "email":
                 success = self.email_channel.enviar(destinatario, assunto or "Notificação Automática", conteudo)
+                self.last_provider_id = self.email_channel.last_provider_id
                 if not success:
                     self.last_error = getattr(self.email_channel, 'last_error', 'Erro desconhecido')
+                    self.last_error_class = self.email_channel.last_error_class
                 return (success, self.last_error if not success else None)
             elif canal.lower() == "whatsapp":
                 success = self.whatsapp_channel.enviar(destinatario, conteudo)
+                self.last_provider_id = self.whatsapp_channel.last_provider_id
                 if not success:
                     self.last_error = getattr(self.whatsapp_channel, 'last_error', 'Erro desconhecido')
+                    self.last_error_class = self.whatsapp_channel.last_error_class
                 return (success, self.last_error if not success else None)
             else:
                 msg = f"Canal '{canal}' não suportado."
-                print(f"[ERRO] {msg}")
+                logger.warning(msg)
                 self.last_error = msg
+                self.last_error_class = CLASSE_CONFIGURACAO
                 return (False, msg)
         except Exception as e:
             msg = str(e)
-            print(f"[ERRO] Exceção ao enviar mensagem: {e}")
+            logger.exception("Exceção ao enviar mensagem por %s", canal)
             self.last_error = msg
+            self.last_error_class = classificar_erro(e)
             return (False, msg)
+
+    def enviar_emails(self, mensagens: list) -> list:
+        """
+        Envia várias mensagens de email pela mesma sessão SMTP.
+        `mensagens` é uma lista de tuplas (destinatario, conteudo, assunto).
+        Retorna uma lista alinhada de tuplas (sucesso, erro); o id no provedor,
+        a latência e a classe do erro de cada mensagem ficam em `detalhes_lote`.
+        """
+        resultados = self.email_channel.enviar_lote([
+            (destinatario, assunto or "Notificação Automática", conteudo)
+            for destinatario, conteudo, assunto in mensagens
+        ])
+        self.detalhes_lote = self.email_channel.detalhes_lote
+        return resultados
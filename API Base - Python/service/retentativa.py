@@ -0,0 +1,85 @@
+import os
+import random
+import smtplib
+from datetime import timedelta
+from typing import Optional
+
+import requests
+from twilio.base.exceptions import TwilioRestException
+
+# Tentativas de envio de uma mensagem (a primeira incluída) antes de desistir
+MAX_TENTATIVAS = int(os.getenv("RETENTATIVA_MAX_TENTATIVAS", "5"))
+# Espera antes da segunda tentativa; dobra a cada nova falha
+ESPERA_BASE_SEGUNDOS = float(os.getenv("RETENTATIVA_ESPERA_BASE_SEGUNDOS", "30"))
+# Teto da espera entre duas tentativas
+ESPERA_MAXIMA_SEGUNDOS = float(os.getenv("RETENTATIVA_ESPERA_MAXIMA_SEGUNDOS", "3600"))
+
+# Classes de erro gravadas em mensagens_agendadas.classe_erro
+CLASSE_SMTP_TEMPORARIO = "smtp_temporario"        # resposta 4xx do servidor SMTP
+CLASSE_SMTP_PERMANENTE = "smtp_permanente"        # resposta 5xx (destinatário inválido, login recusado...)
+CLASSE_LIMITE_PROVEDOR = "limite_provedor"        # HTTP 429 do Twilio
+CLASSE_PROVEDOR_INDISPONIVEL = "provedor_indisponivel"  # HTTP 5xx do Twilio
+CLASSE_REQUISICAO_INVALIDA = "requisicao_invalida"      # demais HTTP 4xx do Twilio (número inválido...)
+CLASSE_CONEXAO = "conexao"                        # conexão recusada, derrubada ou sem rede
+CLASSE_TIMEOUT = "timeout"
+CLASSE_CONFIGURACAO = "configuracao"              # credenciais ausentes, canal não suportado
+CLASSE_DESCONHECIDA = "desconhecida"
+
+# Erros que tendem a passar sozinhos: a mensagem é reenviada mais tarde
+CLASSES_RETENTAVEIS = {
+    CLASSE_SMTP_TEMPORARIO,
+    CLASSE_LIMITE_PROVEDOR,
+    CLASSE_PROVEDOR_INDISPONIVEL,
+    CLASSE_CONEXAO,
+    CLASSE_TIMEOUT,
+}
+
+
+def classe_por_codigo_smtp(codigo: int) -> str:
+    return CLASSE_SMTP_TEMPORARIO if 400 <= codigo < 500 else CLASSE_SMTP_PERMANENTE
+
+
+def classe_por_recusados(recusados: dict) -> str:
+    """Classe de uma recusa de destinatários ({endereco: (codigo, mensagem)})."""
+    codigos = [codigo for codigo, _ in recusados.values()]
+    # Só vale a pena reenviar se todas as recusas forem temporárias
+    if codigos and all(400 <= codigo < 500 for codigo in codigos):
+        return CLASSE_SMTP_TEMPORARIO
+    return CLASSE_SMTP_PERMANENTE
+
+
+def classificar_erro(erro: BaseException) -> str:
+    """Classifica uma exceção do SMTP, do Twilio ou da rede."""
+    if isinstance(erro, smtplib.SMTPRecipientsRefused):
+        return classe_por_recusados(erro.recipients)
+    if isinstance(erro, smtplib.SMTPResponseException):
+        return classe_por_codigo_smtp(erro.smtp_code)
+    if isinstance(erro, TwilioRestException):
+        if erro.status == 429:
+            return CLASSE_LIMITE_PROVEDOR
+        if erro.status >= 500:
+            return CLASSE_PROVEDOR_INDISPONIVEL
+        return CLASSE_REQUISICAO_INVALIDA
+    # Antes de OSError: os timeouts do socket e do requests também são OSError
+    if isinstance(erro, (TimeoutError, requests.Timeout)):
+        return CLASSE_TIMEOUT
+    if isinstance(erro, (smtplib.SMTPServerDisconnected, OSError)):
+        return CLASSE_CONEXAO
+    return CLASSE_DESCONHECIDA
+
+
+def eh_retentavel(classe_erro: Optional[str]) -> bool:
+    return classe_erro in CLASSES_RETENTAVEIS
+
+
+def calcular_espera(tentativas: int, base: float = None, maxima: float = None) -> timedelta:
+    """
+    Espera até a próxima tentativa depois de `tentativas` falhas: backoff
+    exponencial (base, 2 x base, 4 x base... até `maxima`) com jitter. Metade
+    da espera é fixa e metade sorteada, para que as mensagens que falharam
+    juntas (ex.: um 429 em lote) não voltem todas no mesmo instante.
+    """
+    base = ESPERA_BASE_SEGUNDOS if base is None else base
+    maxima = ESPERA_MAXIMA_SEGUNDOS if maxima is None else maxima
+    espera = min(maxima, base * 2 ** max(0, tentativas - 1))
+    return timedelta(seconds=espera / 2 + random.uniform(0, espera / 2))
@@ -1,14 +1,25 @@
+import logging
+import time
+
 from celery_app import celery_app
 from service.mensagem_service import MensagemService
 from service.agendamento_service import AgendamentoService
+from service.historico import registrar_envio
+
+logger = logging.getLogger(__name__)
 
 @celery_app.task
 def agendar_envio(canal, destinatario, conteudo, assunto=None):
     """
     Tarefa Celery que executa o envio no horário agendado (método antigo com countdown).
+    Não é mais usada pela API (/mensagens/agendar/ grava em mensagens_agendadas);
+    mantida para que tarefas já enfileiradas continuem sendo executadas.
     """
     service = MensagemService()
-    service.enviar_mensagem(canal, destinatario, conteudo, assunto)
+    inicio = time.perf_counter()
+    sucesso, erro = service.enviar_mensagem(canal, destinatario, conteudo, assunto)
+    registrar_envio(canal, destinatario, conteudo, sucesso, erro,
+                    latencia_ms=(time.perf_counter() - inicio) * 1000, provider_id=service.last_provider_id)
 
 
 @celery_app.task
@@ -19,5 +30,5 @@ def processar_agendamentos():
     """
     service = AgendamentoService()
     processadas = service.processar_mensagens_pendentes()
-    print(f"[CELERY BEAT] {processadas} mensagens processadas.")
+    logger.info("[CELERY BEAT] %d mensagens processadas.", processadas)
     return processadas
@@ -0,0 +1,190 @@
+import os
+import smtplib
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Conexões autenticadas abertas ao mesmo tempo para um mesmo servidor
+MAX_CONEXOES_POR_HOST = int(os.getenv("SMTP_MAX_CONEXOES", "4"))
+# Conexões ociosas há mais tempo que isso são descartadas (o servidor já deve tê-las fechado)
+OCIOSA_MAX_SEGUNDOS = float(os.getenv("SMTP_OCIOSA_MAX_SEGUNDOS", "120"))
+
+# Erros que dizem respeito apenas à mensagem; o smtplib já enviou RSET e a
+# conexão continua utilizável
+ERROS_DA_MENSAGEM = (
+    smtplib.SMTPRecipientsRefused,
+    smtplib.SMTPSenderRefused,
+    smtplib.SMTPDataError,
+)
+
+
+class ConfiguracaoSMTP:
+    """Configuração SMTP lida do ambiente uma única vez."""
+
+    def __init__(self, host: str, port: int, usuario: str, senha: str,
+                 use_tls: bool = True, timeout: float = 20):
+        self.host = host
+        self.port = port
+        self.usuario = usuario
+        self.senha = senha
+        self.use_tls = use_tls
+        self.timeout = timeout
+
+    @classmethod
+    def do_ambiente(cls) -> "ConfiguracaoSMTP":
+        # Ler configurações SMTP do ambiente (fallback para Gmail)
+        try:
+            port = int(os.getenv("SMTP_PORT", "587"))
+        except ValueError:
+            port = 587
+        return cls(
+            host=os.getenv("SMTP_HOST", "smtp.gmail.com"),
+            port=port,
+            usuario=os.getenv("EMAIL_USER"),
+            senha=os.getenv("EMAIL_PASS"),
+            use_tls=os.getenv("SMTP_USE_TLS", "True").lower() in ("1", "true", "yes"),
+        )
+
+    @property
+    def chave(self):
+        return (self.host, self.port, self.usuario)
+
+
+class PoolSMTP:
+    """
+    Pool de sessões SMTP autenticadas e reutilizáveis.
+
+    Cada conexão passa pelo STARTTLS e pelo login apenas uma vez e depois é
+    reaproveitada entre envios. No máximo `max_conexoes` ficam abertas ao
+    mesmo tempo; quem pedir uma conexão além disso espera uma ser devolvida.
+    """
+
+    def __init__(self, config: ConfiguracaoSMTP, max_conexoes: int = None):
+        self.config = config
+        self.max_conexoes = max_conexoes or MAX_CONEXOES_POR_HOST
+        self._vagas = threading.BoundedSemaphore(self.max_conexoes)
+        self._ociosas = deque()  # (conexão, instante da devolução)
+        self._lock = threading.Lock()
+
+    def _conectar(self) -> smtplib.SMTP:
+        cfg = self.config
+        conexao = smtplib.SMTP(cfg.host, cfg.port, timeout=cfg.timeout)
+        try:
+            if cfg.use_tls:
+                conexao.starttls()
+            conexao.login(cfg.usuario, cfg.senha)
+        except Exception:
+            self._fechar(conexao)
+            raise
+        return conexao
+
+    @staticmethod
+    def _fechar(conexao: smtplib.SMTP):
+        try:
+            conexao.quit()
+        except Exception:
+            conexao.close()
+
+    @staticmethod
+    def _saudavel(conexao: smtplib.SMTP) -> bool:
+        try:
+            return conexao.noop()[0] == 250
+        except Exception:
+            return False
+
+    def _obter(self) -> smtplib.SMTP:
+        """
+        Retorna uma conexão ociosa ainda válida ou abre uma nova. Toda conexão
+        reaproveitada passa por um NOOP antes de ser emprestada, para que uma
+        sessão derrubada pelo servidor seja descoberta antes do envio, e não
+        no meio dele.
+        """
+        while True:
+            with self._lock:
+                if not self._ociosas:
+                    break
+                conexao, devolvida_em = self._ociosas.pop()
+            ociosa_ha = time.monotonic() - devolvida_em
+            if ociosa_ha > OCIOSA_MAX_SEGUNDOS:
+                self._fechar(conexao)
+            elif self._saudavel(conexao):
+                return conexao
+            else:
+                conexao.close()
+        return self._conectar()
+
+    def _devolver(self, conexao: smtplib.SMTP):
+        with self._lock:
+            self._ociosas.append((conexao, time.monotonic()))
+
+    @contextmanager
+    def conexao(self):
+        """
+        Empresta uma conexão autenticada. Se o bloco levantar uma exceção que
+        não seja apenas da mensagem, a conexão é descartada em vez de voltar
+        ao pool.
+        """
+        self._vagas.acquire()
+        try:
+            conexao = self._obter()
+            try:
+                yield conexao
+            except ERROS_DA_MENSAGEM:
+                self._devolver(conexao)
+                raise
+            except Exception:
+                self._fechar(conexao)
+                raise
+            self._devolver(conexao)
+        finally:
+            self._vagas.release()
+
+    def enviar(self, mensagem):
+        """
+        Envia uma mensagem MIME por uma conexão do pool.
+
+        Conexões derrubadas enquanto ociosas são trocadas antes do envio (ver
+        _obter). Se a conexão cair durante o envio, o erro é propagado sem
+        reenviar: o servidor pode já ter aceitado a mensagem, e a retentativa
+        fica a cargo de quem chamou (service/retentativa.py).
+        """
+        with self.conexao() as conexao:
+            return conexao.send_message(mensagem)
+
+    def fechar(self):
+        """Encerra todas as conexões ociosas."""
+        with self._lock:
+            ociosas, self._ociosas = list(self._ociosas), deque()
+        for conexao, _ in ociosas:
+            self._fechar(conexao)
+
+
+_pools = {}
+_config = None
+_lock_pools = threading.Lock()
+
+
+def obter_pool(config: ConfiguracaoSMTP = None) -> PoolSMTP:
+    """
+    Retorna o pool compartilhado do processo para o servidor configurado.
+    Envios imediatos (API) e agendados (despachante) usam o mesmo pool.
+    """
+    global _config
+    with _lock_pools:
+        if config is None:
+            if _config is None:
+                _config = ConfiguracaoSMTP.do_ambiente()
+            config = _config
+        pool = _pools.get(config.chave)
+        if pool is None:
+            pool = _pools[config.chave] = PoolSMTP(config)
+        return pool
+
+
+def fechar_pools():
+    """Encerra as conexões ociosas de todos os pools."""
+    with _lock_pools:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.fechar()
@@ -1,21 +1,121 @@
+import logging
+import os
+import threading
+from requests.adapters import HTTPAdapter
+from twilio.http.http_client import TwilioHttpClient
 from twilio.rest import Client
+from log_config import AMOSTRAR
+from service.canal import executar_bloqueante
+from service.retentativa import classificar_erro
+
+logger = logging.getLogger(__name__)
+
+# Conexões HTTP mantidas abertas com a API do Twilio
+MAX_CONEXOES = int(os.getenv("WHATSAPP_MAX_CONEXOES", "8"))
+
+
+class ConfiguracaoTwilio:
+    """Credenciais e endereço do Twilio lidos do ambiente uma única vez."""
+
+    def __init__(self, account_sid: str, auth_token: str, from_whatsapp: str, base_url: str = None):
+        self.account_sid = account_sid
+        self.auth_token = auth_token
+        self.from_whatsapp = from_whatsapp
+        # Permite apontar para um endpoint local (ex.: servidor_twilio_local.py)
+        self.base_url = base_url
+
+    @classmethod
+    def do_ambiente(cls) -> "ConfiguracaoTwilio":
+        return cls(
+            account_sid=os.getenv("TWILIO_ACCOUNT_SID", "SEU_ACCOUNT_SID"),
+            auth_token=os.getenv("TWILIO_AUTH_TOKEN", "SEU_AUTH_TOKEN"),
+            from_whatsapp=os.getenv("TWILIO_WHATSAPP_FROM", "whatsapp:+14155238886"),  # número Twilio
+            base_url=os.getenv("TWILIO_BASE_URL"),
+        )
+
+
+def criar_cliente(config: ConfiguracaoTwilio, max_conexoes: int = None) -> Client:
+    """Cria um Client do Twilio sobre uma sessão HTTP com keep-alive e pool de conexões."""
+    http_client = TwilioHttpClient(pool_connections=True, timeout=20)
+    adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=max_conexoes or MAX_CONEXOES)
+    http_client.session.mount("https://", adaptador)
+    http_client.session.mount("http://", adaptador)
+    cliente = Client(config.account_sid, config.auth_token, http_client=http_client)
+    if config.base_url:
+        cliente.api.base_url = config.base_url
+    return cliente
+
+
+class _ClienteCompartilhado:
+    """
+    Client e configuração únicos por processo. O limite de taxa dos envios
+    fica no despachante (service/limite_envio.py), por conta remetente.
+    """
+
+    def __init__(self, config: ConfiguracaoTwilio, cliente: Client):
+        self.config = config
+        self.cliente = cliente
+
+
+_compartilhado = None
+_lock = threading.Lock()
+
+
+def obter_cliente() -> _ClienteCompartilhado:
+    """Retorna o client do Twilio do processo, criando-o na primeira chamada."""
+    global _compartilhado
+    if _compartilhado is None:
+        with _lock:
+            if _compartilhado is None:
+                config = ConfiguracaoTwilio.do_ambiente()
+                _compartilhado = _ClienteCompartilhado(config, criar_cliente(config))
+    return _compartilhado
+
 
 class WhatsappChannel:
-    def enviar(self, numero: str, conteudo: str):
-        account_sid = "SEU_ACCOUNT_SID"
-        auth_token = "SEU_AUTH_TOKEN"
-        from_whatsapp = "whatsapp:+14155238886"  # número Twilio
+    def __init__(self, compartilhado: _ClienteCompartilhado = None):
+        self.last_error = None
+        # Classe do último erro (service/retentativa.py) e SID do Twilio da última mensagem aceita
+        self.last_error_class = None
+        self.last_provider_id = None
+        self._compartilhado = compartilhado or obter_cliente()
 
-        client = Client(account_sid, auth_token)
+    def _criar_mensagem(self, numero: str, conteudo: str):
+        compartilhado = self._compartilhado
+        return compartilhado.cliente.messages.create(
+            body=conteudo,
+            from_=compartilhado.config.from_whatsapp,
+            to=f"whatsapp:{numero}"
+        )
 
+    def enviar(self, numero: str, conteudo: str):
+        self.last_provider_id = None
         try:
-            client.messages.create(
-                body=conteudo,
-                from_=from_whatsapp,
-                to=f"whatsapp:{numero}"
-            )
-            print(f"[WHATSAPP] Mensagem enviada para {numero}")
+            self.last_provider_id = self._criar_mensagem(numero, conteudo).sid
+            logger.debug("Mensagem enviada para %s", numero, extra=AMOSTRAR)
+            self.last_error = None
+            self.last_error_class = None
             return True
         except Exception as e:
-            print(f"[WHATSAPP] Erro ao enviar: {e}")
+            logger.warning("Erro ao enviar para %s: %s", numero, e)
+            self.last_error = str(e)
+            self.last_error_class = classificar_erro(e)
             return False
+
+
+class WhatsappChannelAsync:
+    """
+    Canal de WhatsApp para o event loop. Usa o client compartilhado do
+    WhatsappChannel, rodando no executor dos canais.
+    """
+
+    def __init__(self, compartilhado: _ClienteCompartilhado = None):
+        self._compartilhado = compartilhado or obter_cliente()
+
+    def _enviar(self, numero: str, conteudo: str):
+        canal = WhatsappChannel(self._compartilhado)
+        sucesso = canal.enviar(numero, conteudo)
+        return (sucesso, canal.last_error, canal.last_provider_id, canal.last_error_class)
+
+    async def enviar(self, destinatario: str, conteudo: str, assunto: str = None):
+        return await executar_bloqueante(self._enviar, destinatario, conteudo)
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Servidor SMTP local para testes e benchmarks offline.
+
+Implementa o mínimo do protocolo usado pelo smtplib (EHLO, AUTH, MAIL, RCPT,
+DATA, RSET, NOOP, QUIT) e simula a latência de rede: o atraso de conexão
+representa TCP + STARTTLS e o atraso de AUTH representa o login. Destinatários
+cujo endereço contém "rejeitado" são recusados no RCPT TO.
+
+Uso:
+    python servidor_smtp_local.py [porta]
+
+Configure a API com SMTP_HOST=127.0.0.1, SMTP_PORT=<porta>, SMTP_USE_TLS=False.
+"""
+import socketserver
+import sys
+import threading
+import time
+
+
+class _ManipuladorSMTP(socketserver.StreamRequestHandler):
+    def _responder(self, linha: str):
+        self.wfile.write((linha + "\r\n").encode())
+
+    def handle(self):
+        servidor = self.server
+        time.sleep(servidor.atraso_conexao)
+        self._responder("220 servidor-smtp-local pronto")
+        destinatarios = []
+        while True:
+            linha = self.rfile.readline()
+            if not linha:
+                return
+            comando = linha.decode(errors="replace").strip()
+            verbo = comando.split(" ", 1)[0].upper()
+
+            if verbo in ("EHLO", "HELO"):
+                self.wfile.write(b"250-servidor-smtp-local\r\n250-AUTH PLAIN LOGIN\r\n250 8BITMIME\r\n")
+            elif verbo == "AUTH":
+                time.sleep(servidor.atraso_login)
+                self._responder("235 Autenticado")
+            elif verbo == "MAIL":
+                destinatarios = []
+                self._responder("250 OK")
+            elif verbo == "RCPT":
+                if "rejeitado" in comando.lower():
+                    self._responder("550 Destinatario recusado")
+                else:
+                    destinatarios.append(comando)
+                    self._responder("250 OK")
+            elif verbo == "DATA":
+                self._responder("354 Termine com <CRLF>.<CRLF>")
+                while self.rfile.readline() not in (b".\r\n", b".\n", b""):
+                    pass
+                time.sleep(servidor.atraso_envio)
+                with servidor.lock:
+                    servidor.mensagens_recebidas += len(destinatarios)
+                self._responder("250 Mensagem aceita")
+            elif verbo == "RSET":
+                destinatarios = []
+                self._responder("250 OK")
+            elif verbo == "NOOP":
+                self._responder("250 OK")
+            elif verbo == "QUIT":
+                self._responder("221 Tchau")
+                return
+            else:
+                self._responder("502 Comando nao implementado")
+
+
+class ServidorSMTPLocal(socketserver.ThreadingTCPServer):
+    """Servidor SMTP de teste; use `iniciar()` para rodá-lo em uma thread."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, porta: int = 0, atraso_conexao: float = 0.05,
+                 atraso_login: float = 0.03, atraso_envio: float = 0.005):
+        super().__init__(("127.0.0.1", porta), _ManipuladorSMTP)
+        self.atraso_conexao = atraso_conexao
+        self.atraso_login = atraso_login
+        self.atraso_envio = atraso_envio
+        self.mensagens_recebidas = 0
+        self.lock = threading.Lock()
+
+    @property
+    def porta(self) -> int:
+        return self.server_address[1]
+
+    def iniciar(self) -> "ServidorSMTPLocal":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def parar(self):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == "__main__":
+    porta = int(sys.argv[1]) if len(sys.argv) > 1 else 8025
+    servidor = ServidorSMTPLocal(porta)
+    print(f"Servidor SMTP local ouvindo em 127.0.0.1:{servidor.porta}")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        servidor.parar()
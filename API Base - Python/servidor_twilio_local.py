@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Endpoint HTTP local que imita a API de mensagens do Twilio, para testes e
+benchmarks offline.
+
+Responde a POST /2010-04-01/Accounts/<sid>/Messages.json com 201 e um JSON
+no formato do Twilio, após um atraso que simula a latência da API. Cada
+conexão nova paga um atraso extra que simula o handshake TCP + TLS. Números de
+destino que começam com "0" recebem 400 (número inválido). Conta também as
+conexões TCP abertas, para verificar o reaproveitamento (keep-alive).
+
+Uso:
+    python servidor_twilio_local.py [porta]
+
+Configure a API com TWILIO_BASE_URL=http://127.0.0.1:<porta>.
+"""
+import json
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+class _ManipuladorTwilio(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # mantém a conexão aberta entre requisições
+    # Cabeçalhos e corpo saem em writes separados; sem isso o Nagle + ACK
+    # atrasado somam ~40 ms a cada resposta em conexões reaproveitadas
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        time.sleep(self.server.atraso_conexao)
+        with self.server.lock:
+            self.server.conexoes_abertas += 1
+
+    def log_message(self, *args):
+        pass
+
+    def _responder(self, status: int, corpo: dict):
+        dados = json.dumps(corpo).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def do_POST(self):
+        tamanho = int(self.headers.get("Content-Length", 0))
+        campos = parse_qs(self.rfile.read(tamanho).decode())
+        time.sleep(self.server.atraso)
+
+        if not self.path.endswith("/Messages.json"):
+            self._responder(404, {"code": 20404, "message": "Recurso não encontrado", "status": 404})
+            return
+
+        destino = campos.get("To", [""])[0]
+        if destino.replace("whatsapp:", "").lstrip("+").startswith("0"):
+            self._responder(400, {
+                "code": 21211,
+                "message": f"The 'To' number {destino} is not a valid phone number.",
+                "more_info": "https://www.twilio.com/docs/errors/21211",
+                "status": 400,
+            })
+            return
+
+        with self.server.lock:
+            self.server.mensagens_recebidas += 1
+        self._responder(201, {
+            "sid": "SM" + uuid.uuid4().hex,
+            "status": "queued",
+            "to": destino,
+            "from": campos.get("From", [""])[0],
+            "body": campos.get("Body", [""])[0],
+        })
+
+
+class ServidorTwilioLocal(ThreadingHTTPServer):
+    """Fake da API do Twilio; use `iniciar()` para rodá-lo em uma thread."""
+
+    daemon_threads = True
+
+    def __init__(self, porta: int = 0, atraso: float = 0.05, atraso_conexao: float = 0.05):
+        super().__init__(("127.0.0.1", porta), _ManipuladorTwilio)
+        self.atraso = atraso
+        self.atraso_conexao = atraso_conexao
+        self.mensagens_recebidas = 0
+        self.conexoes_abertas = 0
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def iniciar(self) -> "ServidorTwilioLocal":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def parar(self):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == "__main__":
+    porta = int(sys.argv[1]) if len(sys.argv) > 1 else 8026
+    servidor = ServidorTwilioLocal(porta)
+    print(f"Twilio local ouvindo em {servidor.base_url}")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        servidor.parar()
@@ -1,5 +1,9 @@
-from celery_app import celery_app
+from celery_app import celery_app, MODO_AGENDAMENTO
+from database import SessionLocal
 from service.agendamento_service import AgendamentoService
+from service.arquivamento import ArquivadorMensagens
+from service.despertador import DespertadorCelery
+from service.jobs import executar_job as executar_job_contatos
 import logging
 
 logger = logging.getLogger(__name__)
@@ -14,7 +18,49 @@ def processar_agendamentos():
         service = AgendamentoService()
         processadas = service.processar_mensagens_pendentes()
         logger.info(f"[CELERY BEAT] {processadas} mensagens processadas.")
+        if MODO_AGENDAMENTO == "adaptativo":
+            rearmar_despertador()
         return processadas
     except Exception as e:
         logger.error(f"[CELERY BEAT] Erro ao processar agendamentos: {str(e)}")
         return 0
+
+
+def rearmar_despertador():
+    """
+    No modo adaptativo, agenda a próxima execução desta tarefa para o próximo
+    vencimento da fila, em vez de esperar o próximo ciclo do Beat.
+    """
+    db = SessionLocal()
+    try:
+        proximo = DespertadorCelery().rearmar(db)
+        logger.info(f"[CELERY BEAT] Próximo despertar: {proximo or 'nenhum agendamento pendente'}")
+    except Exception as e:
+        # O Beat de segurança (AGENDAMENTO_INTERVALO_SEGURANCA) cobre a falha
+        logger.error(f"[CELERY BEAT] Erro ao rearmar o despertador: {str(e)}")
+    finally:
+        db.close()
+
+
+@celery_app.task(name='tasks.executar_job')
+def executar_job(job_id: str):
+    """
+    Executa um job de importação/exportação de contatos (JOBS_EXECUTOR=celery).
+    O andamento fica no Redis (service.jobs) e os arquivos em JOBS_DIRETORIO.
+    """
+    executar_job_contatos(job_id)
+
+
+@celery_app.task(name='tasks.arquivar_mensagens')
+def arquivar_mensagens():
+    """
+    Tarefa diária que move as mensagens finalizadas há mais de ARQUIVAMENTO_DIAS
+    dias para mensagens_agendadas_arquivo (ver service/arquivamento.py).
+    """
+    try:
+        arquivadas = ArquivadorMensagens().arquivar()
+        logger.info(f"[CELERY BEAT] {arquivadas} mensagens arquivadas.")
+        return arquivadas
+    except Exception as e:
+        logger.error(f"[CELERY BEAT] Erro ao arquivar mensagens: {str(e)}")
+        return 0
@@ -0,0 +1,159 @@
+"""
+Testes do arquivamento das mensagens agendadas finalizadas
+(service/arquivamento.py) e das rotas somente leitura do arquivo.
+
+Usa um banco SQLite temporário.
+
+Uso:
+    python -m pytest test_arquivamento.py -q
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, func, select
+
+from database import Contact, MensagemAgendada, MensagemAgendadaArquivada, ResumoEnvioDiario
+from routes import agendamentos
+from service.arquivamento import ArquivadorMensagens
+
+# Roteadores do `cliente` (conftest.py)
+ROTEADORES = [agendamentos.router]
+
+AGORA = datetime.utcnow()
+ANTIGA = AGORA - timedelta(days=40)
+
+
+def mensagem(i: int, status: str, data: datetime, canal: str = "email") -> dict:
+    return {
+        "contato_id": 1 + i % 3,
+        "canal": canal,
+        "destinatario": f"contato{i}@teste.com",
+        "assunto": "Assunto",
+        "conteudo": f"Mensagem {i}",
+        "data_agendamento": data,
+        "status": status,
+        "criado_em": data - timedelta(hours=1),
+        "enviado_em": data if status == "ENVIADO" else None,
+        "erro_mensagem": "recusado" if status == "ERRO" else None,
+    }
+
+
+def popular(engine):
+    linhas = []
+    # 250 antigas finalizadas, em dois dias: devem ir para o arquivo
+    for i in range(250):
+        status = ("ENVIADO", "ENVIADO", "ERRO", "CANCELADO")[i % 4]
+        dia = ANTIGA if i % 2 else ANTIGA - timedelta(days=1)
+        linhas.append(mensagem(i, status, dia, "email" if i % 5 else "whatsapp"))
+    # Antigas ainda pendentes ou em processamento e finalizadas recentes: ficam
+    linhas += [mensagem(1000 + i, "AGENDADO", ANTIGA) for i in range(5)]
+    linhas += [mensagem(2000 + i, "PROCESSANDO", ANTIGA) for i in range(5)]
+    linhas += [mensagem(3000 + i, "ENVIADO", AGORA - timedelta(days=2)) for i in range(20)]
+    with engine.begin() as conn:
+        conn.execute(Contact.__table__.insert(), [
+            {"id": i, "name": f"Contato {i}", "email": f"contato{i}@teste.com", "canalPref": "email"}
+            for i in (1, 2, 3)
+        ])
+        conn.execute(MensagemAgendada.__table__.insert(), linhas)
+
+
+def contar(engine, tabela) -> int:
+    with engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(tabela)).scalar()
+
+
+def test_arquiva_em_lotes(engine, sessoes):
+    popular(engine)
+    lotes = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def contar_delete(conn, cursor, sql, parametros, contexto, executemany):
+        if sql.startswith("DELETE FROM mensagens_agendadas"):
+            lotes.append(len(parametros))
+
+    arquivadas = ArquivadorMensagens(dias=30, tamanho_lote=100, pausa=0, fabrica_sessao=sessoes).arquivar()
+
+    assert arquivadas == 250
+    assert lotes == [100, 100, 50]
+    assert contar(engine, MensagemAgendada.__table__) == 30
+    assert contar(engine, MensagemAgendadaArquivada.__table__) == 250
+    with engine.connect() as conn:
+        restantes = conn.execute(select(MensagemAgendada.status).distinct()).scalars().all()
+        arquivada = conn.execute(
+            select(MensagemAgendadaArquivada).where(MensagemAgendadaArquivada.destinatario == "contato2@teste.com")
+        ).one()
+    assert set(restantes) == {"AGENDADO", "PROCESSANDO", "ENVIADO"}
+    assert (arquivada.status, arquivada.erro_mensagem, arquivada.assunto, arquivada.contato_id) == ("ERRO", "recusado", "Assunto", 3)
+
+    # Nada mais a arquivar: nova execução não altera o arquivo nem o resumo
+    assert ArquivadorMensagens(dias=30, fabrica_sessao=sessoes).arquivar() == 0
+
+
+def test_ids_nao_sao_reaproveitados_depois_do_arquivamento(engine, sessoes):
+    popular(engine)
+    with engine.begin() as conn:
+        conn.execute(MensagemAgendada.__table__.delete().where(MensagemAgendada.status != "ENVIADO"))
+        conn.execute(MensagemAgendada.__table__.update().values(data_agendamento=ANTIGA))
+    enviadas = contar(engine, MensagemAgendada.__table__)
+    assert ArquivadorMensagens(dias=30, pausa=0, fabrica_sessao=sessoes).arquivar() == enviadas
+    assert contar(engine, MensagemAgendada.__table__) == 0
+
+    # Com a tabela quente vazia, um rowid simples voltaria a 1 e colidiria com o arquivo
+    with engine.begin() as conn:
+        maior_id = conn.execute(select(func.max(MensagemAgendadaArquivada.id))).scalar()
+        conn.execute(MensagemAgendada.__table__.insert(), [mensagem(9000, "ENVIADO", ANTIGA)])
+        novo_id = conn.execute(select(MensagemAgendada.id)).scalar()
+    assert novo_id > maior_id
+
+    assert ArquivadorMensagens(dias=30, pausa=0, fabrica_sessao=sessoes).arquivar() == 1
+    assert contar(engine, MensagemAgendadaArquivada.__table__) == enviadas + 1
+
+
+def test_resumo_diario(engine, sessoes):
+    popular(engine)
+    # Lotes pequenos: o mesmo (dia, canal, status) é somado por vários lotes
+    ArquivadorMensagens(dias=30, tamanho_lote=7, pausa=0, fabrica_sessao=sessoes).arquivar()
+
+    with engine.connect() as conn:
+        resumo = {
+            (linha.dia, linha.canal, linha.status): linha.quantidade
+            for linha in conn.execute(select(ResumoEnvioDiario))
+        }
+    assert sum(resumo.values()) == 250
+    esperado = {}
+    for i in range(250):
+        status = ("ENVIADO", "ENVIADO", "ERRO", "CANCELADO")[i % 4]
+        dia = (ANTIGA if i % 2 else ANTIGA - timedelta(days=1)).date()
+        chave = (dia, "email" if i % 5 else "whatsapp", status)
+        esperado[chave] = esperado.get(chave, 0) + 1
+    assert resumo == esperado
+
+
+def test_rotas_do_arquivo(engine, sessoes, cliente):
+    popular(engine)
+    ArquivadorMensagens(dias=30, pausa=0, fabrica_sessao=sessoes).arquivar()
+
+    pagina = cliente.get("/api/agendamentos/arquivo", params={"contact_id": 2, "status": "erro", "limit": 10}).json()
+    assert len(pagina["itens"]) == 10 and pagina["next_cursor"]
+    assert {(item["contato_id"], item["status"]) for item in pagina["itens"]} == {(2, "ERRO")}
+    vistos = [item["id"] for item in pagina["itens"]]
+    while pagina["next_cursor"]:
+        pagina = cliente.get("/api/agendamentos/arquivo", params={
+            "contact_id": 2, "status": "erro", "limit": 10, "cursor": pagina["next_cursor"],
+        }).json()
+        vistos += [item["id"] for item in pagina["itens"]]
+    assert len(vistos) == len(set(vistos)) == 20
+
+    pagina = cliente.get("/api/agendamentos/arquivo", params={
+        "inicio": ANTIGA.isoformat(), "limit": 500,
+    }).json()
+    assert len(pagina["itens"]) == 125
+
+    resumo = cliente.get("/api/agendamentos/arquivo/resumo", params={
+        "inicio": ANTIGA.date().isoformat(), "canal": "whatsapp",
+    }).json()
+    assert {item["dia"] for item in resumo} == {ANTIGA.date().isoformat()}
+    assert sum(item["quantidade"] for item in resumo) == 25
+
+    # As rotas do arquivo não são capturadas por /{agendamento_id}
+    assert cliente.get("/api/agendamentos/arquivo", params={"cursor": "x"}).status_code == 400
+    assert cliente.get(f"/api/agendamentos/{vistos[0]}").status_code == 404
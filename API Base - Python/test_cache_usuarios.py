@@ -0,0 +1,173 @@
+"""
+Testes do cache de usuários autenticados (cache_usuarios.py): acerto sem
+consulta ao banco, expiração pelo TTL e pelo próprio token, e invalidação
+quando o usuário é alterado ou excluído, pelo ORM ou por update()/delete()
+executados na sessão (como a troca de hash no login).
+
+Usa um banco SQLite temporário.
+
+Uso:
+    python -m pytest test_cache_usuarios.py -q
+"""
+import asyncio
+import time
+from datetime import timedelta
+
+import pytest
+from fastapi.security import HTTPAuthorizationCredentials
+from sqlalchemy import delete, update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+import auth
+import cache_usuarios
+from database import User, criar_engine_assincrono
+
+
+class Relogio:
+    """Substitui o módulo time em cache_usuarios; o tempo só anda quando o teste manda."""
+
+    def __init__(self):
+        self.agora = time.time()
+
+    def time(self) -> float:
+        return self.agora
+
+    def monotonic(self) -> float:
+        return self.agora
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = cache_usuarios.CacheUsuarios(ttl=60, tamanho_maximo=100)
+    monkeypatch.setattr(cache_usuarios, "cache", cache)
+    return cache
+
+
+@pytest.fixture
+def usuario(sessoes):
+    db = sessoes()
+    user = User(username="ana", email="ana@teste.com", hashed_password="hash-antigo", disabled=False)
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    db.close()
+    return user
+
+
+@pytest.fixture
+def autenticar(engine, monkeypatch):
+    """Roda get_current_user no banco de teste; conta as sessões abertas para buscar o usuário."""
+    aberturas = []
+
+    def autenticar(token: str) -> User:
+        async def executar():
+            engine_assincrono = criar_engine_assincrono(str(engine.url))
+            sessoes_async = async_sessionmaker(engine_assincrono, expire_on_commit=False)
+
+            def abrir():
+                aberturas.append(token)
+                return sessoes_async()
+
+            monkeypatch.setattr(auth, "AsyncSessionLocal", abrir)
+            try:
+                return await auth.get_current_user(HTTPAuthorizationCredentials(scheme="Bearer", credentials=token))
+            finally:
+                await engine_assincrono.dispose()
+
+        return asyncio.run(executar())
+
+    autenticar.aberturas = aberturas
+    return autenticar
+
+
+def token_de(user: User) -> str:
+    return auth.create_access_token({"sub": user.username}, timedelta(minutes=30))
+
+
+def test_token_em_cache_dispensa_o_banco(cache, usuario, autenticar):
+    token = token_de(usuario)
+    primeiro = autenticar(token)
+    segundo = autenticar(token)
+
+    assert autenticar.aberturas == [token]
+    assert (segundo.id, segundo.username, segundo.disabled) == (usuario.id, "ana", False)
+    # O hash da senha nunca fica no cache e cada requisição recebe sua própria instância
+    assert segundo.hashed_password is None and segundo is not primeiro
+
+
+def test_entrada_expira_pelo_ttl_ou_pelo_token(cache, usuario, monkeypatch):
+    relogio = Relogio()
+    monkeypatch.setattr(cache_usuarios, "time", relogio)
+    cache.guardar("curto", usuario, relogio.agora + 30)
+    cache.guardar("longo", usuario, relogio.agora + 3600)
+
+    relogio.agora += 29
+    assert cache.obter("curto") is not None and cache.obter("longo") is not None
+    relogio.agora += 2
+    # O token curto expirou antes do TTL
+    assert cache.obter("curto") is None and cache.obter("longo") is not None
+    relogio.agora += 30
+    assert cache.obter("longo") is None
+
+
+def test_alteracao_pelo_orm_invalida(cache, usuario, sessoes):
+    cache.guardar("token", usuario, time.time() + 3600)
+    db = sessoes()
+    db.get(User, usuario.id).full_name = "Ana Souza"
+    db.commit()
+    # Campos que não afetam a autenticação mantêm a entrada
+    assert cache.obter("token") is not None
+
+    db.get(User, usuario.id).disabled = True
+    db.commit()
+    assert cache.obter("token") is None
+    db.close()
+
+
+def test_exclusao_pelo_orm_invalida(cache, usuario, sessoes):
+    cache.guardar("token", usuario, time.time() + 3600)
+    db = sessoes()
+    db.delete(db.get(User, usuario.id))
+    db.commit()
+    db.close()
+    assert cache.obter("token") is None
+
+
+@pytest.mark.parametrize("comando", [
+    update(User).where(User.username == "ana").values(disabled=True),
+    delete(User).where(User.username == "ana"),
+    User.__table__.update().values(disabled=True),
+])
+def test_update_ou_delete_na_sessao_invalida(cache, usuario, sessoes, comando):
+    cache.guardar("token", usuario, time.time() + 3600)
+    db = sessoes()
+    db.execute(comando)
+    assert cache.obter("token") is None
+
+    # Uma requisição concorrente guarda os valores antigos antes do commit
+    cache.guardar("token", usuario, time.time() + 3600)
+    db.commit()
+    db.close()
+    assert cache.obter("token") is None
+
+
+def test_troca_de_hash_no_login_invalida(cache, usuario, autenticar, sessoes, engine, monkeypatch):
+    token = token_de(usuario)
+    autenticar(token)
+    assert cache.obter(token) is not None
+
+    monkeypatch.setattr(auth, "verify_and_update_password", lambda senha, hash_atual: (True, "hash-novo"))
+
+    async def logar():
+        engine_assincrono = criar_engine_assincrono(str(engine.url))
+        try:
+            async with async_sessionmaker(engine_assincrono)() as db:
+                return await auth.authenticate_user_async(db, "ana", "senha")
+        finally:
+            await engine_assincrono.dispose()
+
+    assert asyncio.run(logar()).id == usuario.id
+    assert cache.obter(token) is None
+    db = sessoes()
+    assert db.get(User, usuario.id).hashed_password == "hash-novo"
+    db.close()
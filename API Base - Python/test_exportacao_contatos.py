@@ -0,0 +1,92 @@
+"""
+Testes da exportação de contatos em blocos (service/exportacao_contatos.py)
+e da rota GET /api/contacts/export/csv: filtros, CSV em gzip e o 404
+respondido antes de a transmissão começar.
+
+Usa um banco SQLite temporário.
+
+Uso:
+    python -m pytest test_exportacao_contatos.py -q
+"""
+import csv
+import gzip
+import io
+
+import pytest
+
+from database import Cliente, Contact
+from routes import contacts
+from service import exportacao_contatos
+from service.exportacao_contatos import COLUNAS_CSV, gerar_csv_contatos
+
+ROTEADORES = [contacts.router]
+
+
+@pytest.fixture
+def contatos(sessoes, monkeypatch):
+    """Cinco contatos, dois do cliente 1; a exportação usa as sessões do banco de teste."""
+    monkeypatch.setattr(exportacao_contatos, "SessionLocal", sessoes)
+    db = sessoes()
+    db.add(Cliente(id=1, nome="Cliente", email="cliente@teste.com"))
+    db.add_all([
+        Contact(name="Ana", email="ana@teste.com", phone="+5511999990001", canalPref="email", cliente_id=1),
+        Contact(name="Bruno, o segundo", email="bruno@teste.com", canalPref="whatsapp", codExterno="B2", cliente_id=1),
+        Contact(name="Carla", email="carla@empresa.com", canalPref="email"),
+        Contact(name="Dora", email="dora@teste.com", canalPref="email"),
+        Contact(name="Eva", email="eva@empresa.com", canalPref="email"),
+    ])
+    db.commit()
+    db.close()
+
+
+def ler_csv(conteudo: bytes) -> list:
+    return list(csv.reader(io.StringIO(conteudo.decode("utf-8"))))
+
+
+def test_csv_em_blocos(contatos):
+    totais = []
+    blocos = list(gerar_csv_contatos(tamanho_bloco=2, progresso=totais.append))
+
+    # Cabeçalho e um bloco para cada 2 linhas lidas
+    assert len(blocos) == 4
+    assert totais == [2, 4, 5]
+    linhas = ler_csv(b"".join(blocos))
+    assert linhas[0] == COLUNAS_CSV
+    assert [linha[1] for linha in linhas[1:]] == ["Ana", "Bruno, o segundo", "Carla", "Dora", "Eva"]
+    # Valores nulos saem vazios
+    assert linhas[3] == ["3", "Carla", "carla@empresa.com", "", "email", "", ""]
+
+
+def test_filtros_e_gzip(contatos):
+    assert [linha[1] for linha in ler_csv(b"".join(gerar_csv_contatos(cliente_id=1)))[1:]] == [
+        "Ana", "Bruno, o segundo",
+    ]
+    assert [linha[1] for linha in ler_csv(b"".join(gerar_csv_contatos(search="EMPRESA")))[1:]] == ["Carla", "Eva"]
+    assert [linha[1] for linha in ler_csv(b"".join(gerar_csv_contatos(contact_id=4)))[1:]] == ["Dora"]
+
+    compactado = b"".join(gerar_csv_contatos(compactar=True, tamanho_bloco=2))
+    assert gzip.decompress(compactado) == b"".join(gerar_csv_contatos())
+
+
+def test_rota_de_exportacao(cliente, contatos):
+    resposta = cliente.get("/api/contacts/export/csv", params={"search": "empresa", "gzip": "true"})
+    assert resposta.status_code == 200
+    assert resposta.headers["content-type"] == "application/gzip"
+    assert resposta.headers["content-disposition"].endswith(".csv.gz")
+    assert [linha[1] for linha in ler_csv(gzip.decompress(resposta.content))[1:]] == ["Carla", "Eva"]
+
+    resposta = cliente.get("/api/contacts/export/csv", params={"cliente_id": 1})
+    assert resposta.status_code == 200
+    assert resposta.headers["content-type"].startswith("text/csv")
+    assert len(ler_csv(resposta.content)) == 3
+
+
+def test_rota_responde_404_antes_de_transmitir(cliente, contatos, monkeypatch):
+    geradores = []
+    monkeypatch.setattr(contacts, "gerar_csv_contatos", lambda *args, **kwargs: geradores.append(args))
+
+    resposta = cliente.get("/api/contacts/export/csv", params={"search": "ninguem"})
+    assert resposta.status_code == 404
+    assert resposta.json() == {"detail": "Nenhum contato encontrado com os filtros fornecidos."}
+    # Nenhum CSV chegou a ser gerado
+    assert geradores == []
@@ -0,0 +1,153 @@
+"""
+Testes do histórico de envios: gravação em lote (service/historico.py) e a
+listagem GET /api/historico por contato e por período.
+
+Usa bancos SQLite temporários.
+
+Uso:
+    python -m pytest test_historico.py -q
+"""
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, func, select
+
+from database import HistoricoMensagem
+from routes import historico
+from service.historico import GravadorHistorico, STATUS_ENVIADO, STATUS_ERRO
+
+# Roteadores do `cliente` (conftest.py)
+ROTEADORES = [historico.router]
+
+
+def registro(i: int, contato_id: int = 1, data_envio: datetime = None, sucesso: bool = True) -> dict:
+    return {
+        "canal": "email",
+        "destinatario": f"contato{i}@teste.com",
+        "conteudo": "Mensagem",
+        "status": STATUS_ENVIADO if sucesso else STATUS_ERRO,
+        "data_envio": data_envio or datetime.utcnow(),
+        "contato_id": contato_id,
+        "mensagem_agendada_id": None,
+        "latencia_ms": 12,
+        "provider_id": f"<{i}@teste.com>",
+        "erro": None if sucesso else "recusado",
+    }
+
+
+def contar(engine) -> int:
+    with engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(HistoricoMensagem)).scalar()
+
+
+def contar_inserts(engine) -> list:
+    """Lista que recebe o número de linhas de cada INSERT no histórico."""
+    inserts = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def contar_insert(conn, cursor, sql, parametros, contexto, executemany):
+        if sql.startswith("INSERT INTO historico_mensagens"):
+            inserts.append(len(parametros) if executemany else 1)
+
+    return inserts
+
+
+def aguardar(condicao, limite: float = 5.0):
+    fim = time.monotonic() + limite
+    while not condicao():
+        assert time.monotonic() < fim, "tempo esgotado"
+        time.sleep(0.01)
+
+
+def test_grava_em_lotes_pelo_tamanho(engine):
+    inserts = contar_inserts(engine)
+    gravador = GravadorHistorico(engine, tamanho_lote=50, intervalo=60)
+    for i in range(120):
+        gravador.registrar(registro(i))
+    aguardar(lambda: gravador.gravados >= 100)
+    assert contar(engine) in (100, 120)
+    gravador.descarregar()
+
+    assert contar(engine) == 120
+    # Nenhum INSERT por registro: dois lotes cheios e o resto no encerramento
+    assert len(inserts) <= 3 and sum(inserts) == 120
+
+
+def test_grava_pelo_intervalo(engine):
+    gravador = GravadorHistorico(engine, tamanho_lote=1000, intervalo=0.2)
+    gravador.registrar(registro(1))
+    assert contar(engine) == 0
+    aguardar(lambda: contar(engine) == 1)
+    gravador.descarregar()
+
+
+def test_falha_na_gravacao_mantem_os_registros(engine):
+    gravador = GravadorHistorico(engine, tamanho_lote=1, intervalo=0.1)
+    falhas = []
+    gravar = gravador._gravar
+
+    def gravar_com_falha(lote):
+        if not falhas:
+            falhas.append(len(lote))
+            return False
+        return gravar(lote)
+
+    gravador._gravar = gravar_com_falha
+    gravador.registrar(registro(1))
+    aguardar(lambda: contar(engine) == 1)
+    gravador.descarregar()
+    assert falhas == [1] and gravador.descartados == 0
+
+
+def test_buffer_cheio_descarta_os_mais_antigos(engine):
+    gravador = GravadorHistorico(engine, tamanho_lote=1000, intervalo=60, max_pendentes=10)
+    for i in range(15):
+        gravador.registrar(registro(i))
+    gravador.descarregar()
+
+    assert gravador.descartados == 5
+    with engine.connect() as conn:
+        destinatarios = conn.execute(select(HistoricoMensagem.destinatario)).scalars().all()
+    assert sorted(destinatarios) == sorted(f"contato{i}@teste.com" for i in range(5, 15))
+
+
+def test_listagem_por_contato_e_periodo(engine, cliente):
+    inicio = datetime(2025, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(HistoricoMensagem.__table__.insert(), [
+            registro(i, contato_id=1 + i % 2, data_envio=inicio + timedelta(hours=i), sucesso=i % 5 != 0)
+            for i in range(50)
+        ])
+
+    resposta = cliente.get("/api/historico/", params={"contact_id": 2, "limit": 10})
+    assert resposta.status_code == 200
+    pagina = resposta.json()
+    assert len(pagina["itens"]) == 10 and pagina["next_cursor"]
+    assert {item["contato_id"] for item in pagina["itens"]} == {2}
+    assert pagina["itens"][0]["data_envio"] == (inicio + timedelta(hours=49)).isoformat()
+
+    vistos = [item["id"] for item in pagina["itens"]]
+    while pagina["next_cursor"]:
+        pagina = cliente.get(
+            "/api/historico/", params={"contact_id": 2, "limit": 10, "cursor": pagina["next_cursor"]}
+        ).json()
+        vistos += [item["id"] for item in pagina["itens"]]
+    assert len(vistos) == len(set(vistos)) == 25
+
+    resposta = cliente.get("/api/historico/", params={
+        "inicio": (inicio + timedelta(hours=10)).isoformat(),
+        "fim": (inicio + timedelta(hours=20)).isoformat(),
+        "status": "erro",
+    })
+    erros = resposta.json()["itens"]
+    assert [item["destinatario"] for item in erros] == ["contato15@teste.com", "contato10@teste.com"]
+    assert erros[0]["erro"] == "recusado"
+
+    # Com fuso: 09:00-03:00 é 12:00 UTC
+    resposta = cliente.get("/api/historico/", params={"inicio": "2025-01-01T09:00:00-03:00", "limit": 500})
+    assert len(resposta.json()["itens"]) == 38
+
+    assert cliente.get("/api/historico/", params={
+        "inicio": inicio.isoformat(), "fim": inicio.isoformat(),
+    }).status_code == 400
+    assert cliente.get("/api/historico/", params={"cursor": "invalido"}).status_code == 400
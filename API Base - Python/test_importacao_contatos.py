@@ -0,0 +1,144 @@
+"""
+Testes da importação de contatos em lotes (service/importacao_contatos.py):
+numeração dos erros por linha, duplicados no arquivo e no banco, o modo
+"atualizar" e a regravação linha a linha quando o lote inteiro falha.
+
+Usa um banco SQLite temporário; o caminho por COPY do PostgreSQL fica em
+test_postgres.py.
+
+Uso:
+    python -m pytest test_importacao_contatos.py -q
+"""
+import io
+
+import pytest
+from sqlalchemy import event
+
+from database import Cliente, Contact
+from service.importacao_contatos import ArquivoInvalido, ImportadorContatos, MODO_ATUALIZAR
+
+
+def contar_inserts(engine) -> list:
+    """Lista que recebe o número de linhas de cada INSERT em contacts."""
+    inserts = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def contar_insert(conn, cursor, sql, parametros, contexto, executemany):
+        if sql.startswith("INSERT INTO contacts"):
+            inserts.append(len(parametros) if executemany else 1)
+
+    return inserts
+
+
+def contatos(sessoes) -> dict:
+    db = sessoes()
+    try:
+        return {contato.email: contato for contato in db.query(Contact)}
+    finally:
+        db.close()
+
+
+def test_erros_por_linha(engine, sessoes):
+    db = sessoes()
+    db.add(Cliente(id=1, nome="Cliente", email="cliente@teste.com"))
+    db.add(Contact(name="Existente", email="existente@teste.com", canalPref="email"))
+    db.commit()
+    inserts = contar_inserts(engine)
+
+    arquivo = io.BytesIO(
+        "name,email,phone,canalPref,codExterno,cliente_id\n"
+        "Ana,ana@teste.com,,EMAIL,A1,1\n"
+        '"Bruno\nSilva",bruno@teste.com,+5511999990000,whatsapp,,\n'
+        ",sem.nome@teste.com,,,,\n"
+        "Curta,curta@teste.com\n"
+        "Repetido,existente@teste.com,,,,\n"
+        "Ana de novo,ANA@teste.com,,,,\n"
+        "Carla,carla@teste.com,,,A1,\n"
+        "Dora,dora@teste.com,,,,99\n"
+        "\n"
+        "Eva,eva@teste.com,,,,\n".encode("utf-8")
+    )
+    resultado = ImportadorContatos(db, tamanho_lote=4).importar(arquivo)
+    db.close()
+
+    # O registro entre aspas ocupa as linhas 3 e 4; a linha em branco não conta
+    assert resultado == {
+        "status": "parcial",
+        "importados": 3,
+        "total_linhas": 9,
+        "erros": [
+            "Erro na linha 5: nome e email são obrigatórios",
+            "Erro na linha 6: a linha tem menos colunas que o cabeçalho",
+            "Linha 7: Email existente@teste.com já existe",
+            "Linha 8: Email ana@teste.com já existe",
+            "Linha 9: Código externo A1 já existe",
+            "Linha 10: Cliente 99 não existe",
+        ],
+    }
+    # Um INSERT com vários valores por lote, nunca um por linha
+    assert inserts == [2, 1]
+    gravados = contatos(sessoes)
+    assert set(gravados) == {"existente@teste.com", "ana@teste.com", "bruno@teste.com", "eva@teste.com"}
+    ana, bruno = gravados["ana@teste.com"], gravados["bruno@teste.com"]
+    assert (ana.name, ana.canalPref, ana.codExterno, ana.cliente_id) == ("Ana", "email", "A1", 1)
+    assert (bruno.name, bruno.phone) == ("Bruno\nSilva", "+5511999990000")
+
+
+def test_atualizar_altera_so_as_colunas_do_arquivo(sessoes):
+    db = sessoes()
+    db.add(Contact(name="Ana", email="ana@teste.com", phone="+5511999990000", canalPref="whatsapp", codExterno="A1"))
+    db.commit()
+
+    arquivo = io.BytesIO(
+        b"name,email,canalPref\n"
+        b"Ana Maria,ANA@teste.com,email\n"
+        b"Novo,novo@teste.com,\n"
+        b"Novo de novo,novo@teste.com,whatsapp\n"
+    )
+    resultado = ImportadorContatos(db, MODO_ATUALIZAR).importar(arquivo)
+    db.close()
+
+    # O email repetido no arquivo vira uma atualização da linha anterior
+    assert resultado == {"status": "sucesso", "importados": 1, "atualizados": 2, "total_linhas": 3}
+    gravados = contatos(sessoes)
+    ana, novo = gravados["ana@teste.com"], gravados["novo@teste.com"]
+    # phone e codExterno não estão no arquivo: continuam como estavam
+    assert (ana.name, ana.canalPref, ana.phone, ana.codExterno) == ("Ana Maria", "email", "+5511999990000", "A1")
+    assert (novo.name, novo.canalPref) == ("Novo de novo", "whatsapp")
+
+
+def test_conflito_nao_previsto_refaz_o_lote_linha_a_linha(sessoes, monkeypatch):
+    # Simula um contato gravado por outra sessão depois da pré-carga do lote:
+    # o INSERT do lote falha inteiro e é refeito linha a linha
+    db = sessoes()
+    importador = ImportadorContatos(db)
+    comando = importador._comando
+    chamadas = []
+
+    def comando_apos_concorrente():
+        if not chamadas:
+            outra = sessoes()
+            outra.add(Contact(name="Concorrente", email="bruno@teste.com", canalPref="email"))
+            outra.commit()
+            outra.close()
+        chamadas.append(1)
+        return comando()
+
+    monkeypatch.setattr(importador, "_comando", comando_apos_concorrente)
+    resultado = importador.importar(io.BytesIO(b"name,email\nAna,ana@teste.com\nBruno,bruno@teste.com\n"))
+    db.close()
+
+    assert resultado["importados"] == 1 and resultado["status"] == "parcial"
+    assert len(resultado["erros"]) == 1 and resultado["erros"][0].startswith("Erro na linha 3: UNIQUE")
+    assert contatos(sessoes)["bruno@teste.com"].name == "Concorrente"
+
+
+def test_arquivo_latin1_e_cabecalho_incompleto(sessoes):
+    db = sessoes()
+    resultado = ImportadorContatos(db).importar(io.BytesIO("name,email\nJosé,jose@teste.com\n".encode("latin-1")))
+    assert resultado["importados"] == 1
+    assert contatos(sessoes)["jose@teste.com"].name == "José"
+
+    with pytest.raises(ArquivoInvalido, match="email"):
+        ImportadorContatos(db).importar(io.BytesIO(b"name,phone\nAna,+5511999990000\n"))
+    db.close()
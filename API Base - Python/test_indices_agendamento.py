@@ -0,0 +1,146 @@
+"""
+Teste dos índices de mensagens_agendadas.
+
+Popula um banco SQLite temporário com 1 milhão de agendamentos (ajustável com
+TESTE_INDICES_LINHAS) e verifica, via EXPLAIN QUERY PLAN, que as consultas
+quentes do despachante, das listagens e do cascade de contatos usam índices:
+nenhuma varre a tabela inteira nem ordena em uma B-tree temporária.
+
+Uso:
+    python -m pytest test_indices_agendamento.py -q
+"""
+import os
+import random
+import re
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.dialects import sqlite
+
+from database import Base, MensagemAgendada
+from paginacao import codificar_cursor, filtrar_apos_cursor
+from service.agendamento_service import AgendamentoService
+
+LINHAS = int(os.getenv("TESTE_INDICES_LINHAS", "1000000"))
+CONTATOS = 10000
+STATUS = ["AGENDADO", "ENVIADO", "ENVIADO", "ENVIADO", "ERRO", "CANCELADO", "RETENTATIVA"]
+
+
+@pytest.fixture(scope="module")
+def conexao(tmp_path_factory):
+    caminho = tmp_path_factory.mktemp("indices") / "indices.db"
+    engine = create_engine(f"sqlite:///{caminho}")
+    Base.metadata.create_all(bind=engine)
+
+    inicio = datetime(2024, 1, 1)
+    aleatorio = random.Random(42)
+    linhas = (
+        (
+            aleatorio.randrange(1, CONTATOS),
+            "email",
+            f"contato{i}@teste.com",
+            "Mensagem",
+            (inicio + timedelta(minutes=aleatorio.randrange(0, 2 * 365 * 24 * 60))).isoformat(" "),
+            aleatorio.choice(STATUS),
+            inicio.isoformat(" "),
+        )
+        for i in range(LINHAS)
+    )
+    bruta = engine.raw_connection()
+    try:
+        bruta.executemany(
+            "INSERT INTO mensagens_agendadas "
+            "(contato_id, canal, destinatario, conteudo, data_agendamento, status, criado_em) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            linhas,
+        )
+        bruta.commit()
+    finally:
+        bruta.close()
+
+    with engine.connect() as conn:
+        yield conn
+    engine.dispose()
+
+
+def plano(conexao, consulta) -> list:
+    """Executa EXPLAIN QUERY PLAN da consulta e retorna as linhas de detalhe."""
+    compilada = consulta.compile(dialect=sqlite.dialect(), compile_kwargs={"render_postcompile": True})
+    parametros = (None,) * len(compilada.positiontup or ())
+    resultado = conexao.exec_driver_sql(f"EXPLAIN QUERY PLAN {compilada}", parametros)
+    return [linha[-1] for linha in resultado]
+
+
+def assert_usa_indice(conexao, consulta):
+    detalhes = plano(conexao, consulta)
+    texto = "\n".join(detalhes)
+    assert not any(re.fullmatch(r"SCAN mensagens_agendadas", d) for d in detalhes), f"varredura completa:\n{texto}"
+    assert "USE TEMP B-TREE" not in texto, f"ordenação sem índice:\n{texto}"
+    assert "INDEX" in texto, f"nenhum índice usado:\n{texto}"
+
+
+def test_fila_do_despachante(conexao):
+    for condicao, ordem in AgendamentoService.condicoes_elegiveis(datetime.utcnow()):
+        assert_usa_indice(conexao, AgendamentoService.consulta_candidatas(condicao, 100, ordem))
+
+
+def test_listagem_sem_filtro(conexao):
+    consulta = select(MensagemAgendada).order_by(MensagemAgendada.data_agendamento.desc()).limit(100)
+    assert_usa_indice(conexao, consulta)
+
+
+def test_listagem_por_status(conexao):
+    consulta = (
+        select(MensagemAgendada)
+        .where(MensagemAgendada.status == "ENVIADO")
+        .order_by(MensagemAgendada.data_agendamento.desc())
+        .limit(100)
+    )
+    assert_usa_indice(conexao, consulta)
+
+
+def test_consulta_por_contato(conexao):
+    consulta = (
+        select(MensagemAgendada)
+        .where(MensagemAgendada.contato_id == 42, MensagemAgendada.status == "AGENDADO")
+        .order_by(MensagemAgendada.data_agendamento.desc())
+        .limit(100)
+    )
+    assert_usa_indice(conexao, consulta)
+
+
+def test_paginas_por_cursor(conexao):
+    # Páginas seguintes filtram por (data_agendamento, id) < cursor: o índice
+    # posiciona direto no cursor em vez de percorrer as linhas anteriores
+    ordem = [MensagemAgendada.data_agendamento, MensagemAgendada.id]
+    cursor = codificar_cursor(ordem, [datetime(2025, 1, 1), 500000])
+    filtros = [
+        [],
+        [MensagemAgendada.status == "ENVIADO"],
+        [MensagemAgendada.contato_id == 42],
+    ]
+    for filtro in filtros:
+        consulta = filtrar_apos_cursor(select(MensagemAgendada).where(*filtro), ordem, cursor, decrescente=True)
+        assert_usa_indice(conexao, consulta.limit(101))
+
+
+def test_listagem_de_ativos(conexao):
+    # /agendamentos/ativos/listar: só as pendentes são lidas (pelo status) e
+    # ordenadas; o índice parcial que dispensa a ordenação é só do PostgreSQL
+    ordem = [MensagemAgendada.data_agendamento, MensagemAgendada.id]
+    ativos = select(MensagemAgendada).where(MensagemAgendada.status.in_(("AGENDADO", "RETENTATIVA")))
+    for cursor in (None, codificar_cursor(ordem, [datetime(2025, 1, 1), 500000])):
+        detalhes = plano(conexao, filtrar_apos_cursor(ativos, ordem, cursor).limit(101))
+        assert any(re.match(r"SEARCH mensagens_agendadas USING INDEX ix_\w+ \(status=\?", d) for d in detalhes), detalhes
+
+
+def test_cascade_de_contato(conexao):
+    # O cascade do relacionamento Contact.mensagens_agendadas carrega as mensagens do contato
+    consulta = select(MensagemAgendada).where(MensagemAgendada.contato_id == 42)
+    detalhes = plano(conexao, consulta)
+    assert any("USING INDEX ix_mensagens_agendadas_contato_data" in d for d in detalhes), detalhes
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
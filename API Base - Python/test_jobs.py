@@ -0,0 +1,137 @@
+"""
+Testes dos jobs de importação e exportação em segundo plano (service/jobs.py,
+routes/jobs.py e as rotas /api/contacts/import/job e /export/job): execução
+no executor local, download do arquivo gerado, jobs de outros usuários e
+expiração do estado.
+
+Usa um banco SQLite temporário e o armazenamento em memória.
+
+Uso:
+    python -m pytest test_jobs.py -q
+"""
+import csv
+import gzip
+import io
+import os
+import time
+
+import pytest
+
+from auth import get_current_active_user
+from conftest import USUARIO_TESTE
+from database import Contact, User
+from routes import contacts, jobs as rotas_jobs
+from service import exportacao_contatos, jobs
+
+ROTEADORES = [contacts.router, rotas_jobs.router]
+
+
+class Relogio:
+    """Substitui o módulo time em service.jobs; o tempo só anda quando o teste manda."""
+
+    def __init__(self):
+        self.agora = time.time()
+
+    def time(self) -> float:
+        return self.agora
+
+
+@pytest.fixture
+def jobs_locais(sessoes, tmp_path, monkeypatch):
+    """Jobs no executor local, com estado em memória e arquivos no diretório temporário."""
+    monkeypatch.setattr(jobs, "EXECUTOR_JOBS", "local")
+    monkeypatch.setattr(jobs, "DIRETORIO_JOBS", str(tmp_path / "jobs"))
+    monkeypatch.setattr(jobs, "_armazenamento", jobs.ArmazenamentoMemoria(ttl=60))
+    monkeypatch.setattr(jobs, "SessionLocal", sessoes)
+    monkeypatch.setattr(exportacao_contatos, "SessionLocal", sessoes)
+    yield
+    jobs.encerrar_executor_local()
+
+
+def aguardar(cliente, job_id: str) -> dict:
+    """Consulta o job até ele terminar."""
+    limite = time.monotonic() + 10
+    while time.monotonic() < limite:
+        job = cliente.get(f"/api/jobs/{job_id}").json()
+        if job["status"] in (jobs.STATUS_CONCLUIDO, jobs.STATUS_ERRO):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"O job {job_id} não terminou")
+
+
+def test_job_de_importacao_com_relatorio_de_erros(cliente, jobs_locais, sessoes):
+    arquivo = b"name,email\nAna,ana@teste.com\n,sem.nome@teste.com\nAna de novo,ana@teste.com\nBruno,bruno@teste.com\n"
+    resposta = cliente.post("/api/contacts/import/job", files={"file": ("contatos.csv", arquivo, "text/csv")})
+    assert resposta.status_code == 202
+    job_id = resposta.json()["job_id"]
+
+    job = aguardar(cliente, job_id)
+    assert job["status"] == jobs.STATUS_CONCLUIDO
+    assert (job["processadas"], job["erros"]) == (4, 2)
+    assert job["resultado"] == {"status": "parcial", "importados": 2, "total_linhas": 4}
+    assert job["amostra_erros"] == [
+        "Erro na linha 3: nome e email são obrigatórios",
+        "Linha 4: Email ana@teste.com já existe",
+    ]
+    assert job["download"] == f"/api/jobs/{job_id}/download"
+    # O arquivo enviado é removido depois da importação
+    assert [nome for nome in os.listdir(jobs.DIRETORIO_JOBS) if "entrada" in nome] == []
+
+    download = cliente.get(job["download"])
+    assert download.status_code == 200
+    assert download.headers["content-disposition"] == f'attachment; filename="erros_importacao_{job_id}.csv"'
+    assert list(csv.reader(io.StringIO(download.text))) == [["erro"]] + [[erro] for erro in job["amostra_erros"]]
+
+    db = sessoes()
+    assert {contato.email for contato in db.query(Contact)} == {"ana@teste.com", "bruno@teste.com"}
+    db.close()
+
+
+def test_job_de_exportacao_em_gzip(cliente, jobs_locais, sessoes):
+    db = sessoes()
+    db.add_all(Contact(name=f"Contato {i}", email=f"contato{i}@teste.com", canalPref="email") for i in range(3))
+    db.commit()
+    db.close()
+
+    resposta = cliente.post("/api/contacts/export/job", params={"gzip": "true"})
+    assert resposta.status_code == 202
+    job = aguardar(cliente, resposta.json()["job_id"])
+    assert job["status"] == jobs.STATUS_CONCLUIDO
+    assert job["resultado"] == {"exportados": 3}
+
+    download = cliente.get(job["download"])
+    assert download.status_code == 200
+    assert download.headers["content-type"] == "application/gzip"
+    linhas = list(csv.reader(io.StringIO(gzip.decompress(download.content).decode("utf-8"))))
+    assert linhas[0] == exportacao_contatos.COLUNAS_CSV
+    assert [linha[2] for linha in linhas[1:]] == [f"contato{i}@teste.com" for i in range(3)]
+
+    # O arquivo removido (por limpar_arquivos_expirados, por exemplo) responde 404
+    os.remove(jobs.caminho_arquivo(f"{job['id']}.csv.gz"))
+    assert cliente.get(job["download"]).status_code == 404
+
+
+def test_job_de_outro_usuario_ou_inexistente(cliente, jobs_locais):
+    job = jobs.criar_job(jobs.TIPO_EXPORTACAO, USUARIO_TESTE.username, {})
+    resposta = cliente.get(f"/api/jobs/{job['id']}")
+    assert resposta.status_code == 200
+    assert resposta.json()["status"] == jobs.STATUS_PENDENTE and resposta.json()["download"] is None
+    # Sem arquivo até o job terminar
+    assert cliente.get(f"/api/jobs/{job['id']}/download").status_code == 409
+
+    cliente.app.dependency_overrides[get_current_active_user] = lambda: User(id=2, username="outro", disabled=False)
+    assert cliente.get(f"/api/jobs/{job['id']}").status_code == 404
+    assert cliente.get(f"/api/jobs/{job['id']}/download").status_code == 404
+    assert cliente.get("/api/jobs/naoexiste").status_code == 404
+
+
+def test_estado_expira_depois_do_ttl(cliente, jobs_locais, monkeypatch):
+    relogio = Relogio()
+    monkeypatch.setattr(jobs, "time", relogio)
+    job = jobs.criar_job(jobs.TIPO_EXPORTACAO, USUARIO_TESTE.username, {})
+
+    relogio.agora += 59
+    assert cliente.get(f"/api/jobs/{job['id']}").status_code == 200
+    relogio.agora += 2
+    assert cliente.get(f"/api/jobs/{job['id']}").status_code == 404
+    assert jobs.obter_job(job["id"]) is None
@@ -0,0 +1,237 @@
+"""
+Testes do limite de taxa do despachante: token bucket com reservas
+(service/limitador.py), limites por conta e baldes no Redis
+(service/limite_envio.py), o adiamento das mensagens que passam da cota e
+as retentativas, que só voltam à fila quando vencem.
+
+O teste do Redis roda contra TEST_REDIS_URL (as chaves limite_envio:teste:*
+são apagadas); sem a variável, ele é pulado:
+
+    TEST_REDIS_URL=redis://localhost:6379/15 python -m pytest test_limite_envio.py -q
+"""
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+import redis
+from sqlalchemy import update
+
+from database import MensagemAgendada
+from service import agendamento_service
+from service.agendamento_service import AgendamentoService, STATUS_ENVIADO, STATUS_RETENTATIVA
+from service.despachante import DespachanteConcorrente
+from service.limitador import LimitadorTaxa
+from service.limite_envio import LimitadorEnvios, limites_do_ambiente
+
+REDIS_URL = os.getenv("TEST_REDIS_URL", "")
+
+
+def test_reserva_concede_ate_a_espera_maxima_e_espaca_os_adiamentos():
+    balde = LimitadorTaxa(10, 5)
+    reserva = balde.reservar(20, 1.0)
+    # 5 da rajada na hora, mais 10 nos próximos 1s (um a cada 0,1s)
+    assert len(reserva.esperas) == 15
+    assert reserva.esperas[:5] == [0.0] * 5
+    assert reserva.esperas[5:] == pytest.approx([0.1 * i for i in range(1, 11)], abs=0.01)
+    assert reserva.adiamentos == pytest.approx([1.1, 1.2, 1.3, 1.4, 1.5], abs=0.01)
+
+    # Os próximos adiamentos entram depois dos anteriores, sem consumir tokens
+    reserva = balde.reservar(3, 1.0)
+    assert reserva.esperas == []
+    assert reserva.adiamentos == pytest.approx([1.6, 1.7, 1.8], abs=0.01)
+
+    assert LimitadorTaxa(0).reservar(3, 0).esperas == [0.0] * 3
+
+
+def test_limites_por_conta():
+    limites = limites_do_ambiente(
+        taxas={"email": 5, "whatsapp": 20}, rajadas={"email": 0, "whatsapp": 40},
+        contas="email:vendas@empresa.com=1/3, whatsapp:whatsapp:+14155238886=2,invalido",
+    )
+    assert limites == {
+        "email": (5, 5),
+        "whatsapp": (20, 40),
+        "email:vendas@empresa.com": (1.0, 3.0),
+        "whatsapp:whatsapp:+14155238886": (2.0, 2.0),
+    }
+    limitador = LimitadorEnvios(limites, armazenamento="memoria",
+                                contas={"email": "vendas@empresa.com", "whatsapp": "whatsapp:+5511"})
+    assert limitador.limite("email", "vendas@empresa.com") == (1.0, 3.0)
+    assert limitador.limite("whatsapp", "whatsapp:+5511") == (20, 40)
+    assert limitador.limite("sms", "") == (0.0, 0.0)
+
+
+def test_redis_fora_do_ar_usa_baldes_em_memoria():
+    fora_do_ar = redis.Redis(host="127.0.0.1", port=1, socket_connect_timeout=0.2)
+    limitador = LimitadorEnvios({"email": (1, 1)}, espera_maxima=0, cliente_redis=fora_do_ar,
+                                contas={"email": "conta@teste.com"})
+    reserva = limitador.reservar("email", 3)
+    assert (len(reserva.esperas), len(reserva.adiamentos)) == (1, 2)
+    # Não volta a tentar o Redis a cada lote enquanto estiver em repouso
+    assert limitador._redis_suspenso_ate > time.monotonic()
+    assert len(limitador.reservar("email", 1).esperas) == 0
+
+
+@pytest.mark.skipif(not REDIS_URL, reason="TEST_REDIS_URL não definido")
+def test_balde_compartilhado_no_redis():
+    cliente = redis.Redis.from_url(REDIS_URL)
+    for chave in cliente.scan_iter(LimitadorEnvios.PREFIXO + "teste:*"):
+        cliente.delete(chave)
+    # Dois workers com a mesma conta dividem o mesmo balde
+    workers = [
+        LimitadorEnvios({"teste": (2, 2)}, espera_maxima=0, cliente_redis=redis.Redis.from_url(REDIS_URL),
+                        contas={"teste": "conta@teste.com"})
+        for _ in range(2)
+    ]
+    primeira = workers[0].reservar("teste", 3)
+    segunda = workers[1].reservar("teste", 3)
+    assert (len(primeira.esperas), len(segunda.esperas)) == (2, 0)
+    assert primeira.adiamentos == pytest.approx([0.5], abs=0.05)
+    assert segunda.adiamentos == pytest.approx([1.0, 1.5, 2.0], abs=0.05)
+    assert 0 < cliente.ttl(LimitadorEnvios.PREFIXO + "teste:conta@teste.com") <= 5
+
+
+def despachar(sessoes, servico_falso, limitador: LimitadorEnvios) -> float:
+    """Uma passada do despachante; retorna quanto tempo ela levou."""
+    despachante = DespachanteConcorrente({"email": 2, "whatsapp": 2}, fabrica_servico=servico_falso)
+    servico = AgendamentoService(despachante=despachante, limitador=limitador)
+    db = sessoes()
+    inicio = time.monotonic()
+    try:
+        servico._gravar_resultados(db, servico._despachar(servico._reivindicar_lote(db)))
+    finally:
+        db.close()
+        despachante.encerrar()
+    return time.monotonic() - inicio
+
+
+def test_mensagens_acima_da_cota_sao_adiadas(sessoes, servico_falso, agendar):
+    agendar("whatsapp", [f"destino{i}" for i in range(6)])
+    limitador = LimitadorEnvios({"whatsapp": (10, 1)}, espera_maxima=0.3, armazenamento="memoria",
+                                contas={"whatsapp": "whatsapp:+14155238886"})
+    duracao = despachar(sessoes, servico_falso, limitador)
+
+    # 1 na hora e 3 espaçadas de 0,1s; as outras 2 voltam à fila sem erro
+    assert duracao >= 0.3
+    instantes = sorted(instante for _, instante in servico_falso.envios)
+    assert len(instantes) == 4 and instantes[-1] - instantes[0] >= 0.25
+    db = sessoes()
+    mensagens = db.query(MensagemAgendada).order_by(MensagemAgendada.id).all()
+    db.close()
+    assert [m.status for m in mensagens] == [STATUS_ENVIADO] * 4 + [STATUS_RETENTATIVA] * 2
+    adiadas = mensagens[4:]
+    assert all(m.tentativas == 0 and m.erro_mensagem is None and m.classe_erro is None for m in adiadas)
+    assert (adiadas[1].proximo_envio_em - adiadas[0].proximo_envio_em).total_seconds() == pytest.approx(0.1, abs=0.02)
+
+
+def test_lote_de_emails_respeita_a_vez_de_cada_mensagem(sessoes, servico_falso, agendar):
+    agendar("email", [f"destino{i}" for i in range(12)])
+    limitador = LimitadorEnvios({"email": (20, 2)}, espera_maxima=1, armazenamento="memoria",
+                                contas={"email": "conta@teste.com"})
+    duracao = despachar(sessoes, servico_falso, limitador)
+
+    # 2 da rajada e as outras 10 a cada 0,05s, pelas sessões SMTP dos 2 workers
+    assert duracao >= 0.5
+    instantes = sorted(instante for _, instante in servico_falso.envios)
+    assert len(instantes) == 12
+    # Nenhuma sai antes da sua vez (as que já podem sair seguem juntas)
+    assert all(instante - instantes[0] >= (k - 1) * 0.05 - 0.02 for k, instante in enumerate(instantes))
+    db = sessoes()
+    assert {m.status for m in db.query(MensagemAgendada)} == {STATUS_ENVIADO}
+    db.close()
+
+
+def reivindicacoes_vencidas(servico: AgendamentoService) -> list:
+    """
+    Envolve o _reivindicar_lote do serviço; a lista recebe, por lote, os ids
+    reivindicados e se todos já estavam vencidos naquele instante.
+    """
+    lotes = []
+    reivindicar = servico._reivindicar_lote
+
+    def reivindicar_e_registrar(db):
+        lote = reivindicar(db)
+        agora = datetime.utcnow()
+        if lote:
+            lotes.append(([m.id for m in lote],
+                          all(m.proximo_envio_em is None or m.proximo_envio_em <= agora for m in lote)))
+        return lote
+
+    servico._reivindicar_lote = reivindicar_e_registrar
+    return lotes
+
+
+def test_retentativa_nao_sai_antes_do_proximo_envio(sessoes, servico_falso, agendar, monkeypatch):
+    monkeypatch.setattr(agendamento_service, "SessionLocal", sessoes)
+    agendar("whatsapp", ["destino0"])
+    db = sessoes()
+    vence_em = datetime.utcnow() + timedelta(seconds=0.3)
+    db.execute(update(MensagemAgendada).values(status=STATUS_RETENTATIVA, tentativas=1, proximo_envio_em=vence_em))
+    db.commit()
+    db.close()
+    despachante = DespachanteConcorrente({"whatsapp": 1}, fabrica_servico=servico_falso)
+    # Espera máxima bem maior que o tempo até a retentativa vencer
+    limitador = LimitadorEnvios({"whatsapp": (100, 100)}, espera_maxima=2, armazenamento="memoria",
+                                contas={"whatsapp": "whatsapp:+14155238886"})
+    servico = AgendamentoService(despachante=despachante, limitador=limitador)
+
+    try:
+        assert servico.processar_mensagens_pendentes() == 0
+        assert servico_falso.envios == []
+        time.sleep(max(0.0, (vence_em - datetime.utcnow()).total_seconds()))
+        assert servico.processar_mensagens_pendentes() == 1
+    finally:
+        despachante.encerrar()
+    assert len(servico_falso.envios) == 1
+
+
+def test_adiadas_nao_voltam_no_mesmo_passe(sessoes, servico_falso, agendar, monkeypatch):
+    monkeypatch.setattr(agendamento_service, "SessionLocal", sessoes)
+    agendar("whatsapp", [f"destino{i}" for i in range(6)])
+    despachante = DespachanteConcorrente({"whatsapp": 2}, fabrica_servico=servico_falso)
+    limitador = LimitadorEnvios({"whatsapp": (10, 1)}, espera_maxima=0.3, armazenamento="memoria",
+                                contas={"whatsapp": "whatsapp:+14155238886"})
+    servico = AgendamentoService(despachante=despachante, limitador=limitador)
+    lotes = reivindicacoes_vencidas(servico)
+
+    try:
+        assert servico.processar_mensagens_pendentes() == 6
+    finally:
+        despachante.encerrar()
+
+    # Um único lote: as 2 adiadas (em 0,4s e 0,5s) não são reivindicadas de
+    # novo depois dos 0,3s gastos com as 4 primeiras
+    assert len(lotes) == 1 and lotes[0][1]
+    assert len(servico_falso.envios) == 4
+    db = sessoes()
+    assert [m.status for m in db.query(MensagemAgendada).order_by(MensagemAgendada.id)] == \
+        [STATUS_ENVIADO] * 4 + [STATUS_RETENTATIVA] * 2
+    db.close()
+
+
+def test_lote_todo_adiado_espera_a_cota(sessoes, servico_falso, agendar, monkeypatch):
+    monkeypatch.setattr(agendamento_service, "SessionLocal", sessoes)
+    agendar("whatsapp", [f"destino{i}" for i in range(3)])
+    despachante = DespachanteConcorrente({"whatsapp": 1}, fabrica_servico=servico_falso)
+    limitador = LimitadorEnvios({"whatsapp": (10, 1)}, espera_maxima=0, armazenamento="memoria",
+                                contas={"whatsapp": "whatsapp:+14155238886"})
+    # Balde já vazio: o primeiro lote inteiro é adiado
+    limitador.reservar("whatsapp", 1)
+    servico = AgendamentoService(tamanho_lote=1, despachante=despachante, limitador=limitador)
+    lotes = reivindicacoes_vencidas(servico)
+
+    try:
+        servico.processar_mensagens_pendentes()
+    finally:
+        despachante.encerrar()
+
+    # Cada mensagem é adiada uma vez e reivindicada de novo só quando vence,
+    # em vez de o passe adiar a fila inteira e terminar sem enviar nada
+    assert all(vencidas for _, vencidas in lotes)
+    assert [ids for ids, _ in lotes] == [[1], [1], [2], [2], [3], [3]]
+    instantes = [instante for _, instante in servico_falso.envios]
+    assert len(instantes) == 3 and all(b - a >= 0.09 for a, b in zip(instantes, instantes[1:]))
+    db = sessoes()
+    assert {m.status for m in db.query(MensagemAgendada)} == {STATUS_ENVIADO}
+    db.close()
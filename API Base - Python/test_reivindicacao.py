@@ -0,0 +1,140 @@
+"""
+Testes da reivindicação de lotes do despachante (service/agendamento_service.py):
+workers concorrentes nunca enviam a mesma mensagem, leases expirados voltam à
+fila (e leases válidos não), e o resultado de um worker que perdeu o lease é
+descartado.
+
+Os cenários rodam aqui em um banco SQLite temporário e, em test_postgres.py,
+contra o PostgreSQL de TEST_DATABASE_URL.
+
+Uso:
+    python -m pytest test_reivindicacao.py -q
+"""
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+
+from database import Contact, MensagemAgendada
+from service import agendamento_service
+from service.agendamento_service import (
+    AgendamentoService, STATUS_AGENDADO, STATUS_ENVIADO, STATUS_PROCESSANDO,
+)
+from service.despachante import DespachanteConcorrente
+from service.limite_envio import LimitadorEnvios
+
+
+def criar_mensagens(sessoes, quantidade: int, **valores) -> list:
+    """Cria `quantidade` mensagens de email vencidas (AGENDADO, salvo `valores`) e retorna os ids."""
+    db = sessoes()
+    contato = Contact(name="Contato", email=f"contato{db.query(Contact).count()}@teste.com", canalPref="email")
+    db.add(contato)
+    db.flush()
+    vencida = datetime.utcnow() - timedelta(minutes=1)
+    mensagens = [
+        MensagemAgendada(
+            contato_id=contato.id, canal="email", destinatario=f"m{i}@teste.com", conteudo="Mensagem",
+            data_agendamento=vencida, status=valores.get("status", STATUS_AGENDADO),
+            worker_id=valores.get("worker_id"), lease_expira_em=valores.get("lease_expira_em"),
+        )
+        for i in range(quantidade)
+    ]
+    db.add_all(mensagens)
+    db.commit()
+    ids = [m.id for m in mensagens]
+    db.close()
+    return ids
+
+
+def sem_limite() -> LimitadorEnvios:
+    return LimitadorEnvios({}, espera_maxima=0, armazenamento="memoria", contas={"email": "conta@teste.com"})
+
+
+def cenario_workers_concorrentes(sessoes, servico_falso, monkeypatch, workers: int = 4, mensagens: int = 200):
+    monkeypatch.setattr(agendamento_service, "SessionLocal", sessoes)
+    criar_mensagens(sessoes, mensagens)
+    barreira = threading.Barrier(workers)
+    erros = []
+
+    def trabalhar():
+        despachante = DespachanteConcorrente({"email": 2}, fabrica_servico=servico_falso)
+        servico = AgendamentoService(tamanho_lote=7, despachante=despachante, limitador=sem_limite())
+        barreira.wait()
+        try:
+            servico.processar_mensagens_pendentes()
+        except Exception as e:
+            erros.append(e)
+        finally:
+            despachante.encerrar()
+
+    threads = [threading.Thread(target=trabalhar) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not erros
+    # Cada mensagem sai exatamente uma vez, por um único worker
+    envios = Counter(destinatario for destinatario, _ in servico_falso.envios)
+    assert len(envios) == mensagens and set(envios.values()) == {1}
+    db = sessoes()
+    assert {m.status for m in db.query(MensagemAgendada)} == {STATUS_ENVIADO}
+    assert db.query(MensagemAgendada).filter(MensagemAgendada.worker_id.isnot(None)).count() == 0
+    db.close()
+
+
+def cenario_lease_expirado_volta_a_fila(sessoes):
+    agora = datetime.utcnow()
+    [expirada] = criar_mensagens(sessoes, 1, status=STATUS_PROCESSANDO, worker_id="travado#1",
+                                 lease_expira_em=agora - timedelta(seconds=1))
+    [valida] = criar_mensagens(sessoes, 1, status=STATUS_PROCESSANDO, worker_id="ativo#1",
+                               lease_expira_em=agora + timedelta(minutes=5))
+
+    servico = AgendamentoService(duracao_lease=60, despachante=object(), limitador=sem_limite())
+    db = sessoes()
+    lote = servico._reivindicar_lote(db)
+    db.close()
+
+    assert [m.id for m in lote] == [expirada]
+    assert lote[0].worker_id.startswith(servico.worker_id) and lote[0].lease_expira_em > agora
+    db = sessoes()
+    mensagem = db.get(MensagemAgendada, valida)
+    assert (mensagem.status, mensagem.worker_id) == (STATUS_PROCESSANDO, "ativo#1")
+    db.close()
+
+
+def cenario_resultado_de_lease_perdido_e_descartado(sessoes):
+    [mensagem_id] = criar_mensagens(sessoes, 1)
+    lento = AgendamentoService(despachante=object(), limitador=sem_limite())
+    substituto = AgendamentoService(despachante=object(), limitador=sem_limite())
+
+    db = sessoes()
+    [do_lento] = lento._reivindicar_lote(db)
+    # O lease do primeiro worker expira antes de ele gravar o resultado
+    db.query(MensagemAgendada).update({"lease_expira_em": datetime.utcnow() - timedelta(seconds=1)})
+    db.commit()
+    [do_substituto] = substituto._reivindicar_lote(db)
+
+    lento._gravar_resultados(db, [lento._resultado(do_lento, False, "tarde demais", "timeout")])
+    mensagem = db.get(MensagemAgendada, mensagem_id)
+    assert (mensagem.status, mensagem.worker_id, mensagem.tentativas) == \
+        (STATUS_PROCESSANDO, do_substituto.worker_id, 0)
+    db.expire_all()
+
+    substituto._gravar_resultados(db, [substituto._resultado(do_substituto, True)])
+    # Nem depois que o substituto termina o resultado atrasado sobrescreve o dele
+    lento._gravar_resultados(db, [lento._resultado(do_lento, False, "tarde demais", "timeout")])
+    mensagem = db.get(MensagemAgendada, mensagem_id)
+    assert (mensagem.status, mensagem.erro_mensagem, mensagem.tentativas) == (STATUS_ENVIADO, None, 1)
+    db.close()
+
+
+def test_workers_concorrentes_nunca_enviam_a_mesma_mensagem(sessoes, servico_falso, monkeypatch):
+    cenario_workers_concorrentes(sessoes, servico_falso, monkeypatch)
+
+
+def test_lease_expirado_volta_a_fila(sessoes):
+    cenario_lease_expirado_volta_a_fila(sessoes)
+
+
+def test_resultado_de_lease_perdido_e_descartado(sessoes):
+    cenario_resultado_de_lease_perdido_e_descartado(sessoes)
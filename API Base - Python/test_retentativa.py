@@ -0,0 +1,167 @@
+"""
+Testes das retentativas: classificação dos erros e backoff
+(service/retentativa.py), o ciclo AGENDADO -> RETENTATIVA -> ENVIADO/ESGOTADO
+no despachante (service/agendamento_service.py) e a listagem paginada dos
+agendamentos ativos (/agendamentos/ativos/listar).
+
+Usa um banco SQLite temporário e o MensagemService falso do conftest.py
+(nenhum envio real).
+
+Uso:
+    python -m pytest test_retentativa.py -q
+"""
+import smtplib
+import socket
+from datetime import datetime, timedelta
+
+import pytest
+import requests
+from sqlalchemy import update
+from twilio.base.exceptions import TwilioRestException
+
+from database import MensagemAgendada
+from routes import agendamentos
+from service.agendamento_service import (
+    AgendamentoService, STATUS_ENVIADO, STATUS_ERRO, STATUS_ESGOTADO, STATUS_RETENTATIVA,
+)
+from service.despachante import DespachanteConcorrente
+from service.retentativa import (
+    CLASSE_CONEXAO, CLASSE_DESCONHECIDA, CLASSE_LIMITE_PROVEDOR, CLASSE_PROVEDOR_INDISPONIVEL,
+    CLASSE_REQUISICAO_INVALIDA, CLASSE_SMTP_PERMANENTE, CLASSE_SMTP_TEMPORARIO, CLASSE_TIMEOUT,
+    calcular_espera, classificar_erro,
+)
+
+ROTEADORES = [agendamentos.router]
+
+
+def twilio(status: int) -> TwilioRestException:
+    return TwilioRestException(status, "https://api.twilio.com/Messages.json", msg="erro")
+
+
+@pytest.mark.parametrize("erro, classe", [
+    (smtplib.SMTPResponseException(451, b"tente mais tarde"), CLASSE_SMTP_TEMPORARIO),
+    (smtplib.SMTPResponseException(535, b"login recusado"), CLASSE_SMTP_PERMANENTE),
+    (smtplib.SMTPRecipientsRefused({"a@teste.com": (452, b"caixa cheia")}), CLASSE_SMTP_TEMPORARIO),
+    (smtplib.SMTPRecipientsRefused({
+        "a@teste.com": (452, b"caixa cheia"), "b@teste.com": (550, b"inexistente"),
+    }), CLASSE_SMTP_PERMANENTE),
+    (smtplib.SMTPServerDisconnected("conexão perdida"), CLASSE_CONEXAO),
+    (twilio(429), CLASSE_LIMITE_PROVEDOR),
+    (twilio(503), CLASSE_PROVEDOR_INDISPONIVEL),
+    (twilio(400), CLASSE_REQUISICAO_INVALIDA),
+    (ConnectionRefusedError(), CLASSE_CONEXAO),
+    (socket.timeout(), CLASSE_TIMEOUT),
+    (requests.ConnectTimeout(), CLASSE_TIMEOUT),
+    (ValueError("inesperado"), CLASSE_DESCONHECIDA),
+])
+def test_classificacao(erro, classe):
+    assert classificar_erro(erro) == classe
+
+
+def test_backoff_exponencial_com_jitter():
+    for tentativas, espera in [(1, 30), (2, 60), (3, 120), (8, 3600), (30, 3600)]:
+        amostras = [calcular_espera(tentativas, base=30, maxima=3600).total_seconds() for _ in range(200)]
+        assert all(espera / 2 <= amostra <= espera for amostra in amostras)
+        # Falhas simultâneas não voltam todas no mesmo instante
+        assert len(set(amostras)) > 150
+
+
+def rodada(servico: AgendamentoService, sessoes) -> int:
+    """Uma passada do despachante; retorna quantas mensagens foram enviadas."""
+    db = sessoes()
+    try:
+        lote = servico._reivindicar_lote(db)
+        servico._gravar_resultados(db, servico._despachar(lote))
+        return len(lote)
+    finally:
+        db.close()
+
+
+def antecipar_retentativas(sessoes):
+    """Simula a passagem do tempo até as retentativas vencerem."""
+    db = sessoes()
+    db.execute(
+        update(MensagemAgendada)
+        .where(MensagemAgendada.status == STATUS_RETENTATIVA)
+        .values(proximo_envio_em=datetime.utcnow() - timedelta(seconds=1))
+    )
+    db.commit()
+    db.close()
+
+
+def estado(sessoes) -> dict:
+    db = sessoes()
+    try:
+        return {
+            m.destinatario: (m.status, m.tentativas, m.classe_erro)
+            for m in db.query(MensagemAgendada)
+        }
+    finally:
+        db.close()
+
+
+def test_ciclo_de_retentativas(sessoes, servico_falso, agendar):
+    servico_falso.roteiros = {
+        "+5511900000001": [(False, CLASSE_SMTP_TEMPORARIO), (False, CLASSE_CONEXAO), (True, None)],
+        "+5511900000002": [(False, CLASSE_LIMITE_PROVEDOR)] * 3,
+        "+5511900000003": [(False, CLASSE_REQUISICAO_INVALIDA)],
+    }
+    agendar("whatsapp", list(servico_falso.roteiros))
+    despachante = DespachanteConcorrente({"whatsapp": 2}, fabrica_servico=servico_falso)
+    servico = AgendamentoService(despachante=despachante, max_tentativas=3)
+
+    try:
+        assert rodada(servico, sessoes) == 3
+        assert estado(sessoes) == {
+            "+5511900000001": (STATUS_RETENTATIVA, 1, CLASSE_SMTP_TEMPORARIO),
+            "+5511900000002": (STATUS_RETENTATIVA, 1, CLASSE_LIMITE_PROVEDOR),
+            "+5511900000003": (STATUS_ERRO, 1, CLASSE_REQUISICAO_INVALIDA),
+        }
+        # Retentativas ainda não vencidas não são reivindicadas: o despachante
+        # não volta a consultá-las até o proximo_envio_em, que ele usa para dormir
+        assert rodada(servico, sessoes) == 0
+        db = sessoes()
+        vencimentos = AgendamentoService.proximos_vencimentos(db, 10)
+        db.close()
+        assert len(vencimentos) == 2 and all(v > datetime.utcnow() for v in vencimentos)
+
+        antecipar_retentativas(sessoes)
+        assert rodada(servico, sessoes) == 2
+        antecipar_retentativas(sessoes)
+        assert rodada(servico, sessoes) == 2
+        assert rodada(servico, sessoes) == 0
+    finally:
+        despachante.encerrar()
+
+    assert estado(sessoes) == {
+        "+5511900000001": (STATUS_ENVIADO, 3, None),
+        "+5511900000002": (STATUS_ESGOTADO, 3, CLASSE_LIMITE_PROVEDOR),
+        "+5511900000003": (STATUS_ERRO, 1, CLASSE_REQUISICAO_INVALIDA),
+    }
+    db = sessoes()
+    assert all(m.proximo_envio_em is None for m in db.query(MensagemAgendada))
+    db.close()
+
+
+def test_listagem_de_ativos_por_cursor(cliente, sessoes, agendar):
+    agendar("email", [f"m{i}@teste.com" for i in range(7)])
+    db = sessoes()
+    for destinatario, status in [("m1@teste.com", STATUS_RETENTATIVA), ("m4@teste.com", STATUS_RETENTATIVA),
+                                 ("m2@teste.com", STATUS_ENVIADO), ("m5@teste.com", STATUS_ESGOTADO)]:
+        db.execute(
+            update(MensagemAgendada).where(MensagemAgendada.destinatario == destinatario).values(status=status)
+        )
+    db.commit()
+    db.close()
+
+    destinatarios, cursor = [], None
+    while True:
+        pagina = cliente.get("/api/agendamentos/ativos/listar", params={"limit": 2, "cursor": cursor}).json()
+        assert len(pagina["itens"]) <= 2
+        destinatarios += [item["destinatario"] for item in pagina["itens"]]
+        cursor = pagina["next_cursor"]
+        if not cursor:
+            break
+    # AGENDADO e RETENTATIVA, da data de agendamento mais antiga para a mais recente
+    assert destinatarios == ["m0@teste.com", "m1@teste.com", "m3@teste.com", "m4@teste.com", "m6@teste.com"]
+    assert cliente.get("/api/agendamentos/ativos/listar", params={"cursor": "x"}).status_code == 400